@@ -0,0 +1,49 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction as db_transaction
+from rest_framework import status
+
+from apps.ledgers.api.v1.serializers import CreateLedgerSerializer, DetailLedgerSerializer
+from apps.ledgers.api.v1.views import ledger_list_view
+from apps.ledgers.models import CallbackEvent, Ledger
+from apps.modules.instamoney import AsyncRNE
+from apps.utils.async_views import async_api_view, render
+
+rne = AsyncRNE()
+receive_callback = sync_to_async(db_transaction.atomic(CallbackEvent.receive))
+
+
+@async_api_view(['GET', 'POST'])
+async def ledgers(request):
+    if request.method == 'GET':
+        return await sync_to_async(ledger_list_view)(request)
+
+    serializer = CreateLedgerSerializer(data=request.data, context={'request': request})
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+    validated_data = serializer.validated_data
+
+    ledger = await Ledger.acreate(
+        user=serializer.get_user(),
+        name=validated_data['name'],
+        bank_code=validated_data['bank_code'],
+    )
+    response_serializer = DetailLedgerSerializer(ledger, context={'request': request})
+    return render(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+@async_api_view(['GET'], authenticated=False)
+async def banks(request):
+    return render(await rne.list_banks())
+
+
+@async_api_view(['POST'], authenticated=False)
+async def fixed_virtual_account_created_callback(request):
+    rne.verificate_callback(request)
+    await receive_callback(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_CREATED, request.data)
+    return render(None)
+
+
+@async_api_view(['POST'], authenticated=False)
+async def fixed_virtual_account_payment_callback(request):
+    rne.verificate_callback(request)
+    await receive_callback(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, request.data)
+    return render(None)
@@ -1,7 +1,11 @@
+from collections import Counter
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 
+from apps.ledgers.exports import CONTENT_TYPES, CSV
 from apps.ledgers.models import Ledger, Transaction
 from apps.modules.instamoney import RNE
 from apps.users.models import User as UserModel
@@ -33,6 +37,32 @@ class CreateLedgerSerializer(serializers.Serializer):
         return self._user
 
 
+class CreateBulkLedgerSerializer(serializers.Serializer):
+    ledgers = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=settings.LEDGER_BULK_CREATE_MAX_ITEMS,
+    )
+
+    def get_items(self):
+        # every item is validated on its own, so one bad row doesn't reject the whole import
+        items = []
+        errors = {}
+        for index, item in enumerate(self.validated_data['ledgers']):
+            serializer = CreateLedgerSerializer(data=item, context=self.context)
+            try:
+                is_valid = serializer.is_valid()
+            except APIException as error:
+                # unknown user is raised as not found
+                errors[index] = {'detail': error.detail}
+                continue
+            if is_valid:
+                items.append((index, serializer.get_user(), serializer.validated_data))
+            else:
+                errors[index] = serializer.errors
+        return items, errors
+
+
 class DetailLedgerSerializer(serializers.ModelSerializer):
     status = ChoiceDisplayFieldSerializer(Ledger.STATUS_CHOICES)
     
@@ -50,6 +80,23 @@ class DetailLedgerSerializer(serializers.ModelSerializer):
         )
 
 
+class ExportTransactionSerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=tuple(CONTENT_TYPES), default=CSV)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date')
+        end_date = attrs.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError({'end_date': messages.LEDGER_EXPORT_INVALID_DATE_RANGE})
+        return attrs
+
+
+class LedgerBalanceSerializer(serializers.Serializer):
+    at = serializers.DateTimeField(required=False)
+
+
 class ListLedgerSerializer(serializers.ModelSerializer):
     status = ChoiceDisplayFieldSerializer(Ledger.STATUS_CHOICES)
 
@@ -92,6 +139,53 @@ class ListTransactionSerializer(serializers.ModelSerializer):
         )
 
 
+class FastListTransactionSerializer(serializers.BaseSerializer):
+    """
+    Same output as ListTransactionSerializer, from `values(*FIELDS)` rows instead of model
+    instances. The type displays are built once and the bank is computed once per row.
+    """
+    FIELDS = (
+        'id',
+        'ledger_id',
+        'type',
+        'balance_before',
+        'amount',
+        'balance_after',
+        'bank_account_name',
+        'account_name',
+        'account_number',
+        'notes',
+        'created_at',
+    )
+    TYPES = {
+        value: {'value': value, 'display_name': display_name}
+        for value, display_name in Transaction.TYPE_CHOICES
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # looked up once for the page, the current timezone is a context local lookup per row otherwise
+        self.created_at = serializers.DateTimeField(
+            default_timezone=timezone.get_current_timezone() if settings.USE_TZ else None,
+        )
+
+    def to_representation(self, instance):
+        type = instance['type']
+        bank = Transaction.get_bank(instance['account_name'], instance['bank_account_name'], instance['account_number'])
+        return {
+            'id': instance['id'],
+            'ledger': instance['ledger_id'],
+            'type': self.TYPES.get(type) or {'value': type, 'display_name': type},
+            'balance_before': instance['balance_before'],
+            'amount': instance['amount'],
+            'balance_after': instance['balance_after'],
+            'origin': bank if type == Transaction.CREDIT else '-',
+            'destination': bank if type == Transaction.DEBIT else '-',
+            'notes': instance['notes'],
+            'created_at': self.created_at.to_representation(instance['created_at']),
+        }
+
+
 class DetailTransactionSerializer(serializers.ModelSerializer):
     type = ChoiceDisplayFieldSerializer(Transaction.TYPE_CHOICES)
 
@@ -121,6 +215,41 @@ class CreateTransactionSerializer(serializers.Serializer):
     notes = serializers.CharField(allow_null=True)
 
 
+class BulkTransactionItemSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(Transaction.TYPE_CHOICES)
+    amount = serializers.IntegerField(min_value=1)
+    bank_account_name = serializers.CharField(allow_null=True, required=False)
+    account_name = serializers.CharField(allow_null=True, required=False)
+    account_number = serializers.CharField(allow_null=True, required=False)
+    reference = serializers.CharField(allow_null=True, required=False, max_length=100)
+    notes = serializers.CharField(allow_null=True, required=False)
+
+
+class CreateBulkTransactionSerializer(serializers.Serializer):
+    transactions = BulkTransactionItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.LEDGER_BULK_TRANSACTION_MAX_ITEMS,
+    )
+
+    def validate_transactions(self, value):
+        # errors line up with the items, like the errors of the items themselves
+        references = [item.get('reference') for item in value]
+        counts = Counter(reference for reference in references if reference)
+        existing_references = Transaction.get_existing_references(list(counts))
+        errors = []
+        for reference in references:
+            if reference in existing_references:
+                errors.append({'reference': [messages.LEDGER_TRANSACTION_REFERENCE_EXISTS]})
+            elif reference and counts[reference] > 1:
+                errors.append({'reference': [messages.LEDGER_TRANSACTION_DUPLICATE_REFERENCE]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise ValidationError(errors)
+        return value
+
+
 class SendToSerializer(serializers.Serializer):
     ledger = serializers.IntegerField()
     amount = serializers.IntegerField()
@@ -134,3 +263,25 @@ class SendToSerializer(serializers.Serializer):
     
     def get_ledger(self):
         return self._ledger
+
+
+class PayoutItemSerializer(serializers.Serializer):
+    ledger = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
+
+
+class PayoutSerializer(serializers.Serializer):
+    payouts = PayoutItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.LEDGER_BULK_TRANSACTION_MAX_ITEMS,
+    )
+
+    _ledgers = None
+
+    def validate_payouts(self, value):
+        self._ledgers = Ledger.get_ledgers_by_ids([item['ledger'] for item in value], raise_exception=True)
+        return value
+
+    def get_payouts(self):
+        return [(self._ledgers[item['ledger']], item['amount']) for item in self.validated_data['payouts']]
@@ -1,13 +1,26 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from apps.ledgers.api.v1 import views
+from apps.ledgers.api.v1 import async_views, views
 
 app_name = 'apps.ledgers.api.v1'
-urlpatterns = []
+urlpatterns = [
+    path('', async_views.ledgers, name='ledger-list'),
+    path('banks/', async_views.banks, name='ledger-banks'),
+    path(
+        'callbacks/fixed-virtual-account-created/',
+        async_views.fixed_virtual_account_created_callback,
+        name='callback-fixed-virtual-account-created',
+    ),
+    path(
+        'callbacks/fixed-virtual-account-payment/',
+        async_views.fixed_virtual_account_payment_callback,
+        name='callback-fixed-virtual-account-payment',
+    ),
+]
 
 router = DefaultRouter()
 router.register(r'(?P<ledger_id>\d+)/transactions', views.transaction_view, basename='transaction')
-router.register('callbacks', views.callback_view, basename='callback')
 router.register('', views.ledger_view, basename='ledger')
 
 urlpatterns += router.urls
@@ -1,24 +1,35 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from apps.ledgers.api.v1.serializers import (
-    CreateLedgerSerializer,
+    CreateBulkLedgerSerializer,
+    CreateBulkTransactionSerializer,
     CreateTransactionSerializer,
     DetailLedgerSerializer,
     DetailTransactionSerializer,
+    ExportTransactionSerializer,
+    FastListTransactionSerializer,
+    LedgerBalanceSerializer,
     ListLedgerSerializer,
     ListTransactionSerializer,
+    PayoutSerializer,
     SendToSerializer,
 )
+from apps.ledgers.exports import CONTENT_TYPES, export_transactions
 from apps.ledgers.models import Ledger, Transaction
-from apps.modules.instamoney import RNE
+from apps.utils.idempotency import idempotent
+from apps.utils.paginations import CursorPagination
 
 
 class LedgerViewSet(GenericViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = DetailLedgerSerializer
+    pagination_class = CursorPagination
 
     def get_queryset(self):
         query_params = self.request.query_params
@@ -26,35 +37,46 @@ class LedgerViewSet(GenericViewSet):
         bank_code = query_params.get('bank_code')
         return Ledger.get_ledgers(search_keyword, bank_code)
 
-    def create(self, request):
-        serializer = CreateLedgerSerializer(data=request.data, context=self.get_serializer_context())
-        serializer.is_valid(raise_exception=True)
-        validated_data = serializer.validated_data
-
-        ledger = Ledger.create(
-            user=serializer.get_user(),
-            name=validated_data['name'],
-            bank_code=validated_data['bank_code'],
-        )
-        response_serializer = self.serializer_class(ledger, context=self.get_serializer_context())
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-    
     def list(self, request):
         ledgers = self.paginate_queryset(self.get_queryset())
         serializer = ListLedgerSerializer(ledgers, many=True, context=self.get_serializer_context())
         return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk):
-        ledger = Ledger.get_ledger(pk, raise_exception=True)
+        ledger = Ledger.get_ledger(pk, raise_exception=True, cached=False)
         serializer = self.serializer_class(ledger, context=self.get_serializer_context())
         return Response(serializer.data)
     
-    @action(methods=['get'], detail=False, permission_classes=())
-    def banks(self, request):
-        banks = RNE().list_banks()
-        return Response(banks)
+    @action(methods=['get'], detail=True, serializer_class=LedgerBalanceSerializer)
+    def balance(self, request, pk):
+        serializer = self.serializer_class(data=request.query_params, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        at = serializer.validated_data.get('at') or timezone.now()
+
+        ledger = Ledger.get_ledger(pk, raise_exception=True)
+        return Response({'at': at, 'balance': ledger.get_balance_at(at)})
+
+    @action(methods=['post'], detail=False, url_path='bulk')
+    @idempotent('bulk-ledgers')
+    def bulk_create(self, request):
+        serializer = CreateBulkLedgerSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        items, errors = serializer.get_items()
+
+        ledgers = Ledger.create_many([
+            (user, validated_data['name'], validated_data['bank_code'])
+            for _, user, validated_data in items
+        ])
+        results = [None] * len(serializer.validated_data['ledgers'])
+        for index, item_errors in errors.items():
+            results[index] = {'index': index, 'status': 'invalid', 'errors': item_errors}
+        for (index, _, _), ledger in zip(items, ledgers):
+            results[index] = {'index': index, 'id': ledger.id, 'status': 'pending'}
+
+        return Response(results, status=status.HTTP_201_CREATED)
 
     @action(methods=['post'], detail=True, serializer_class=SendToSerializer, url_path='send-to')
+    @idempotent('send-to')
     def send_to(self, request, pk):
         serializer = self.serializer_class(data=request.data, context=self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
@@ -65,9 +87,21 @@ class LedgerViewSet(GenericViewSet):
 
         return Response(None)
 
+    @action(methods=['post'], detail=True, serializer_class=PayoutSerializer)
+    @idempotent('payouts')
+    def payouts(self, request, pk):
+        serializer = self.serializer_class(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+
+        ledger = Ledger.get_ledger(pk, raise_exception=True)
+        ledger.send_to_many(serializer.get_payouts())
+
+        return Response(None)
+
 class TransactionViewSet(GenericViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = ListTransactionSerializer
+    pagination_class = CursorPagination
 
     def get_queryset(self):
         query_params = self.request.query_params
@@ -77,6 +111,7 @@ class TransactionViewSet(GenericViewSet):
         ledger = Ledger.get_ledger(self.kwargs['ledger_id'], raise_exception=True)
         return ledger.get_transactions(search_keyword, type)
     
+    @idempotent('transactions')
     def create(self, request, ledger_id):
         serializer = CreateTransactionSerializer(data=request.data, context=self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
@@ -102,45 +137,50 @@ class TransactionViewSet(GenericViewSet):
         
         return Response(None, status=status.HTTP_201_CREATED)
 
+    @action(methods=['post'], detail=False, url_path='bulk')
+    @idempotent('bulk-transactions')
+    def bulk_create(self, request, ledger_id):
+        serializer = CreateBulkTransactionSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+        ledger = Ledger.get_ledger(ledger_id, raise_exception=True)
+        ledger.create_transactions(validated_data['transactions'])
+
+        return Response(None, status=status.HTTP_201_CREATED)
+
     def list(self, request, ledger_id):
-        transactions = self.paginate_queryset(self.get_queryset())
-        serializer = self.serializer_class(transactions, many=True, context=self.get_serializer_context())
+        transactions = self.paginate_queryset(self.get_queryset().values(*FastListTransactionSerializer.FIELDS))
+        serializer = FastListTransactionSerializer(transactions, many=True, context=self.get_serializer_context())
         return self.get_paginated_response(serializer.data)
     
+    @action(methods=['get'], detail=False, serializer_class=ExportTransactionSerializer)
+    def export(self, request, ledger_id):
+        serializer = self.serializer_class(data=request.query_params, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+        ledger = Ledger.get_ledger(ledger_id, raise_exception=True)
+        transactions = Transaction.get_statement(
+            ledger=ledger,
+            start_date=validated_data.get('start_date'),
+            end_date=validated_data.get('end_date'),
+        )
+        file_format = validated_data['file_format']
+        response = StreamingHttpResponse(
+            export_transactions(transactions, file_format, is_async=isinstance(request._request, ASGIRequest)),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="ledger-{ledger.id}-transactions.{file_format}"'
+        return response
+
     def retrieve(self, request, ledger_id, pk):
         transaction = Transaction.get_transaction(pk, raise_exception=True)
         serializer = DetailTransactionSerializer(transaction, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
-class CallbackViewSet(GenericViewSet):
-    permission_classes = ()
-    serializer_class = None
-    rne = RNE()
-
-    @action(methods=['post'], detail=False, url_path='fixed-virtual-account-created')
-    def fixed_virtual_account_created_callback(self, request):
-        self.rne.verificate_callback(request)
-        callback_data = request.data
-        ledger = Ledger.get_ledger_from_reference(callback_data.get('id'), raise_exception=True)
-        ledger.update_from_callback(callback_data)
-        return Response(None)
-    
-    @action(methods=['post'], detail=False, url_path='fixed-virtual-account-payment')
-    def fixed_virtual_account_payment_callback(self, request):
-        self.rne.verificate_callback(request)
-        callback_data = request.data
-        ledger = Ledger.get_ledger_from_reference(callback_data.get('callback_virtual_account_id'), raise_exception=True)
-        ledger.create_credit_transaction(
-            amount=callback_data.get('amount'),
-            bank_account_name=callback_data.get('bank_code'),
-            account_name=callback_data.get('sender_name'),
-            account_number=callback_data.get('account_number'),
-            reference=callback_data.get('payment_id'),
-        )
-        return Response(None)
-
-
 ledger_view = LedgerViewSet
 transaction_view = TransactionViewSet
-callback_view = CallbackViewSet
+# list of ledgers, served from the async view of the same path
+ledger_list_view = LedgerViewSet.as_view({'get': 'list'})
@@ -0,0 +1,510 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Union
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction as db_transaction
+from django.test import AsyncClient, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.ledgers.api.v1.serializers import FastListTransactionSerializer, ListTransactionSerializer
+from apps.ledgers.exports import CSV, NDJSON, export_transactions
+from apps.ledgers.models import Ledger, Transaction, VirtualAccountRequest
+from apps.ledgers.query_plans import check_hot_queries, get_hot_queries
+from apps.ledgers.sequences import transaction_id_allocator
+from apps.modules.instamoney import BankCatalogue, Instamoney, bank_catalogue
+from apps.modules.stub import StubServer
+from apps.users.authentication import CachedJWTAuthentication
+from apps.users.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, count: int, elapsed: float, errors: int = 0, notes: str = ''):
+        self.name = name
+        self.count = count
+        self.elapsed = elapsed
+        self.errors = errors
+        self.notes = notes
+
+    @property
+    def throughput(self):
+        if not self.elapsed:
+            return 0
+        return self.count / self.elapsed
+
+    def __str__(self):
+        result = f"{self.name}: {self.count} in {self.elapsed:.3f}s ({self.throughput:.1f}/s)"
+        if self.errors:
+            result += f", {self.errors} errors"
+        if self.notes:
+            result += f", {self.notes}"
+        return result
+
+
+def measure(name: str, count: int, func):
+    started_at = time.perf_counter()
+    for _ in range(count):
+        func()
+    return BenchmarkResult(name, count, time.perf_counter() - started_at)
+
+
+def measure_parallel(name: str, count: int, threads: int, func):
+    errors = []
+
+    def worker(worker_count):
+        try:
+            for _ in range(worker_count):
+                try:
+                    func()
+                except Exception as error:
+                    errors.append(error)
+        finally:
+            connection.close()
+
+    workers = [
+        threading.Thread(target=worker, args=(count // threads + (1 if index < count % threads else 0),))
+        for index in range(threads)
+    ]
+    started_at = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return BenchmarkResult(name, count - len(errors), time.perf_counter() - started_at, errors=len(errors))
+
+
+def create_benchmark_user():
+    email = f"benchmark-{uuid.uuid4().hex}@example.com"
+    return User.objects.create(email=email, username=email, first_name='Benchmark')
+
+
+def create_benchmark_ledger(user: Union[User, None] = None):
+    user = user or create_benchmark_user()
+    return Ledger.objects.create(
+        user=user,
+        name=user.name,
+        virtual_account=uuid.uuid4().hex,
+        balance=0,
+        reference=uuid.uuid4().hex,
+        bank_code='BENCHMARK',
+        status=Ledger.ACTIVE,
+    )
+
+
+def seed_transactions(ledger: Ledger, count: int, batch_size: int = 10000):
+    now = timezone.now()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    step = (now - month_start) / max(count, 1)
+    for start in range(0, count, batch_size):
+        numbers = range(start, min(start + batch_size, count))
+        transactions = []
+        for id, number in zip(transaction_id_allocator.allocate_many(len(numbers), now), numbers):
+            transaction = Transaction(
+                id=id,
+                ledger=ledger,
+                type=Transaction.CREDIT,
+                reference=uuid.uuid4().hex,
+                balance_before=number,
+                amount=1,
+                balance_after=number + 1,
+                notes=f"Seed {number}",
+                created_at=month_start + step * number,
+            )
+            transaction.set_search_text()
+            transactions.append(transaction)
+        Transaction.objects.bulk_create(transactions)
+
+
+def create_legacy_transaction(ledger: Ledger):
+    # Transaction.set_id before the sequence table: scan the month for the last id
+    now = timezone.now()
+    transaction = Transaction(ledger=ledger, type=Transaction.CREDIT, created_at=now)
+    last_transaction = Transaction.objects.filter(
+        created_at__year=now.year,
+        created_at__month=now.month,
+    ).order_by('-id').first()
+    last_number = 0
+    if last_transaction is not None:
+        last_number = last_transaction.get_transaction_number()
+    transaction.id = now.strftime("%Y%m%d") + f"{last_number + 1:07d}"
+    transaction.set_reference(None)
+    transaction.set_amount(1)
+    transaction.save()
+
+
+def create_read_modify_write_posting(ledger_id: int):
+    # Ledger.create_credit_transaction before the conditional update:
+    # balance read from the model, computed in python and saved back
+    with db_transaction.atomic():
+        ledger = Ledger.objects.get(id=ledger_id)
+        transaction = Transaction.create_credit_transaction(ledger=ledger, amount=1)
+        ledger.balance = transaction.balance_after
+        ledger.save()
+
+
+def create_posting(ledger_id: int):
+    with db_transaction.atomic():
+        ledger = Ledger.objects.get(id=ledger_id)
+        ledger.create_credit_transaction(amount=1)
+
+
+def check_balance(result: BenchmarkResult, ledger: Ledger):
+    ledger.refresh_from_db()
+    posted = ledger.transactions.count()
+    last_transaction = ledger.transactions.order_by('-balance_after').first()
+    last_balance = last_transaction.balance_after if last_transaction else 0
+    result.notes = f"{posted - ledger.balance} lost updates, {posted - last_balance} duplicated balances"
+    return result
+
+
+def delete_benchmark_ledger(ledger: Ledger, delete_user: bool = True):
+    ledger.transactions.all().delete()
+    ledger.ledger_histories.all().delete()
+    ledger.balance_snapshots.all().delete()
+    VirtualAccountRequest.objects.filter(ledger=ledger).delete()
+    ledger.delete()
+    if delete_user:
+        ledger.user.delete()
+
+
+def delete_benchmark_user(user: User):
+    for ledger in user.ledgers.all():
+        delete_benchmark_ledger(ledger, delete_user=False)
+    user.delete()
+
+
+def benchmark_postings(postings: int, threads: int, **kwargs):
+    """
+    Throughput of concurrent credit postings to a single ledger, read-modify-write
+    against the conditional update, and how many postings each one loses.
+    Benchmark ledgers are deleted afterwards.
+    """
+    results = []
+    for name, posting in (
+        ('read-modify-write', create_read_modify_write_posting),
+        ('conditional update', create_posting),
+    ):
+        ledger = create_benchmark_ledger()
+        result = measure_parallel(name, postings, threads, lambda: posting(ledger.id))
+        results.append(check_balance(result, ledger))
+        delete_benchmark_ledger(ledger)
+    return results
+
+
+def benchmark_transaction_ids(existing: int, postings: int, **kwargs):
+    """
+    Posting throughput of the legacy month scan against the sequence allocator,
+    with `existing` transactions already in the current month.
+    Everything written by the benchmark is rolled back.
+    """
+    results = []
+    with db_transaction.atomic():
+        ledger = create_benchmark_ledger()
+        seed_transactions(ledger, existing)
+
+        # the month scan continues after the allocator's ids, the other way round the
+        # allocator would hand out numbers the scan has already taken
+        sequence_result = measure(
+            'sequence allocator',
+            postings,
+            lambda: Transaction.create_credit_transaction(ledger=ledger, amount=1),
+        )
+        results.append(measure(
+            'month scan',
+            postings,
+            lambda: create_legacy_transaction(ledger),
+        ))
+        results.append(sequence_result)
+        db_transaction.set_rollback(True)
+    return results
+
+
+def benchmark_query_plans(existing: int, **kwargs):
+    """
+    Time every hot query against a ledger with `existing` transactions and print its plan.
+    Everything written by the benchmark is rolled back.
+    """
+    results = []
+    with db_transaction.atomic():
+        ledger = create_benchmark_ledger()
+        seed_transactions(ledger, existing)
+        for name, (plan, problems) in check_hot_queries(ledger).items():
+            queryset = get_hot_queries(ledger)[name]
+            result = measure(name, 100, lambda: list(queryset.all()))
+            result.notes = ' | '.join(line.strip() for line in plan.splitlines())
+            if problems:
+                result.errors = len(problems)
+            results.append(result)
+        db_transaction.set_rollback(True)
+    return results
+
+
+def measure_rows(name: str, func):
+    # `func` returns how many rows it produced, peak python memory goes to the notes
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return BenchmarkResult(name, count, elapsed, notes=f"peak memory {peak / 1024 / 1024:.1f} MiB")
+
+
+def read_pages(ledger: Ledger, page_size: int = 20):
+    # what a client paging TransactionViewSet.list does, without the http round trips
+    count = 0
+    transactions = Transaction.get_transactions(ledger).values(*FastListTransactionSerializer.FIELDS)
+    page = list(transactions[:page_size])
+    while page:
+        count += len(FastListTransactionSerializer(page, many=True).data)
+        page = list(transactions.filter(id__lt=page[-1]['id'])[:page_size])
+    return count
+
+
+def read_export(ledger: Ledger, format: str):
+    count = 0
+    for _ in export_transactions(Transaction.get_statement(ledger), format):
+        count += 1
+    return count
+
+
+def benchmark_export(existing: int, **kwargs):
+    """
+    Rows per second of a full history read page by page through the list serializer
+    against the streaming CSV and NDJSON exports, with `existing` transactions.
+    Everything written by the benchmark is rolled back.
+    """
+    with db_transaction.atomic():
+        ledger = create_benchmark_ledger()
+        seed_transactions(ledger, existing)
+        results = [
+            measure_rows('paged list', lambda: read_pages(ledger)),
+            # the csv header counts as a row
+            measure_rows('csv export', lambda: read_export(ledger, CSV) - 1),
+            measure_rows('ndjson export', lambda: read_export(ledger, NDJSON)),
+        ]
+        db_transaction.set_rollback(True)
+    return results
+
+
+def render_model_page(transactions):
+    return JSONRenderer().render(ListTransactionSerializer(list(transactions.all()), many=True).data)
+
+
+def render_values_page(transactions):
+    transactions = transactions.values(*FastListTransactionSerializer.FIELDS)
+    return JSONRenderer().render(FastListTransactionSerializer(list(transactions), many=True).data)
+
+
+def benchmark_list_serializers(postings: int, **kwargs):
+    """
+    Pages of 100 transactions read and rendered to JSON `postings` times, through model
+    instances and ListTransactionSerializer against `values()` rows and
+    FastListTransactionSerializer, then the serializers alone on rows already read.
+    Pages rendered differently are counted as errors.
+    Everything written by the benchmark is rolled back.
+    """
+    with db_transaction.atomic():
+        ledger = create_benchmark_ledger()
+        ledger.create_transactions([
+            {
+                'type': Transaction.CREDIT if number % 3 else Transaction.DEBIT,
+                'amount': 1 if number % 3 else 0,
+                'bank_account_name': 'BENCHMARK' if number % 2 else None,
+                'account_name': f'Account {number}',
+                'account_number': str(number),
+                'notes': f'Seed {number}' if number % 5 else None,
+            }
+            for number in range(100)
+        ])
+        transactions = Transaction.get_transactions(ledger)[:100]
+        models = list(transactions)
+        rows = list(transactions.values(*FastListTransactionSerializer.FIELDS))
+        results = [
+            measure('model serializer, page', postings, lambda: render_model_page(transactions)),
+            measure('values serializer, page', postings, lambda: render_values_page(transactions)),
+            measure('model serializer, rows only', postings, lambda: ListTransactionSerializer(models, many=True).data),
+            measure('values serializer, rows only', postings, lambda: FastListTransactionSerializer(rows, many=True).data),
+        ]
+        results[1].errors = int(render_model_page(transactions) != render_values_page(transactions))
+        for result in results:
+            result.notes = f"{result.count * 100 / result.elapsed:.0f} rows/s"
+        db_transaction.set_rollback(True)
+    return results
+
+
+def measure_queries(name: str, count: int, func):
+    with CaptureQueriesContext(connection) as queries:
+        result = measure(name, count, func)
+    result.notes = f"{len(queries) / count:.1f} queries each"
+    return result
+
+
+def benchmark_ledger_reads(postings: int, **kwargs):
+    """
+    Database queries per read of the hot ledger lookups: the ledger detail and transaction
+    list endpoints, and the reference lookup of payment callbacks. Every read is done with
+    the ledger cache emptied first and then against a warm cache.
+    Benchmark ledgers are deleted afterwards.
+    """
+    ledger = create_benchmark_ledger()
+    seed_transactions(ledger, 20)
+    client = Client(headers={'Authorization': f'Bearer {AccessToken.for_user(ledger.user)}'})
+    reads = {
+        'ledger detail': lambda: client.get(f'/api/v1/ledgers/{ledger.id}/'),
+        'transaction list': lambda: client.get(f'/api/v1/ledgers/{ledger.id}/transactions/'),
+        'reference lookup': lambda: Ledger.get_ledger_from_reference(ledger.reference),
+    }
+    results = []
+    try:
+        for name, read in reads.items():
+            def cold_read():
+                ledger.invalidate_cache()
+                read()
+            results.append(measure_queries(f'{name}, cold', postings, cold_read))
+            read()
+            results.append(measure_queries(f'{name}, cached', postings, read))
+    finally:
+        delete_benchmark_ledger(ledger)
+    return results
+
+
+def benchmark_authentication(postings: int, **kwargs):
+    """
+    Requests authenticated per second with the same access token, verifying the token and
+    loading the user every time against CachedJWTAuthentication, which verifies a token once
+    and checks the user and the token with one query.
+    The benchmark user is deleted afterwards.
+    """
+    user = create_benchmark_user()
+    request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    results = []
+    try:
+        for name, authentication in (
+            ('jwt authentication', JWTAuthentication()),
+            ('cached jwt authentication', CachedJWTAuthentication()),
+        ):
+            authentication.authenticate(request)
+            results.append(measure_queries(name, postings, lambda: authentication.authenticate(request)))
+    finally:
+        user.delete()
+    return results
+
+
+UPSTREAM_DELAY = 0.2
+
+
+def respond_as_slow_instamoney(method: str, path: str):
+    if method == 'GET':
+        return 200, [{'code': 'BENCHMARK', 'name': 'Benchmark'}], 0
+    return 200, {'account_number': uuid.uuid4().hex, 'id': uuid.uuid4().hex}, UPSTREAM_DELAY
+
+
+def post_ledger(client, user: User):
+    return client.post(
+        '/api/v1/ledgers/',
+        {'user': user.id, 'name': user.name, 'bank_code': 'BENCHMARK'},
+        content_type='application/json',
+        headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'},
+    )
+
+
+def measure_wsgi(postings: int, threads: int, user: User):
+    def create_ledger():
+        response = post_ledger(Client(), user)
+        if response.status_code != 201:
+            raise Exception(response.content)
+    return measure_parallel(f'wsgi, {threads} workers', postings, threads, create_ledger)
+
+
+def measure_asgi(postings: int, user: User):
+    async def create_ledgers():
+        client = AsyncClient()
+        return await asyncio.gather(*(post_ledger(client, user) for _ in range(postings)), return_exceptions=True)
+
+    started_at = time.perf_counter()
+    responses = asyncio.run(create_ledgers())
+    elapsed = time.perf_counter() - started_at
+    errors = sum(1 for response in responses if getattr(response, 'status_code', None) != 201)
+    return BenchmarkResult('asgi, 1 event loop', postings - errors, elapsed, errors=errors)
+
+
+def benchmark_servers(postings: int, threads: int, **kwargs):
+    """
+    Ledger creation through the WSGI application with `threads` workers against the ASGI
+    application with every request in flight. Instamoney is a local stub server; since
+    virtual accounts are provisioned by workers, requests only wait on it for the bank list.
+    Ledgers created by the benchmark are deleted afterwards.
+    """
+    server = StubServer(respond_as_slow_instamoney).start()
+    base_url = Instamoney.BASE_URL
+    Instamoney.BASE_URL = server.url
+    cache.delete(BankCatalogue.CACHE_KEY)
+    bank_catalogue.reset()
+    user = create_benchmark_user()
+    try:
+        results = [measure_wsgi(postings, threads, user), measure_asgi(postings, user)]
+    finally:
+        Instamoney.BASE_URL = base_url
+        cache.delete(BankCatalogue.CACHE_KEY)
+        bank_catalogue.reset()
+        server.stop()
+        delete_benchmark_user(user)
+    return results
+
+
+def provision_all(concurrency: Union[int, None]):
+    count = 0
+    while True:
+        requests = VirtualAccountRequest.provision_pending(batch_size=1000, concurrency=concurrency)
+        if not requests:
+            return count
+        count += len(requests)
+
+
+def benchmark_provisioning(postings: int, **kwargs):
+    """
+    Virtual accounts provisioned per second for `postings` pending ledgers, one Instamoney
+    call at a time against VIRTUAL_ACCOUNT_CONCURRENCY calls in flight, while Instamoney
+    takes UPSTREAM_DELAY seconds to answer. Instamoney is a local stub server.
+    Ledgers created by the benchmark are deleted afterwards.
+    """
+    server = StubServer(respond_as_slow_instamoney).start()
+    base_url = Instamoney.BASE_URL
+    Instamoney.BASE_URL = server.url
+    user = create_benchmark_user()
+    results = []
+    try:
+        for name, concurrency in (
+            ('one at a time', 1),
+            (f'{settings.VIRTUAL_ACCOUNT_CONCURRENCY} in flight', None),
+        ):
+            Ledger.create_many([(user, user.name, 'BENCHMARK') for _ in range(postings)])
+            started_at = time.perf_counter()
+            count = provision_all(concurrency)
+            results.append(BenchmarkResult(name, count, time.perf_counter() - started_at))
+    finally:
+        Instamoney.BASE_URL = base_url
+        server.stop()
+        delete_benchmark_user(user)
+    return results
+
+
+BENCHMARKS = {
+    'authentication': benchmark_authentication,
+    'export': benchmark_export,
+    'ledger_reads': benchmark_ledger_reads,
+    'list_serializers': benchmark_list_serializers,
+    'postings': benchmark_postings,
+    'provisioning': benchmark_provisioning,
+    'query_plans': benchmark_query_plans,
+    'servers': benchmark_servers,
+    'transaction_ids': benchmark_transaction_ids,
+}
@@ -0,0 +1,297 @@
+import random
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.ledgers.benchmarks import create_benchmark_ledger, create_benchmark_user, delete_benchmark_user
+from apps.ledgers.models import CallbackEvent, Ledger, Transaction
+from apps.modules.instamoney import BankCatalogue, Instamoney, bank_catalogue
+from apps.modules.stub import StubServer
+
+# share of the requests of each operation
+DEFAULT_MIX = {
+    'credit': 30,
+    'debit': 20,
+    'send_to': 20,
+    'list': 15,
+    'search': 10,
+    'callback': 4,
+    'create_ledger': 1,
+}
+OPENING_BALANCE = 10 ** 9
+MAX_AMOUNT = 1000
+PERCENTILES = (50, 95, 99)
+
+
+def respond_as_instamoney(method: str, path: str):
+    if method == 'GET':
+        return 200, [{'code': 'BENCHMARK', 'name': 'Benchmark'}], 0
+    return 200, {'account_number': uuid.uuid4().hex, 'id': uuid.uuid4().hex}, 0
+
+
+def get_percentile(values: list, percentile: int):
+    # nearest rank of sorted `values`
+    if not values:
+        return 0
+    index = max(0, -(-len(values) * percentile // 100) - 1)
+    return values[index]
+
+
+class OperationStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, status: int, elapsed: float, ok: bool):
+        self.latencies.append(elapsed)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def get(self, elapsed: float):
+        latencies = sorted(self.latencies)
+        report = {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+            'statuses': self.statuses,
+        }
+        for percentile in PERCENTILES:
+            report[f'p{percentile}_ms'] = round(get_percentile(latencies, percentile) * 1000, 2)
+        return report
+
+
+class LoadTest:
+    """
+    Concurrent requests through the real views and middleware, in process, from `threads`
+    clients: postings, transfers, listings, searches, payment callbacks and ledger creation,
+    picked at random by `mix`. Instamoney is a local stub server and a worker posts the
+    callbacks while the requests run. Afterwards every ledger balance is compared with the
+    accepted requests and with its own transactions, so lost updates show up as mismatches.
+    Users and ledgers created by the run are deleted at the end.
+    """
+    def __init__(self, users: int, ledgers: int, requests: int, threads: int, mix: dict = None, seed: int = None):
+        if ledgers < 2:
+            raise ValueError("transfers need at least 2 ledgers")
+        unknown = set(mix or ()) - set(DEFAULT_MIX)
+        if unknown:
+            raise ValueError(f"unknown operations {', '.join(sorted(unknown))}")
+        self.users = users
+        self.ledgers = ledgers
+        self.requests = requests
+        self.threads = threads
+        self.mix = mix or DEFAULT_MIX
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {name: OperationStats(name) for name in self.mix}
+        self.expected_balances = {}
+        self.callbacks_received = 0
+        self.seeded_users = []
+        self.seeded_ledgers = []
+        self.tokens = {}
+
+    def seed(self):
+        for _ in range(self.users):
+            user = create_benchmark_user()
+            self.seeded_users.append(user)
+            self.tokens[user.id] = str(AccessToken.for_user(user))
+        for index in range(self.ledgers):
+            ledger = create_benchmark_ledger(self.seeded_users[index % self.users])
+            ledger.create_credit_transaction(amount=OPENING_BALANCE, notes='Opening balance')
+            self.seeded_ledgers.append(ledger)
+            self.expected_balances[ledger.id] = OPENING_BALANCE
+
+    def plan(self):
+        # decided up front so a seed replays the same requests
+        names = list(self.mix)
+        operations = self.random.choices(names, weights=[self.mix[name] for name in names], k=self.requests)
+        return [
+            (name, *self.random.sample(self.seeded_ledgers, 2), self.random.randint(1, MAX_AMOUNT))
+            for name in operations
+        ]
+
+    def get_client(self, ledger: Ledger):
+        return Client(
+            raise_request_exception=False,
+            headers={'Authorization': f'Bearer {self.tokens[ledger.user_id]}'},
+        )
+
+    def request(self, name: str, ledger: Ledger, other_ledger: Ledger, amount: int):
+        client = self.get_client(ledger)
+        url = f'/api/v1/ledgers/{ledger.id}'
+        headers = {'Idempotency-Key': uuid.uuid4().hex}
+        changes = {}
+
+        if name in ('credit', 'debit'):
+            type = Transaction.CREDIT if name == 'credit' else Transaction.DEBIT
+            response = client.post(f'{url}/transactions/', {
+                'type': type,
+                'amount': amount,
+                'bank_account_name': None,
+                'account_name': None,
+                'account_number': None,
+                'notes': f'Load test {name}',
+            }, content_type='application/json', headers=headers)
+            changes[ledger.id] = amount if name == 'credit' else -amount
+        elif name == 'send_to':
+            response = client.post(
+                f'{url}/send-to/',
+                {'ledger': other_ledger.id, 'amount': amount},
+                content_type='application/json',
+                headers=headers,
+            )
+            changes[ledger.id] = -amount
+            changes[other_ledger.id] = amount
+        elif name == 'list':
+            response = client.get(f'{url}/transactions/')
+        elif name == 'search':
+            response = client.get(f'{url}/transactions/', {'search': 'load'})
+        elif name == 'callback':
+            response = Client(raise_request_exception=False).post(
+                '/api/v1/ledgers/callbacks/fixed-virtual-account-payment/',
+                {
+                    'payment_id': uuid.uuid4().hex,
+                    'callback_virtual_account_id': ledger.reference,
+                    'amount': amount,
+                    'bank_code': ledger.bank_code,
+                    'sender_name': 'Load test',
+                    'account_number': ledger.virtual_account,
+                },
+                content_type='application/json',
+                headers={'x-callback-token': settings.INSTAMONEY_WEBHOOK_VERIFICATION_TOKEN},
+            )
+            changes[ledger.id] = amount
+        else:
+            response = client.post(
+                '/api/v1/ledgers/',
+                {'user': ledger.user_id, 'name': 'Load test', 'bank_code': 'BENCHMARK'},
+                content_type='application/json',
+            )
+
+        ok = 200 <= response.status_code < 300
+        if ok:
+            with self.lock:
+                for id, change in changes.items():
+                    self.expected_balances[id] += change
+                self.callbacks_received += int(name == 'callback')
+        return response.status_code, ok
+
+    def work(self, operations: list):
+        try:
+            while True:
+                with self.lock:
+                    if not operations:
+                        return
+                    operation = operations.pop()
+                started_at = time.perf_counter()
+                try:
+                    status, ok = self.request(*operation)
+                except Exception:
+                    status, ok = 'exception', False
+                elapsed = time.perf_counter() - started_at
+                with self.lock:
+                    self.stats[operation[0]].record(status, elapsed, ok)
+        finally:
+            connection.close()
+
+    def process_callbacks(self, stopped: threading.Event):
+        # like the process_callbacks command, until the requests are done and nothing is pending
+        try:
+            while True:
+                try:
+                    events = CallbackEvent.process_pending()
+                except Exception:
+                    events = None
+                if stopped.is_set() and not events:
+                    return
+                if not events:
+                    time.sleep(0.05)
+        finally:
+            connection.close()
+
+    def run(self):
+        operations = self.plan()
+        stopped = threading.Event()
+        callback_worker = threading.Thread(target=self.process_callbacks, args=(stopped,))
+        workers = [threading.Thread(target=self.work, args=(operations,)) for _ in range(self.threads)]
+
+        started_at = time.perf_counter()
+        callback_worker.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started_at
+        stopped.set()
+        callback_worker.join()
+        return elapsed
+
+    def check(self):
+        lost_updates = 0
+        unbalanced_ledgers = 0
+        for ledger in self.seeded_ledgers:
+            ledger.refresh_from_db()
+            transactions = Transaction.objects.filter(ledger=ledger)
+            credits = sum(transactions.filter(type=Transaction.CREDIT).values_list('amount', flat=True))
+            debits = sum(transactions.filter(type=Transaction.DEBIT).values_list('amount', flat=True))
+            lost_updates += int(ledger.balance != self.expected_balances[ledger.id])
+            unbalanced_ledgers += int(ledger.balance != credits - debits)
+
+        events = CallbackEvent.objects.filter(ledger_reference__in=[ledger.reference for ledger in self.seeded_ledgers])
+        return {
+            'lost_updates': lost_updates,
+            'unbalanced_ledgers': unbalanced_ledgers,
+            'callbacks_received': self.callbacks_received,
+            'callbacks_processed': events.filter(status=CallbackEvent.PROCESSED).count(),
+            'callbacks_unprocessed': events.exclude(status=CallbackEvent.PROCESSED).count(),
+        }
+
+    def cleanup(self):
+        CallbackEvent.objects.filter(
+            ledger_reference__in=[ledger.reference for ledger in self.seeded_ledgers],
+        ).delete()
+        for user in self.seeded_users:
+            delete_benchmark_user(user)
+
+    def execute(self):
+        server = StubServer(respond_as_instamoney).start()
+        base_url = Instamoney.BASE_URL
+        Instamoney.BASE_URL = server.url
+        cache.delete(BankCatalogue.CACHE_KEY)
+        bank_catalogue.reset()
+        try:
+            self.seed()
+            elapsed = self.run()
+            consistency = self.check()
+        finally:
+            Instamoney.BASE_URL = base_url
+            cache.delete(BankCatalogue.CACHE_KEY)
+            bank_catalogue.reset()
+            server.stop()
+            self.cleanup()
+
+        operations = {name: stats.get(elapsed) for name, stats in self.stats.items()}
+        latencies = sorted(latency for stats in self.stats.values() for latency in stats.latencies)
+        postings = sum(operations[name]['requests'] - operations[name]['errors'] for name in ('credit', 'debit') if name in operations)
+        report = {
+            'database': connection.vendor,
+            'users': self.users,
+            'ledgers': self.ledgers,
+            'threads': self.threads,
+            'elapsed': round(elapsed, 3),
+            'requests': len(latencies),
+            'errors': sum(stats.errors for stats in self.stats.values()),
+            'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+            'postings_per_second': round(postings / elapsed, 2) if elapsed else 0,
+            **{f'p{percentile}_ms': round(get_percentile(latencies, percentile) * 1000, 2) for percentile in PERCENTILES},
+            'operations': operations,
+            **consistency,
+        }
+        return report
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.ledgers.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run a ledger benchmark against the configured database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--existing', type=int, default=1000000, help="transactions to seed before measuring")
+        parser.add_argument('--postings', type=int, default=1000, help="postings to measure")
+        parser.add_argument('--threads', type=int, default=8, help="concurrent workers")
+
+    def handle(self, *args, **options):
+        benchmark = BENCHMARKS[options['name']]
+        results = benchmark(
+            existing=options['existing'],
+            postings=options['postings'],
+            threads=options['threads'],
+        )
+        for result in results:
+            self.stdout.write(str(result))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.ledgers.models import LedgerBalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = "Store the closing balance of every ledger for the days finished since the last run"
+
+    def handle(self, *args, **options):
+        created = LedgerBalanceSnapshot.build_all()
+        self.stdout.write(f"created {created} balance snapshots")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+from apps.ledgers.partitions import add_months, create_partitions, get_month, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Create the monthly transaction partitions up to some months ahead, run it at least monthly"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help="months ahead of the current one")
+
+    def handle(self, *args, **options):
+        if not is_partitioned(connection):
+            self.stdout.write(f"transactions are not partitioned on {connection.vendor}, nothing to do")
+            return
+
+        until = add_months(get_month(timezone.now().date()), options['months'])
+        with db_transaction.atomic():
+            created = create_partitions(connection, until)
+        self.stdout.write(f"created {len(created)} partitions{': ' + ', '.join(created) if created else ''}")
@@ -0,0 +1,69 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ledgers.load_tests import DEFAULT_MIX, PERCENTILES, LoadTest
+
+
+def parse_mix(value: str):
+    # "credit=30,debit=20,list=50"
+    try:
+        return {name.strip(): int(weight) for name, weight in (item.split('=') for item in value.split(','))}
+    except ValueError:
+        raise CommandError(f"invalid mix {value!r}, expected name=weight,...")
+
+
+class Command(BaseCommand):
+    help = "Drive concurrent requests through the wallet API and report throughput, latency and lost updates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="users to seed")
+        parser.add_argument('--ledgers', type=int, default=50, help="ledgers to seed, spread over the users")
+        parser.add_argument('--requests', type=int, default=2000, help="requests to send")
+        parser.add_argument('--threads', type=int, default=8, help="concurrent clients")
+        parser.add_argument(
+            '--mix',
+            type=parse_mix,
+            default=None,
+            help=f"weight of each operation, defaults to {','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items())}",
+        )
+        parser.add_argument('--seed', type=int, default=None, help="random seed, to replay the same requests")
+        parser.add_argument('--output', help="write the report as JSON to this file")
+        parser.add_argument('--compare', help="JSON report of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        try:
+            load_test = LoadTest(
+                users=options['users'],
+                ledgers=options['ledgers'],
+                requests=options['requests'],
+                threads=options['threads'],
+                mix=options['mix'],
+                seed=options['seed'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        report = load_test.execute()
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.write_comparison(json.load(file), report)
+
+    def write_comparison(self, before: dict, after: dict):
+        keys = ['throughput'] + [f'p{percentile}_ms' for percentile in PERCENTILES] + ['errors']
+        rows = [('all', before, after)] + [
+            (name, before['operations'][name], stats)
+            for name, stats in after['operations'].items()
+            if name in before.get('operations', {})
+        ]
+        for name, old, new in rows:
+            changes = []
+            for key in keys:
+                change = f"{key} {old[key]} -> {new[key]}"
+                if old[key]:
+                    change += f" ({(new[key] - old[key]) / old[key]:+.1%})"
+                changes.append(change)
+            self.stdout.write(f"{name}: {', '.join(changes)}")
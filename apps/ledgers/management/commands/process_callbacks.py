@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.ledgers.models import CallbackEvent
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Process callbacks stored in the callback inbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="concurrent workers")
+        parser.add_argument('--batch-size', type=int, default=100, help="events claimed per batch")
+        parser.add_argument('--interval', type=float, default=1, help="seconds to wait when the inbox is empty")
+        parser.add_argument('--once', action='store_true', help="stop when the inbox is empty")
+
+    def handle(self, *args, **options):
+        workers = [
+            threading.Thread(target=self.work, args=(options,), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def work(self, options):
+        try:
+            while True:
+                # like a request, a batch starts without a broken or expired connection
+                close_old_connections()
+                try:
+                    events = CallbackEvent.process_pending(options['batch_size'])
+                except Exception:
+                    # the claimed events are released by the rollback and picked up again
+                    logger.exception("processing callbacks failed")
+                    time.sleep(options['interval'])
+                    continue
+                if events:
+                    self.report(events)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            connection.close()
+
+    def report(self, events):
+        processed = [event for event in events if event.status == CallbackEvent.PROCESSED]
+        lags = [event.lag for event in processed]
+        message = f"processed {len(processed)} of {len(events)} callbacks"
+        if lags:
+            message += f", lag avg {sum(lags) / len(lags):.3f}s max {max(lags):.3f}s"
+        logger.info(message)
+        self.stdout.write(message)
@@ -0,0 +1,45 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.ledgers.models import VirtualAccountRequest
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Request the virtual accounts of pending ledgers from Instamoney"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="requests claimed per batch")
+        parser.add_argument('--concurrency', type=int, default=None, help="Instamoney calls in flight")
+        parser.add_argument('--interval', type=float, default=1, help="seconds to wait when nothing is pending")
+        parser.add_argument('--once', action='store_true', help="stop when nothing is pending")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                # like a request, a batch starts without a broken or expired connection
+                close_old_connections()
+                try:
+                    requests = VirtualAccountRequest.provision_pending(options['batch_size'], options['concurrency'])
+                except Exception:
+                    # claimed requests are picked up again once their claim expires
+                    logger.exception("provisioning virtual accounts failed")
+                    time.sleep(options['interval'])
+                    continue
+                if requests:
+                    self.report(requests)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            connection.close()
+
+    def report(self, requests):
+        provisioned = sum(1 for request in requests if request.status == VirtualAccountRequest.PROVISIONED)
+        message = f"provisioned {provisioned} of {len(requests)} virtual accounts"
+        logger.info(message)
+        self.stdout.write(message)
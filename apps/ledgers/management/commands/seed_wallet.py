@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ledgers.seeding import WalletSeeder
+
+
+class Command(BaseCommand):
+    help = "Generate users, ledgers and months of transactions with consistent balances"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="users to create")
+        parser.add_argument('--ledgers', type=int, default=2000, help="ledgers to create, spread over the users")
+        parser.add_argument('--transactions', type=int, default=100000, help="transactions to create")
+        parser.add_argument('--months', type=int, default=3, help="months of history, up to now")
+        parser.add_argument('--hot-ledgers', type=float, default=0.01, help="share of ledgers that are hot merchants")
+        parser.add_argument('--hot-share', type=float, default=0.5, help="share of transactions posted to hot ledgers")
+        parser.add_argument('--tail', type=float, default=1.2, help="Pareto shape of the other ledgers, lower is longer")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="rows generated and written at a time")
+        parser.add_argument('--copy', action='store_true', default=None, help="write transactions with COPY, the default on PostgreSQL")
+        parser.add_argument('--no-copy', action='store_false', dest='copy', help="write transactions with bulk_create")
+        parser.add_argument('--snapshots', action='store_true', help="build the daily balance snapshots afterwards")
+        parser.add_argument('--seed', type=int, default=None, help="random seed")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['ledgers'] < 1 or options['months'] < 1:
+            raise CommandError("users, ledgers and months must be at least 1")
+        if not 0 <= options['hot_share'] <= 1 or not 0 <= options['hot_ledgers'] <= 1:
+            raise CommandError("hot ledgers and hot share must be between 0 and 1")
+
+        seeder = WalletSeeder(
+            users=options['users'],
+            ledgers=options['ledgers'],
+            transactions=options['transactions'],
+            months=options['months'],
+            hot_ledgers=options['hot_ledgers'],
+            hot_share=options['hot_share'],
+            tail=options['tail'],
+            chunk_size=options['chunk_size'],
+            copy=options['copy'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        started_at = time.perf_counter()
+        created = seeder.execute(snapshots=options['snapshots'])
+        elapsed = time.perf_counter() - started_at
+        self.stdout.write(
+            f"created {created['users']} users, {created['ledgers']} ledgers and "
+            f"{created['transactions']} transactions in {elapsed:.1f}s "
+            f"({created['transactions'] / elapsed:.0f} transactions/s)"
+        )
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0006_alter_ledger_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('date', models.DateField(unique=True)),
+                ('last_number', models.IntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
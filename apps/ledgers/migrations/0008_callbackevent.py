@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0007_transactionsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallbackEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('type', models.CharField(max_length=1)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('ledger_reference', models.CharField(max_length=100, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(default='1', max_length=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(null=True)),
+                ('processed_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='callback_event_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:02
+
+from django.db import migrations, models
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Concat, Lower
+
+SEARCH_FIELDS = ('id', 'reference', 'bank_account_name', 'account_number', 'account_name', 'notes')
+
+POSTGRESQL_CREATE_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ledgers_transaction_search_text_trgm ON ledgers_transaction USING gin (search_text gin_trgm_ops)",
+]
+POSTGRESQL_DROP_INDEX = [
+    "DROP INDEX IF EXISTS ledgers_transaction_search_text_trgm",
+]
+
+# the trigram table keeps its own copy of search_text, keyed by transaction id
+SQLITE_CREATE_INDEX = [
+    "CREATE VIRTUAL TABLE ledgers_transaction_search USING fts5("
+    "transaction_id UNINDEXED, search_text, tokenize='trigram')",
+    "CREATE TRIGGER ledgers_transaction_search_insert AFTER INSERT ON ledgers_transaction BEGIN "
+    "INSERT INTO ledgers_transaction_search (transaction_id, search_text) VALUES (new.id, new.search_text); "
+    "END",
+    "CREATE TRIGGER ledgers_transaction_search_update AFTER UPDATE OF id, search_text ON ledgers_transaction BEGIN "
+    "DELETE FROM ledgers_transaction_search WHERE transaction_id = old.id; "
+    "INSERT INTO ledgers_transaction_search (transaction_id, search_text) VALUES (new.id, new.search_text); "
+    "END",
+    "CREATE TRIGGER ledgers_transaction_search_delete AFTER DELETE ON ledgers_transaction BEGIN "
+    "DELETE FROM ledgers_transaction_search WHERE transaction_id = old.id; "
+    "END",
+    "INSERT INTO ledgers_transaction_search (transaction_id, search_text) "
+    "SELECT id, search_text FROM ledgers_transaction",
+]
+SQLITE_DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS ledgers_transaction_search_insert",
+    "DROP TRIGGER IF EXISTS ledgers_transaction_search_update",
+    "DROP TRIGGER IF EXISTS ledgers_transaction_search_delete",
+    "DROP TABLE IF EXISTS ledgers_transaction_search",
+]
+
+
+def fill_search_text(apps, schema_editor):
+    # the same text as Transaction.get_search_text: non-empty fields joined by newlines.
+    # id is never empty, every other field brings its own separator
+    Transaction = apps.get_model('ledgers', 'Transaction')
+    values = [SEARCH_FIELDS[0]]
+    for field in SEARCH_FIELDS[1:]:
+        values.append(Case(
+            When(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}), then=Value('')),
+            default=Concat(Value('\n'), field),
+            output_field=models.TextField(),
+        ))
+    Transaction.objects.using(schema_editor.connection.alias).update(search_text=Lower(Concat(*values)))
+
+
+def has_sqlite_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    statements = []
+    if connection.vendor == 'postgresql':
+        statements = POSTGRESQL_CREATE_INDEX
+    elif connection.vendor == 'sqlite' and has_sqlite_fts5(connection):
+        statements = SQLITE_CREATE_INDEX
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    statements = []
+    if connection.vendor == 'postgresql':
+        statements = POSTGRESQL_DROP_INDEX
+    elif connection.vendor == 'sqlite':
+        statements = SQLITE_DROP_INDEX
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0008_callbackevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_text',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
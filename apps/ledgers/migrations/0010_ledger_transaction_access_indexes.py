@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0009_transaction_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['bank_code', 'id'], name='ledger_bank_code_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['ledger', 'id'], name='transaction_ledger_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['ledger', 'type', 'id'], name='transaction_ledger_type_id_idx'),
+        ),
+    ]
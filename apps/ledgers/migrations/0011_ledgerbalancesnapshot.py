@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0010_ledger_transaction_access_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('date', models.DateField()),
+                ('balance', models.IntegerField()),
+                ('last_transaction_id', models.CharField(max_length=15)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['ledger', 'created_at'], name='transaction_ledger_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='ledgerbalancesnapshot',
+            name='ledger',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='balance_snapshots', to='ledgers.ledger'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgerbalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('ledger', 'date'), name='ledger_balance_snapshot_unique'),
+        ),
+    ]
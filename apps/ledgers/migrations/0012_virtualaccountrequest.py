@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0011_ledgerbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledger',
+            name='external_id',
+            field=models.CharField(db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ledger',
+            name='reference',
+            field=models.CharField(max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='ledger',
+            name='virtual_account',
+            field=models.CharField(max_length=100, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='VirtualAccountRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('status', models.CharField(default='1', max_length=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(null=True)),
+                ('claimed_at', models.DateTimeField(null=True)),
+                ('provisioned_at', models.DateTimeField(null=True)),
+                ('ledger', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='virtual_account_request', to='ledgers.ledger')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='va_request_status_idx')],
+            },
+        ),
+    ]
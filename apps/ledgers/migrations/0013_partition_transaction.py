@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:40
+
+from django.db import migrations
+
+from apps.ledgers.partitions import partition_table, unpartition_table
+
+# partitions created up front, create_transaction_partitions keeps adding them
+MONTHS_AHEAD = 3
+
+
+def partition(apps, schema_editor):
+    # PostgreSQL only, other databases keep the plain table
+    if schema_editor.connection.vendor == 'postgresql':
+        partition_table(schema_editor.connection, MONTHS_AHEAD)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        unpartition_table(schema_editor.connection)
+
+
+# Transaction stays declared with a unique reference. on PostgreSQL the uniqueness is
+# enforced by the ledgers_transaction_reference table instead of a constraint, so a
+# later AlterField of reference has to go through partitions.unpartition_table first.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0012_virtualaccountrequest'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
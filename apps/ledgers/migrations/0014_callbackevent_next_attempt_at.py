@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0013_partition_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callbackevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -1,30 +1,54 @@
+import asyncio
+import hashlib
+import json
 import random
 import string
 import uuid
-from datetime import datetime
-from django.db import models
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction as db_transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Q, Subquery
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from rest_framework.exceptions import NotFound
-from typing import Union
+from rest_framework.exceptions import NotFound, ValidationError
+from typing import Dict, List, Tuple, Union
 
-from apps.modules.instamoney import RNE
+from apps.ledgers.search import search_transactions
+from apps.ledgers.sequences import transaction_id_allocator
+from apps.modules.instamoney import RNE, AsyncInstamoney, AsyncRNE, InstamoneyError
 from apps.users.models import User as UserModel
 from apps.utils import messages
+from apps.utils.caching import memoize
+from apps.utils.metrics import registry
 from apps.utils.models import BaseModel
 
 User: get_user_model() = UserModel
 
+postings = registry.counter('ledger_postings_total', 'Single postings by type and result', ('type', 'result'))
+posting_seconds = registry.histogram('ledger_posting_seconds', 'Time to post a single transaction', ('type',))
+transfers = registry.counter('ledger_transfers_total', 'Transfers by result', ('result',))
+transfer_seconds = registry.histogram('ledger_transfer_seconds', 'Time to post a transfer to one or many ledgers')
+callbacks_processed = registry.counter('callback_events_processed_total', 'Processed callback events by type and status', ('type', 'status'))
+# from receiving a callback to posting it, a backlog shows in the upper buckets
+callback_lag_seconds = registry.histogram(
+    'callback_event_lag_seconds',
+    'Time from receiving a callback event to processing it',
+    ('type',),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+
 
 class Ledger(BaseModel):
     user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='ledgers')
     name = models.CharField(max_length=100)
-    virtual_account = models.CharField(max_length=100, unique=True)
+    # both set once the virtual account is provisioned, see VirtualAccountRequest
+    virtual_account = models.CharField(max_length=100, unique=True, null=True)
     balance = models.IntegerField()
-    reference = models.CharField(max_length=100, unique=True)
+    reference = models.CharField(max_length=100, unique=True, null=True)
     bank_code = models.CharField(max_length=20)
-    external_id = models.CharField(max_length=100, null=True)
+    external_id = models.CharField(max_length=100, null=True, db_index=True)
 
     ACTIVE = '1'
     INACTIVE = '2'
@@ -36,30 +60,52 @@ class Ledger(BaseModel):
     )
     status = models.CharField(max_length=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['bank_code', 'id'], name='ledger_bank_code_id_idx'),
+        ]
+
     @classmethod
     def create(cls, user: User, name: str, bank_code: str):
-        rne = RNE()
-        external_id = str(uuid.uuid4())
-        virtual_account = rne.create_virtual_account(
-            name=name,
-            bank_code=bank_code,
-            external_id=external_id,
-        )
+        return cls.create_many([(user, name, bank_code)])[0]
+
+    @classmethod
+    async def acreate(cls, user: User, name: str, bank_code: str):
+        return await sync_to_async(db_transaction.atomic(cls.create))(user, name, bank_code)
 
-        ledger = cls(
-            user=user,
-            name=name,
-            virtual_account=virtual_account.get("account_number"),
-            balance=0,
-            reference=virtual_account.get("id"),
-            status=Ledger.PENDING,
-            bank_code=bank_code,
-            external_id=external_id,
+    @classmethod
+    def create_many(cls, items: List[Tuple[User, str, str]]):
+        # ledgers are stored pending, their virtual accounts are requested by the
+        # provision_virtual_accounts workers instead of within the request
+        ledgers = cls.objects.bulk_create(
+            [
+                cls(
+                    user=user,
+                    name=name,
+                    balance=0,
+                    status=Ledger.PENDING,
+                    bank_code=bank_code,
+                    external_id=str(uuid.uuid4()),
+                )
+                for user, name, bank_code in items
+            ],
+            batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
         )
-        ledger.save()
-        ledger.set_status(Ledger.PENDING, "Initial Ledger")
-        return ledger
-    
+        LedgerStatusHistory.objects.bulk_create(
+            [LedgerStatusHistory(ledger=ledger, status=Ledger.PENDING, notes="Initial Ledger") for ledger in ledgers],
+            batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
+        )
+        VirtualAccountRequest.objects.bulk_create(
+            [VirtualAccountRequest(ledger=ledger) for ledger in ledgers],
+            batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
+        )
+        for ledger in ledgers:
+            ledger.invalidate_cache()
+        return ledgers
+
+    def set_virtual_account(self, virtual_account: dict):
+        self.update(virtual_account=virtual_account.get("account_number"), reference=virtual_account.get("id"))
+
     @classmethod
     def get_ledgers(cls, search_keyword='', bank_code=''):
         ledgers = cls.objects.all()
@@ -74,12 +120,54 @@ class Ledger(BaseModel):
         return ledgers.order_by('-id')
 
     @classmethod
-    def get_ledger(cls, id, raise_exception: bool = False):
-        ledger = cls.objects.filter(id=id).first()
+    def get_ledger(cls, id, raise_exception: bool = False, cached: bool = True):
+        # a cached copy is only invalidated in this process, other processes keep theirs until it
+        # times out. fine to find a ledger and post to it, balances are changed in the database,
+        # but whatever shows its balance or status reads the row with `cached=False`
+        ledger = cls.get_cached_ledger(id) if cached else cls.objects.filter(id=id).first()
         if not ledger and raise_exception:
             raise NotFound(messages.LEDGER_NOT_FOUND)
         return ledger
+
+    @staticmethod
+    @memoize('ledgers', timeout=60, key=str)
+    def get_cached_ledger(id):
+        return Ledger.objects.filter(id=id).first()
+
+    @staticmethod
+    @memoize('ledger-references', timeout=60, key=str)
+    def get_cached_ledger_id(reference):
+        return Ledger.objects.filter(reference=reference).values_list('id', flat=True).first()
+
+    def is_stale(self):
+        # every write sets updated_at, so it stamps the version a cached copy was read at
+        return not Ledger.objects.filter(id=self.id, updated_at=self.updated_at).exists()
     
+    @classmethod
+    def get_ledgers_by_ids(cls, ids: List[int], raise_exception: bool = False):
+        ledgers = cls.objects.in_bulk(ids)
+        if len(ledgers) != len(set(ids)) and raise_exception:
+            raise NotFound(messages.LEDGER_NOT_FOUND)
+        return ledgers
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        id = self.id
+        result = super().delete(*args, **kwargs)
+        Ledger.get_cached_ledger.invalidate(id)
+        if self.reference:
+            Ledger.get_cached_ledger_id.invalidate(self.reference)
+        return result
+
+    def invalidate_cache(self):
+        Ledger.get_cached_ledger.invalidate(self.id)
+        if self.reference:
+            # a lookup before the reference was set may have cached it as unknown
+            Ledger.get_cached_ledger_id.invalidate(self.reference)
+
     def create_debit_transaction(
         self,
         amount: str,
@@ -89,29 +177,40 @@ class Ledger(BaseModel):
         reference: Union[str, None] = None,
         notes: Union[str, None] = None,
     ):
-        if not self.is_balance_sufficient(amount):
+        transaction = None
+        with posting_seconds.time(type='debit'), db_transaction.atomic(savepoint=False):
+            balance_after = self.change_balance(-amount)
+            if balance_after is not None:
+                transaction = Transaction.create_debit_transaction(
+                    ledger=self,
+                    amount=amount,
+                    bank_account_name=bank_account_name,
+                    account_name=account_name,
+                    account_number=account_number,
+                    reference=reference,
+                    notes=notes,
+                    balance_before=balance_after + amount,
+                )
+        postings.inc(type='debit', result='posted' if transaction is not None else 'insufficient_balance')
+        if transaction is None:
             raise Exception(messages.LEDGER_INSUFFICIENT_BALANCE)
-        
-        transaction = Transaction.create_debit_transaction(
-            ledger=self,
-            amount=amount,
-            bank_account_name=bank_account_name,
-            account_name=account_name,
-            account_number=account_number,
-            reference=reference,
-            notes=notes,
-        )
-        self.balance = transaction.balance_after
-        self.save()
         return transaction
     
     @classmethod
     def get_ledger_from_reference(cls, value: str, raise_exception: bool = False):
-        ledger = Ledger.objects.filter(reference=value).first()
+        id = cls.get_cached_ledger_id(value) if value else None
+        ledger = cls.get_cached_ledger(id) if id is not None else None
         if not ledger and raise_exception:
             raise NotFound(messages.LEDGER_NOT_FOUND)
         return ledger
     
+    @classmethod
+    def get_ledger_from_external_id(cls, value: str, raise_exception: bool = False):
+        ledger = Ledger.objects.filter(external_id=value).first() if value else None
+        if not ledger and raise_exception:
+            raise NotFound(messages.LEDGER_NOT_FOUND)
+        return ledger
+
     def create_credit_transaction(
         self,
         amount: str,
@@ -121,54 +220,163 @@ class Ledger(BaseModel):
         reference: Union[str, None] = None,
         notes: Union[str, None] = None,
     ):  
-        transaction = Transaction.create_credit_transaction(
-            ledger=self,
-            amount=amount,
-            bank_account_name=bank_account_name,
-            account_name=account_name,
-            account_number=account_number,
-            reference=reference,
-            notes=notes,
-        )
-        self.balance = transaction.balance_after
-        self.save()
+        transaction = None
+        with posting_seconds.time(type='credit'), db_transaction.atomic(savepoint=False):
+            balance_after = self.change_balance(amount)
+            if balance_after is not None:
+                transaction = Transaction.create_credit_transaction(
+                    ledger=self,
+                    amount=amount,
+                    bank_account_name=bank_account_name,
+                    account_name=account_name,
+                    account_number=account_number,
+                    reference=reference,
+                    notes=notes,
+                    balance_before=balance_after - amount,
+                )
+        postings.inc(type='credit', result='posted' if transaction is not None else 'insufficient_balance')
+        if transaction is None:
+            raise Exception(messages.LEDGER_INSUFFICIENT_BALANCE)
         return transaction
     
+    def create_transactions(self, transactions: List[dict]):
+        # post many credit/debit items at once, all or nothing. the running balance of
+        # every item must stay positive, so the update requires the lowest point of it.
+        changes = list(accumulate(
+            item['amount'] if item['type'] == Transaction.CREDIT else -item['amount']
+            for item in transactions
+        ))
+        created_transactions = None
+        with db_transaction.atomic(savepoint=False):
+            balance_after = self.change_balance(changes[-1], lowest=min(changes))
+            if balance_after is not None:
+                created_transactions = Transaction.create_transactions(
+                    ledger=self,
+                    transactions=transactions,
+                    balance_before=balance_after - changes[-1],
+                )
+        if created_transactions is None:
+            raise Exception(messages.LEDGER_INSUFFICIENT_BALANCE)
+        return created_transactions
+
+    def change_balance(self, amount: int, lowest: Union[int, None] = None):
+        # add `amount` (negative for debit) to the stored balance in a single conditional
+        # update, so concurrent postings never lose updates or go below zero.
+        # `lowest` is the lowest change the balance must cover, defaults to `amount`.
+        # returns None without writing when the balance is insufficient.
+        if lowest is None:
+            lowest = amount
+        now = timezone.now()
+        connection = db_transaction.get_connection()
+        if connection.features.can_return_columns_from_insert:
+            table = connection.ops.quote_name(self._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET balance = balance + %s, updated_at = %s "
+                    f"WHERE id = %s AND balance + %s >= 0 RETURNING balance",
+                    [amount, connection.ops.adapt_datetimefield_value(now), self.id, lowest],
+                )
+                row = cursor.fetchone()
+            balance = row[0] if row is not None else None
+        else:
+            with db_transaction.atomic(savepoint=False):
+                balance = Ledger.objects.select_for_update().values_list('balance', flat=True).get(id=self.id)
+                if balance + lowest >= 0:
+                    balance += amount
+                    Ledger.objects.filter(id=self.id).update(balance=balance, updated_at=now)
+                else:
+                    balance = None
+
+        if balance is not None:
+            self.balance = balance
+            self.updated_at = now
+            self.invalidate_cache()
+        return balance
+
     def get_transactions(self, search_keyword: Union[str, None], type: Union[str, None]):
         return Transaction.get_transactions(ledger=self, type=type, search_keyword=search_keyword)
     
+    def get_balance_at(self, value: datetime):
+        # nearest closing balance before the day of `value`, then the last transaction after it
+        return LedgerBalanceSnapshot.get_balance_at(self, value)
+
     def is_balance_sufficient(self, amount: int):
         return self.balance >= amount
     
     def set_status(self, value: str, notes: Union[str, None] = None):
         self.status = value
-        self.save()
+        self.save(update_fields=['status', 'updated_at'])
         LedgerStatusHistory.create(self, value, notes)
     
     def send_to(self, other_ledger, amount):
-        if not self.is_balance_sufficient(amount):
+        return self.send_to_many([(other_ledger, amount)])
+
+    def send_to_many(self, payouts: List[Tuple['Ledger', int]]):
+        # debit this ledger once for the total and credit every destination. all ledgers
+        # are locked in id order, so opposite transfers wait for each other instead of deadlocking.
+        total = sum(amount for _, amount in payouts)
+        debit = {'notes': 'Payout'}
+        if len(payouts) == 1:
+            other_ledger = payouts[0][0]
+            debit = {
+                'bank_account_name': other_ledger.bank_code,
+                'account_name': other_ledger.name,
+                'account_number': other_ledger.virtual_account,
+                'notes': 'Send money',
+            }
+        transactions = [dict(debit, ledger=self, type=Transaction.DEBIT, amount=total)]
+        for other_ledger, amount in payouts:
+            transactions.append({
+                'ledger': other_ledger,
+                'type': Transaction.CREDIT,
+                'amount': amount,
+                'bank_account_name': self.bank_code,
+                'account_name': self.name,
+                'account_number': self.virtual_account,
+                'notes': 'Receive money',
+            })
+
+        ledgers = {ledger.id: ledger for ledger in [self] + [other_ledger for other_ledger, _ in payouts]}
+        created_transactions = None
+        with transfer_seconds.time(), db_transaction.atomic(savepoint=False):
+            balances = Ledger.lock_balances(ledgers.keys())
+            if balances[self.id] >= total:
+                created_transactions = Transaction.bulk_create_transactions(transactions, balances)
+                updated_at = Ledger.update_balances(balances)
+        transfers.inc(result='posted' if created_transactions is not None else 'insufficient_balance')
+        if created_transactions is None:
             raise Exception(messages.LEDGER_INSUFFICIENT_BALANCE)
-        
-        self.create_debit_transaction(
-            amount=amount,
-            bank_account_name=other_ledger.bank_code,
-            account_name=other_ledger.name,
-            account_number=other_ledger.virtual_account,
-            notes='Send money',
+
+        for id, ledger in ledgers.items():
+            ledger.balance = balances[id]
+            ledger.updated_at = updated_at
+        return created_transactions
+
+    @classmethod
+    def lock_balances(cls, ids) -> Dict[int, int]:
+        return dict(
+            cls.objects.select_for_update()
+            .filter(id__in=ids)
+            .order_by('id')
+            .values_list('id', 'balance')
         )
-        other_ledger.create_credit_transaction(
-            amount=amount,
-            bank_account_name=self.bank_code,
-            account_name=self.name,
-            account_number=self.virtual_account,
-            notes='Receive money',
+
+    @classmethod
+    def update_balances(cls, balances: Dict[int, int]):
+        now = timezone.now()
+        cls.objects.bulk_update(
+            [cls(id=id, balance=balance, updated_at=now) for id, balance in balances.items()],
+            fields=['balance', 'updated_at'],
         )
-    
+        for id in balances:
+            cls.get_cached_ledger.invalidate(id)
+        return now
+
     def update_from_callback(self, data: dict):
         # https://docs.instamoney.co/apireference/#fixed-virtual-account-callback
-        self.bank_code = data.get('bank_code')
-        self.virtual_account = data.get('account_number')
-
+        if self.is_stale():
+            # the status is compared below, a cached copy may be older than another process' write
+            self.refresh_from_db()
         status = self.status
         status_from_callback = data.get('status')
         if status_from_callback == 'ACTIVE':
@@ -177,10 +385,16 @@ class Ledger(BaseModel):
             status = self.PENDING
         elif status_from_callback == 'INACTIVE':
             status = self.INACTIVE
-        
-        if status != self.status:
-            self.set_status(status, 'Callback from instamoney')
-        self.save()
+
+        update_fields = self.update(
+            bank_code=data.get('bank_code'),
+            virtual_account=data.get('account_number'),
+            # the callback may arrive before the provisioning worker stored the response
+            reference=self.reference or data.get('id'),
+            status=status,
+        )
+        if 'status' in update_fields:
+            LedgerStatusHistory.create(self, status, 'Callback from instamoney')
 
 
 class Transaction(BaseModel):
@@ -202,6 +416,17 @@ class Transaction(BaseModel):
     account_name = models.CharField(max_length=100, null=True)
     account_number = models.CharField(max_length=100, null=True)
     notes = models.TextField(null=True)
+    search_text = models.TextField(default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ledger', 'id'], name='transaction_ledger_id_idx'),
+            models.Index(fields=['ledger', 'type', 'id'], name='transaction_ledger_type_id_idx'),
+            models.Index(fields=['ledger', 'created_at'], name='transaction_ledger_created_idx'),
+        ]
+
+    BULK_CREATE_BATCH_SIZE = 1000
+    SEARCH_FIELDS = ('id', 'reference', 'bank_account_name', 'account_number', 'account_name', 'notes')
 
     @classmethod
     def create_debit_transaction(
@@ -213,6 +438,7 @@ class Transaction(BaseModel):
         account_number: Union[str, None] = None,
         reference: Union[str, None] = None,
         notes: Union[str, None] = None,
+        balance_before: Union[int, None] = None,
     ):
         transaction = cls(
             ledger=ledger,
@@ -225,8 +451,8 @@ class Transaction(BaseModel):
         )
         transaction.set_id()
         transaction.set_reference(reference)
-        transaction.set_amount(amount)
-        transaction.save()
+        transaction.set_amount(amount, balance_before)
+        transaction.save(force_insert=True)
         return transaction
     
     @classmethod
@@ -239,6 +465,7 @@ class Transaction(BaseModel):
         account_number: Union[str, None] = None,
         reference: Union[str, None] = None,
         notes: Union[str, None] = None,
+        balance_before: Union[int, None] = None,
     ):
         transaction = cls(
             ledger=ledger,
@@ -251,25 +478,68 @@ class Transaction(BaseModel):
         )
         transaction.set_id()
         transaction.set_reference(reference)
-        transaction.set_amount(amount)
-        transaction.save()
+        transaction.set_amount(amount, balance_before)
+        transaction.save(force_insert=True)
         return transaction
     
+    @classmethod
+    def create_transactions(cls, ledger: Ledger, transactions: List[dict], balance_before: int):
+        return cls.bulk_create_transactions(
+            [dict(item, ledger=ledger) for item in transactions],
+            {ledger.id: balance_before},
+        )
+
+    @classmethod
+    def bulk_create_transactions(cls, transactions: List[dict], balances: Dict[int, int]):
+        # `balances` holds the balance of every ledger before the first transaction,
+        # it is moved along the chain and ends with the balances after the last one.
+        now = timezone.now()
+        ids = transaction_id_allocator.allocate_many(len(transactions), now)
+        created_transactions = []
+        for id, item in zip(ids, transactions):
+            ledger = item['ledger']
+            transaction = cls(
+                id=id,
+                ledger=ledger,
+                type=item['type'],
+                bank_account_name=item.get('bank_account_name'),
+                account_name=item.get('account_name'),
+                account_number=item.get('account_number'),
+                notes=item.get('notes'),
+                created_at=now,
+            )
+            transaction.set_reference(item.get('reference'))
+            transaction.set_amount(item['amount'], balances[ledger.id])
+            transaction.set_search_text()
+            balances[ledger.id] = transaction.balance_after
+            created_transactions.append(transaction)
+        return cls.objects.bulk_create(created_transactions, batch_size=cls.BULK_CREATE_BATCH_SIZE)
+
+    @classmethod
+    def get_existing_references(cls, references: List[str]):
+        return set(cls.objects.filter(reference__in=references).values_list('reference', flat=True))
+
     @classmethod
     def get_transactions(cls, ledger: Ledger, type: Union[str, None] = None, search_keyword: Union[str, None] = None):
         transactions = cls.objects.filter(ledger=ledger)
         if type:
             transactions = transactions.filter(type=type)
+        transactions = transactions.order_by('-id')
         if search_keyword:
+            transactions = search_transactions(transactions, search_keyword)
+        return transactions
+
+    @classmethod
+    def get_statement(cls, ledger: Ledger, start_date=None, end_date=None):
+        # oldest first, served by the (ledger, created_at) index. both dates are inclusive
+        transactions = cls.objects.filter(ledger=ledger)
+        if start_date:
+            transactions = transactions.filter(created_at__gte=LedgerBalanceSnapshot.get_day_start(start_date))
+        if end_date:
             transactions = transactions.filter(
-                Q(id__icontains=search_keyword) |
-                Q(reference__icontains=search_keyword) |
-                Q(bank_account_name__icontains=search_keyword) |
-                Q(account_number__icontains=search_keyword) |
-                Q(account_name__icontains=search_keyword) |
-                Q(notes__icontains=search_keyword)
+                created_at__lt=LedgerBalanceSnapshot.get_day_start(end_date + timedelta(days=1)),
             )
-        return transactions.order_by('-id')
+        return transactions.order_by('created_at', 'id')
 
     @classmethod
     def get_transaction(cls, id: str, raise_exception: bool = False):
@@ -283,14 +553,19 @@ class Transaction(BaseModel):
             raise Exception(messages.LEDGER_TRANSACTION_ID_CANNOT_BE_CHANGED)
         
         # YYYYMMDD0000000
-        now = timezone.now()
-        last_transaction = self.get_last_transaction(now)
-        last_number = 0
-        if last_transaction is not None:
-            last_number = last_transaction.get_transaction_number()
-        
-        self.id = now.strftime("%Y%m%d") + f"{last_number + 1:07d}"
+        self.id = transaction_id_allocator.allocate()
     
+    def set_search_text(self):
+        self.search_text = self.get_search_text({field: getattr(self, field) for field in self.SEARCH_FIELDS})
+
+    @classmethod
+    def get_search_text(cls, values: dict):
+        return '\n'.join(str(values[field]) for field in cls.SEARCH_FIELDS if values.get(field)).lower()
+
+    def save(self, *args, **kwargs):
+        self.set_search_text()
+        super().save(*args, **kwargs)
+
     def set_reference(self, reference: Union[str, None]):
         if self.reference:
             raise Exception(messages.LEDGER_TRANSACTION_REFERENCE_CANNOT_BE_CHANGED)
@@ -299,11 +574,11 @@ class Transaction(BaseModel):
             reference = str(uuid.uuid4()).replace('-', '')
         self.reference = reference
     
-    def set_amount(self, value: int):
+    def set_amount(self, value: int, balance_before: Union[int, None] = None):
         if self.amount:
             raise Exception(messages.LEDGER_TRANSACTION_AMOUNT_CANNOT_BE_CHANGED)
 
-        current_balance = self.ledger.balance
+        current_balance = self.ledger.balance if balance_before is None else balance_before
         balance_after = 0
         if self.is_debit:
             balance_after = current_balance - value
@@ -321,12 +596,6 @@ class Transaction(BaseModel):
         except ValueError:
             return 0
     
-    def get_last_transaction(self, in_month: datetime):
-        return Transaction.objects.filter(
-            created_at__year=in_month.year,
-            created_at__month=in_month.month,
-        ).order_by('-id').first()
-
     @property
     def is_debit(self):
         return self.type == self.DEBIT
@@ -349,12 +618,163 @@ class Transaction(BaseModel):
     
     @property
     def bank(self):
-        account_name = self.account_name if self.account_name else ''
-        bank_account_name = self.bank_account_name if self.bank_account_name else ''
-        account_number = self.account_number if self.account_number else ''
+        return self.get_bank(self.account_name, self.bank_account_name, self.account_number)
+
+    @staticmethod
+    def get_bank(account_name: Union[str, None], bank_account_name: Union[str, None], account_number: Union[str, None]):
+        account_name = account_name if account_name else ''
+        bank_account_name = bank_account_name if bank_account_name else ''
+        account_number = account_number if account_number else ''
         return f"{account_name} - {bank_account_name} {account_number}".strip()
 
 
+class TransactionSequence(BaseModel):
+    date = models.DateField(unique=True)
+    last_number = models.IntegerField(default=0)
+
+    MAX_NUMBER = 9999999
+
+    @classmethod
+    def reserve(cls, date, size: int, using: str = DEFAULT_DB_ALIAS):
+        # reserve a block of `size` transaction numbers for the day and return the first one.
+        # the row stays locked by the update until the transaction around it on `using` ends.
+        with db_transaction.atomic(using=using):
+            sequences = cls.objects.using(using).filter(date=date)
+            updated = sequences.update(last_number=F('last_number') + size, updated_at=timezone.now())
+            if not updated:
+                try:
+                    with db_transaction.atomic(using=using):
+                        cls.objects.using(using).create(date=date, last_number=cls.get_initial_number(date, using) + size)
+                except IntegrityError:
+                    sequences.update(last_number=F('last_number') + size, updated_at=timezone.now())
+
+            last_number = sequences.values_list('last_number', flat=True).get()
+            if last_number > cls.MAX_NUMBER:
+                raise Exception(messages.LEDGER_TRANSACTION_ID_EXHAUSTED)
+        return last_number - size + 1
+
+    @classmethod
+    def get_initial_number(cls, date, using: str = DEFAULT_DB_ALIAS):
+        # continue after transactions created before the sequence existed for this day
+        prefix = date.strftime("%Y%m%d")
+        last_transaction = Transaction.objects.using(using).filter(
+            id__gte=prefix + '0000000',
+            id__lte=prefix + '9999999',
+        ).order_by('-id').first()
+        if last_transaction is None:
+            return 0
+        return last_transaction.get_transaction_number()
+
+
+class LedgerBalanceSnapshot(BaseModel):
+    ledger = models.ForeignKey(Ledger, on_delete=models.PROTECT, related_name='balance_snapshots')
+    date = models.DateField()
+    balance = models.IntegerField()
+    last_transaction_id = models.CharField(max_length=15)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ledger', 'date'], name='ledger_balance_snapshot_unique'),
+        ]
+
+    @staticmethod
+    def get_day_start(value):
+        return timezone.make_aware(datetime.combine(value, time.min))
+
+    @classmethod
+    def get_balance_at(cls, ledger: Ledger, value: datetime):
+        day = timezone.localtime(value).date()
+        snapshot = cls.objects.filter(ledger=ledger, date__lt=day).order_by('-date').first()
+
+        transactions = Transaction.objects.filter(ledger=ledger, created_at__lte=value)
+        if snapshot is not None:
+            transactions = transactions.filter(created_at__gte=cls.get_day_start(snapshot.date + timedelta(days=1)))
+        balance = transactions.order_by('-created_at', '-id').values_list('balance_after', flat=True).first()
+        if balance is not None:
+            return balance
+        return snapshot.balance if snapshot is not None else 0
+
+    @classmethod
+    def build(cls, ledger: Ledger, until=None):
+        # closing balance of every finished day with transactions since the last snapshot
+        if until is None:
+            until = timezone.localdate()
+        transactions = Transaction.objects.filter(ledger=ledger, created_at__lt=cls.get_day_start(until))
+        last_snapshot = cls.objects.filter(ledger=ledger).order_by('-date').first()
+        if last_snapshot is not None:
+            transactions = transactions.filter(
+                created_at__gte=cls.get_day_start(last_snapshot.date + timedelta(days=1)),
+            )
+
+        snapshots = {}
+        for created_at, id, balance_after in (
+            transactions.order_by('created_at', 'id')
+            .values_list('created_at', 'id', 'balance_after')
+            .iterator(chunk_size=Transaction.BULK_CREATE_BATCH_SIZE)
+        ):
+            day = timezone.localtime(created_at).date()
+            snapshots[day] = cls(ledger=ledger, date=day, balance=balance_after, last_transaction_id=id)
+        return cls.objects.bulk_create(
+            list(snapshots.values()),
+            batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def build_day(cls, day):
+        # closing balance of every ledger with transactions on `day`, from its last transaction
+        # of the day by created_at and id like build. rows of a concurrent build are skipped
+        transactions = Transaction.objects.filter(
+            created_at__gte=cls.get_day_start(day),
+            created_at__lt=cls.get_day_start(day + timedelta(days=1)),
+        )
+        last_id = transactions.filter(ledger=OuterRef('ledger')).order_by('-created_at', '-id').values('id')[:1]
+        snapshots = [
+            cls(ledger_id=ledger_id, date=day, balance=balance_after, last_transaction_id=id)
+            for ledger_id, id, balance_after in (
+                transactions.filter(id=Subquery(last_id))
+                .exclude(Exists(cls.objects.filter(ledger=OuterRef('ledger'), date=day)))
+                .values_list('ledger_id', 'id', 'balance_after')
+                .iterator(chunk_size=Transaction.BULK_CREATE_BATCH_SIZE)
+            )
+        ]
+        cls.objects.bulk_create(snapshots, batch_size=Transaction.BULK_CREATE_BATCH_SIZE, ignore_conflicts=True)
+        return len(snapshots)
+
+    @classmethod
+    def get_build_start(cls):
+        # the earliest day some ledger may still miss: the day after the oldest of the latest
+        # snapshots of every ledger, or the first transaction of a ledger without snapshots
+        starts = []
+        oldest_last_date = (
+            cls.objects.values('ledger').annotate(last_date=Max('date'))
+            .order_by('last_date').values_list('last_date', flat=True).first()
+        )
+        if oldest_last_date is not None:
+            starts.append(oldest_last_date + timedelta(days=1))
+        first_created_at = Transaction.objects.exclude(
+            Exists(cls.objects.filter(ledger=OuterRef('ledger'))),
+        ).aggregate(created_at=Min('created_at'))['created_at']
+        if first_created_at is not None:
+            starts.append(timezone.localtime(first_created_at).date())
+        return min(starts, default=None)
+
+    @classmethod
+    def build_all(cls, until=None):
+        # every finished day from get_build_start on, one day at a time for all ledgers.
+        # ledgers built ahead by build keep their snapshots, build_day skips them
+        if until is None:
+            until = timezone.localdate()
+        day = cls.get_build_start()
+        if day is None:
+            return 0
+
+        created = 0
+        while day < until:
+            created += cls.build_day(day)
+            day += timedelta(days=1)
+        return created
+
 
 class LedgerStatusHistory(BaseModel):
     ledger = models.ForeignKey(Ledger, on_delete=models.PROTECT, related_name='ledger_histories')
@@ -364,3 +784,258 @@ class LedgerStatusHistory(BaseModel):
     @classmethod
     def create(cls, ledger: Ledger, status: str, notes: Union[str, None] = None):
         return cls.objects.create(ledger=ledger, status=status, notes=notes)
+
+
+class VirtualAccountRequest(BaseModel):
+    ledger = models.OneToOneField(Ledger, on_delete=models.PROTECT, related_name='virtual_account_request')
+
+    PENDING = '1'
+    PROVISIONED = '2'
+    FAILED = '3'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROVISIONED, 'Provisioned'),
+        (FAILED, 'Failed'),
+    )
+    status = models.CharField(max_length=1, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True)
+    # a worker owns the request until it stores the result or the claim expires
+    claimed_at = models.DateTimeField(null=True)
+    provisioned_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='va_request_status_idx'),
+        ]
+
+    @classmethod
+    def claim(cls, batch_size: int = 100):
+        now = timezone.now()
+        expired_at = now - timedelta(seconds=settings.VIRTUAL_ACCOUNT_CLAIM_TIMEOUT)
+        with db_transaction.atomic():
+            requests = list(
+                cls.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('ledger')
+                .filter(status=cls.PENDING)
+                .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=expired_at))
+                .order_by('id')[:batch_size]
+            )
+            cls.objects.filter(id__in=[request.id for request in requests]).update(claimed_at=now)
+        return requests
+
+    @classmethod
+    def provision_pending(cls, batch_size: int = 100, concurrency: Union[int, None] = None):
+        # the batch is claimed in a short transaction, then requested from Instamoney with at
+        # most `concurrency` calls in flight, and every result is stored in its own transaction
+        requests = cls.claim(batch_size)
+        if requests:
+            results = asyncio.run(cls.create_virtual_accounts(requests, concurrency))
+            for request, result in zip(requests, results):
+                with db_transaction.atomic():
+                    if isinstance(result, Exception):
+                        request.set_failed(result)
+                    else:
+                        request.set_provisioned(result)
+        return requests
+
+    @classmethod
+    async def create_virtual_accounts(cls, requests: List['VirtualAccountRequest'], concurrency: Union[int, None] = None):
+        semaphore = asyncio.Semaphore(concurrency or settings.VIRTUAL_ACCOUNT_CONCURRENCY)
+        rne = AsyncRNE()
+
+        async def create_virtual_account(ledger: Ledger):
+            async with semaphore:
+                return await rne.create_virtual_account(
+                    name=ledger.name,
+                    bank_code=ledger.bank_code,
+                    external_id=ledger.external_id,
+                )
+
+        try:
+            return await asyncio.gather(
+                *(create_virtual_account(request.ledger) for request in requests),
+                return_exceptions=True,
+            )
+        finally:
+            await AsyncInstamoney.close_client()
+
+    def provision(self):
+        try:
+            virtual_account = RNE().create_virtual_account(
+                name=self.ledger.name,
+                bank_code=self.ledger.bank_code,
+                external_id=self.ledger.external_id,
+            )
+        except InstamoneyError as error:
+            self.set_failed(error)
+        else:
+            self.set_provisioned(virtual_account)
+
+    def set_provisioned(self, virtual_account: dict):
+        self.ledger.set_virtual_account(virtual_account)
+        self.attempts += 1
+        self.status = self.PROVISIONED
+        self.error = None
+        self.claimed_at = None
+        self.provisioned_at = timezone.now()
+        self.save(update_fields=['attempts', 'status', 'error', 'claimed_at', 'provisioned_at', 'updated_at'])
+
+    def set_failed(self, error: Exception):
+        self.attempts += 1
+        if self.attempts >= settings.VIRTUAL_ACCOUNT_MAX_ATTEMPTS:
+            self.status = self.FAILED
+        self.error = str(error)
+        self.claimed_at = None
+        self.save(update_fields=['attempts', 'status', 'error', 'claimed_at', 'updated_at'])
+
+
+class CallbackEvent(BaseModel):
+    FIXED_VIRTUAL_ACCOUNT_CREATED = '1'
+    FIXED_VIRTUAL_ACCOUNT_PAYMENT = '2'
+    TYPE_CHOICES = (
+        (FIXED_VIRTUAL_ACCOUNT_CREATED, 'Fixed Virtual Account Created'),
+        (FIXED_VIRTUAL_ACCOUNT_PAYMENT, 'Fixed Virtual Account Payment'),
+    )
+    type = models.CharField(max_length=1)
+    key = models.CharField(max_length=100, unique=True)
+    ledger_reference = models.CharField(max_length=100, null=True)
+    payload = models.JSONField()
+
+    PENDING = '1'
+    PROCESSED = '2'
+    FAILED = '3'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    )
+    status = models.CharField(max_length=1, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True)
+    processed_at = models.DateTimeField(null=True)
+    # failed events wait until then before they are claimed again
+    next_attempt_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='callback_event_status_idx'),
+        ]
+
+    @classmethod
+    def receive(cls, type: str, data: dict):
+        # store the callback and acknowledge it, duplicate deliveries are ignored by the unique key
+        if type == cls.FIXED_VIRTUAL_ACCOUNT_PAYMENT:
+            key = data.get('payment_id')
+            if not key:
+                # every payment without an id would share one key and be dropped as a duplicate
+                raise ValidationError({'payment_id': messages.LEDGER_CALLBACK_PAYMENT_ID_REQUIRED})
+            ledger_reference = data.get('callback_virtual_account_id')
+        else:
+            key = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+            ledger_reference = data.get('id')
+
+        event = cls(type=type, key=f"{type}:{key}", ledger_reference=ledger_reference, payload=data)
+        cls.objects.bulk_create([event], ignore_conflicts=True)
+        return event
+
+    @classmethod
+    def process_pending(cls, batch_size: int = 100):
+        # claim a batch of pending events, rows claimed by another worker are skipped
+        with db_transaction.atomic():
+            events = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(status=cls.PENDING)
+                .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+                .order_by('id')[:batch_size]
+            )
+            groups = {}
+            for event in events:
+                groups.setdefault(event.ledger_reference, []).append(event)
+            for ledger_reference, group in groups.items():
+                cls.process_group(ledger_reference, group)
+
+            cls.objects.bulk_update(
+                events,
+                fields=['status', 'attempts', 'error', 'processed_at', 'next_attempt_at', 'updated_at'],
+            )
+
+        types = dict(cls.TYPE_CHOICES)
+        statuses = dict(cls.STATUS_CHOICES)
+        for event in events:
+            callbacks_processed.inc(type=types.get(event.type), status=statuses.get(event.status))
+            if event.lag is not None:
+                callback_lag_seconds.observe(event.lag, type=types.get(event.type))
+        return events
+
+    @classmethod
+    def process_group(cls, ledger_reference: str, events: List['CallbackEvent']):
+        # events of one ledger are posted together, when that fails each one is retried alone
+        try:
+            with db_transaction.atomic():
+                ledger = Ledger.get_ledger_from_reference(ledger_reference)
+                if ledger is None:
+                    # created callback of a ledger whose provisioning response isn't stored yet
+                    external_id = events[0].payload.get('external_id')
+                    ledger = Ledger.get_ledger_from_external_id(external_id, raise_exception=True)
+                cls.apply(ledger, events)
+        except Exception as error:
+            if len(events) > 1:
+                for event in events:
+                    cls.process_group(ledger_reference, [event])
+            else:
+                events[0].set_failed(error)
+            return
+
+        for event in events:
+            event.set_processed()
+
+    @classmethod
+    def apply(cls, ledger: Ledger, events: List['CallbackEvent']):
+        payments = []
+        for event in events:
+            if event.type == cls.FIXED_VIRTUAL_ACCOUNT_CREATED:
+                ledger.update_from_callback(event.payload)
+            elif event.type == cls.FIXED_VIRTUAL_ACCOUNT_PAYMENT:
+                payments.append(event.payload)
+
+        posted_references = set(Transaction.objects.filter(
+            reference__in=[payment.get('payment_id') for payment in payments],
+        ).values_list('reference', flat=True))
+        transactions = [
+            {
+                'type': Transaction.CREDIT,
+                'amount': payment.get('amount'),
+                'bank_account_name': payment.get('bank_code'),
+                'account_name': payment.get('sender_name'),
+                'account_number': payment.get('account_number'),
+                'reference': payment.get('payment_id'),
+            }
+            for payment in payments
+            if payment.get('payment_id') not in posted_references
+        ]
+        if transactions:
+            ledger.create_transactions(transactions)
+
+    def set_processed(self):
+        self.attempts += 1
+        self.status = self.PROCESSED
+        self.error = None
+        self.next_attempt_at = None
+        self.processed_at = timezone.now()
+        self.updated_at = self.processed_at
+
+    def set_failed(self, error: Exception):
+        self.attempts += 1
+        if self.attempts >= settings.CALLBACK_EVENT_MAX_ATTEMPTS:
+            self.status = self.FAILED
+        self.error = str(error)
+        self.updated_at = timezone.now()
+        backoff = settings.CALLBACK_EVENT_RETRY_BACKOFF * 2 ** (self.attempts - 1)
+        self.next_attempt_at = self.updated_at + timedelta(seconds=backoff)
+
+    @property
+    def lag(self):
+        if self.processed_at is None:
+            return None
+        return (self.processed_at - self.created_at).total_seconds()
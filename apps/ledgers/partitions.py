@@ -0,0 +1,218 @@
+from datetime import date
+from typing import List, Union
+
+# Transaction.id starts with YYYYMMDD, so every month of transactions is one id range.
+# kept free of model imports, the partitioning migration uses it too.
+TABLE = 'ledgers_transaction'
+UNPARTITIONED_TABLE = 'ledgers_transaction_unpartitioned'
+DEFAULT_PARTITION = 'ledgers_transaction_default'
+# references are unique across partitions through this table, a partitioned table can
+# only have unique constraints that include the partition key
+REFERENCE_TABLE = 'ledgers_transaction_reference'
+REFERENCE_INDEX = 'ledgers_transaction_reference_idx'
+PRIMARY_KEY = 'ledgers_transaction_pkey'
+REFERENCE_CONSTRAINT = 'ledgers_transaction_reference_key'
+
+CREATE_REFERENCE_TABLE = [
+    f"CREATE TABLE {REFERENCE_TABLE} (reference varchar(100) PRIMARY KEY, transaction_id varchar(15) NOT NULL)",
+    f"""CREATE FUNCTION {REFERENCE_TABLE}_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {REFERENCE_TABLE} (reference, transaction_id) VALUES (NEW.reference, NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    f"""CREATE FUNCTION {REFERENCE_TABLE}_delete() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM {REFERENCE_TABLE} WHERE reference = OLD.reference AND transaction_id = OLD.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    f"""CREATE FUNCTION {REFERENCE_TABLE}_update() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM {REFERENCE_TABLE} WHERE reference = OLD.reference AND transaction_id = OLD.id;
+        INSERT INTO {REFERENCE_TABLE} (reference, transaction_id) VALUES (NEW.reference, NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+]
+CREATE_REFERENCE_TRIGGERS = [
+    f"CREATE TRIGGER {REFERENCE_TABLE}_insert AFTER INSERT ON {TABLE} "
+    f"FOR EACH ROW EXECUTE FUNCTION {REFERENCE_TABLE}_insert()",
+    f"CREATE TRIGGER {REFERENCE_TABLE}_delete AFTER DELETE ON {TABLE} "
+    f"FOR EACH ROW EXECUTE FUNCTION {REFERENCE_TABLE}_delete()",
+    f"CREATE TRIGGER {REFERENCE_TABLE}_update AFTER UPDATE OF id, reference ON {TABLE} "
+    f"FOR EACH ROW EXECUTE FUNCTION {REFERENCE_TABLE}_update()",
+]
+DROP_REFERENCE_TABLE = [
+    f"DROP TABLE IF EXISTS {REFERENCE_TABLE}",
+    f"DROP FUNCTION IF EXISTS {REFERENCE_TABLE}_insert()",
+    f"DROP FUNCTION IF EXISTS {REFERENCE_TABLE}_delete()",
+    f"DROP FUNCTION IF EXISTS {REFERENCE_TABLE}_update()",
+]
+
+
+def get_month(value: date):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int):
+    months = month.year * 12 + month.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def get_partition_name(month: date):
+    return f"{TABLE}_y{month:%Y}m{month:%m}"
+
+
+def get_partition_bounds(month: date):
+    # ids of the month sort between its YYYYMM prefix and the next one
+    return month.strftime('%Y%m'), add_months(month, 1).strftime('%Y%m')
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_partitions(connection) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname",
+            [TABLE],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(connection, month: date):
+    """
+    Attach the partition of `month`. Rows of the month that went to the default partition
+    because it was missing are moved into it, and their references put back, since moving
+    them out of the default partition fires the delete trigger.
+    """
+    name = get_partition_name(month)
+    start, end = get_partition_bounds(month)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE id >= %s AND id < %s)", [start, end])
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end])
+            return name
+
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE id >= %s AND id < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        cursor.execute(
+            f"INSERT INTO {REFERENCE_TABLE} (reference, transaction_id) SELECT reference, id FROM {name} "
+            f"ON CONFLICT DO NOTHING"
+        )
+    return name
+
+
+def create_partitions(connection, until: date, since: Union[date, None] = None) -> List[str]:
+    # the missing monthly partitions from `since`, or the current month, up to the month of `until`
+    from django.utils import timezone
+
+    existing = set(get_partitions(connection))
+    month = get_month(since or timezone.now().date())
+    created = []
+    while month <= get_month(until):
+        if get_partition_name(month) not in existing:
+            created.append(create_partition(connection, month))
+        month = add_months(month, 1)
+    return created
+
+
+def get_oldest_month(connection, table: str):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(id) FROM {table}")
+        oldest_id = cursor.fetchone()[0]
+    if not oldest_id:
+        return None
+    return date(int(oldest_id[:4]), int(oldest_id[4:6]), 1)
+
+
+def get_definitions(connection, table: str):
+    # indexes and foreign keys of `table`, to be created again on the table that replaces it.
+    # indexes backing the primary key and unique constraints are left to the caller.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ("
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u'))",
+            [table, table],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def copy_definitions(cursor, indexes: List[str], foreign_keys: list, source: str):
+    for index in indexes:
+        cursor.execute(index.replace(f" ON {source} ", f" ON {TABLE} ").replace(f" ON public.{source} ", f" ON {TABLE} "))
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+def partition_table(connection, months_ahead: int):
+    """
+    Replace the transaction table with one partitioned by month, with partitions from the
+    oldest transaction up to `months_ahead` months from now and a default partition catching
+    the rest. Indexes and foreign keys are created again on the partitioned table.
+    """
+    from django.utils import timezone
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED_TABLE}")
+    indexes, foreign_keys = get_definitions(connection, UNPARTITIONED_TABLE)
+    now = timezone.now().date()
+    oldest_month = get_oldest_month(connection, UNPARTITIONED_TABLE) or get_month(now)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {UNPARTITIONED_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (id)")
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+    create_partitions(connection, until=add_months(get_month(now), months_ahead), since=min(oldest_month, get_month(now)))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {UNPARTITIONED_TABLE}")
+        for statement in CREATE_REFERENCE_TABLE:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {REFERENCE_TABLE} (reference, transaction_id) SELECT reference, id FROM {TABLE}")
+        cursor.execute(f"DROP TABLE {UNPARTITIONED_TABLE}")
+
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {PRIMARY_KEY} PRIMARY KEY (id)")
+        copy_definitions(cursor, indexes, foreign_keys, UNPARTITIONED_TABLE)
+        cursor.execute(f"CREATE INDEX {REFERENCE_INDEX} ON {TABLE} (reference)")
+        for statement in CREATE_REFERENCE_TRIGGERS:
+            cursor.execute(statement)
+
+
+def unpartition_table(connection):
+    # back to a single table, with the unique reference constraint instead of the reference table
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED_TABLE}")
+    indexes, foreign_keys = get_definitions(connection, UNPARTITIONED_TABLE)
+    indexes = [index for index in indexes if f' {REFERENCE_INDEX} ' not in index]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {UNPARTITIONED_TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {UNPARTITIONED_TABLE}")
+        cursor.execute(f"DROP TABLE {UNPARTITIONED_TABLE} CASCADE")
+        for statement in DROP_REFERENCE_TABLE:
+            cursor.execute(statement)
+
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {PRIMARY_KEY} PRIMARY KEY (id)")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {REFERENCE_CONSTRAINT} UNIQUE (reference)")
+        copy_definitions(cursor, indexes, foreign_keys, UNPARTITIONED_TABLE)
@@ -0,0 +1,67 @@
+import re
+from django.db import connections
+
+from apps.ledgers.models import CallbackEvent, Ledger, Transaction
+
+# plan lines that mean a hot query reads the whole table or sorts its rows
+SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (ledgers_ledger|ledgers_transaction|ledgers_callbackevent)\b(?!_)'),
+    # monthly partitions and the default partition of the transaction table are scanned by name
+    'postgresql': re.compile(r'Seq Scan on (ledgers_ledger|ledgers_transaction(?:_\w+)?|ledgers_callbackevent)\b'),
+}
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    'postgresql': re.compile(r'^\s*(->\s*)?Sort\b', re.MULTILINE),
+}
+
+# unfiltered listings, SQLite reports walking the integer primary key backwards as a SCAN
+ORDERED_SCAN_QUERIES = ('ledgers',)
+
+
+def get_hot_queries(ledger: Ledger):
+    """The listing and lookup queries every request path runs, as the views build them."""
+    transactions = Transaction.get_transactions(ledger)
+    last_transaction_id = transactions.values_list('id', flat=True).first() or ''
+    return {
+        'transactions': transactions[:21],
+        'transactions next page': transactions.filter(id__lt=last_transaction_id)[:21],
+        'transactions by type': Transaction.get_transactions(ledger, type=Transaction.CREDIT)[:21],
+        'transactions search': Transaction.get_transactions(ledger, search_keyword='top up')[:21],
+        'transaction by id': Transaction.objects.filter(id=last_transaction_id),
+        'transaction by reference': Transaction.objects.filter(reference='reference'),
+        'ledgers': Ledger.get_ledgers()[:21],
+        'ledgers by bank code': Ledger.get_ledgers(bank_code=ledger.bank_code)[:21],
+        'ledger by reference': Ledger.objects.filter(reference=ledger.reference),
+        'pending callbacks': CallbackEvent.objects.filter(status=CallbackEvent.PENDING).order_by('id')[:100],
+    }
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # the planner prefers sequential scans on small tables, only an index-less plan should fail
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+def check_query_plan(queryset, ordered_scan: bool = False):
+    """Return the EXPLAIN output and the forbidden plan lines found in it."""
+    plan = explain(queryset)
+    vendor = connections[queryset.db].vendor
+    patterns = [SORT_PATTERNS.get(vendor)]
+    if not (ordered_scan and vendor == 'sqlite'):
+        patterns.append(SCAN_PATTERNS.get(vendor))
+    problems = [
+        match.group(0).strip()
+        for pattern in patterns if pattern is not None
+        for match in pattern.finditer(plan)
+    ]
+    return plan, problems
+
+
+def check_hot_queries(ledger: Ledger):
+    return {
+        name: check_query_plan(queryset, ordered_scan=name in ORDERED_SCAN_QUERIES)
+        for name, queryset in get_hot_queries(ledger).items()
+    }
@@ -0,0 +1,61 @@
+import re
+from django.db import connections
+from django.db.models import Case, Q, QuerySet, Value, When
+
+# YYYYMMDD0000000
+TRANSACTION_ID_PATTERN = re.compile(r'^\d{15}$')
+# uuid4 hex, generated by Transaction.set_reference
+TRANSACTION_REFERENCE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# trigram full-text table kept in sync by triggers, created by migration 0009 on SQLite
+SQLITE_SEARCH_TABLE = 'ledgers_transaction_search'
+SQLITE_ESCAPED_CHARACTERS = ('\\', '%', '_')
+
+
+def search_transactions(transactions: QuerySet, keyword: str) -> QuerySet:
+    """
+    Filter transactions whose id, reference, bank or notes contain `keyword`.
+    A transaction whose id or reference is exactly `keyword` comes first, followed by the
+    other matches in the order of `transactions`.
+    Substring search goes through `Transaction.search_text`, indexed with pg_trgm on
+    PostgreSQL and with an FTS5 trigram table on SQLite.
+    """
+    keyword = keyword.strip()
+    exact_match = None
+    if TRANSACTION_ID_PATTERN.match(keyword):
+        exact_match = Q(id=keyword)
+    elif TRANSACTION_REFERENCE_PATTERN.match(keyword.lower()):
+        exact_match = Q(reference=keyword)
+    if exact_match is not None:
+        # search_text holds the id and the reference, so the substring search finds the exact
+        # match too and only the order changes
+        transactions = transactions.alias(
+            exact_match=Case(When(exact_match, then=Value(0)), default=Value(1)),
+        ).order_by('exact_match', *transactions.query.order_by)
+
+    keyword = keyword.lower()
+    connection = connections[transactions.db]
+    if connection.vendor == 'sqlite' and has_sqlite_search_table(connection):
+        where = f"{SQLITE_SEARCH_TABLE}.search_text LIKE %s"
+        if any(character in keyword for character in SQLITE_ESCAPED_CHARACTERS):
+            # the trigram index is skipped with an ESCAPE clause, so only add it when needed
+            where += " ESCAPE '\\'"
+            keyword = connection.ops.prep_for_like_query(keyword)
+        table = transactions.model._meta.db_table
+        return transactions.extra(
+            where=[f"{table}.id IN (SELECT transaction_id FROM {SQLITE_SEARCH_TABLE} WHERE {where})"],
+            params=[f"%{keyword}%"],
+        )
+    return transactions.filter(search_text__contains=keyword)
+
+
+def has_sqlite_search_table(connection):
+    database = (connection.alias, connection.settings_dict['NAME'])
+    if database not in sqlite_search_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SQLITE_SEARCH_TABLE])
+            sqlite_search_tables[database] = cursor.fetchone() is not None
+    return sqlite_search_tables[database]
+
+
+sqlite_search_tables = {}
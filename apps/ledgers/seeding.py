@@ -0,0 +1,284 @@
+import csv
+import io
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+from typing import Dict, List
+
+from apps.ledgers.models import Ledger, LedgerBalanceSnapshot, Transaction, TransactionSequence
+from apps.users.models import User
+
+BANK_CODES = ('BCA', 'BNI', 'BRI', 'MANDIRI', 'PERMATA')
+FIRST_NAMES = ('Adi', 'Budi', 'Citra', 'Dewi', 'Eka', 'Fajar', 'Gita', 'Hadi', 'Indah', 'Joko')
+LAST_NAMES = ('Santoso', 'Wijaya', 'Pratama', 'Saputra', 'Lestari', 'Hidayat', 'Kusuma', 'Nugroho')
+CREDIT_NOTES = ('Top up', 'Receive money', 'Refund', 'Cashback', 'Payment received')
+DEBIT_NOTES = ('Send money', 'Payout', 'Buy food', 'Bill payment', 'Settlement')
+# balances are integer columns, postings that would pass this are turned into debits
+MAX_BALANCE = 10 ** 9
+MAX_AMOUNT = 10 ** 8
+# weekend days get fewer transactions
+WEEKEND_WEIGHT = 0.6
+LOOKUP_BATCH_SIZE = 500
+
+TRANSACTION_COLUMNS = (
+    'id', 'ledger_id', 'type', 'reference', 'balance_before', 'amount', 'balance_after', 'bank_account_name',
+    'account_name', 'account_number', 'notes', 'search_text', 'created_at', 'updated_at',
+)
+
+
+@contextmanager
+def historic_timestamps(model):
+    # bulk_create would stamp every row with now, seeded rows keep the time they are given
+    fields = [model._meta.get_field('created_at'), model._meta.get_field('updated_at')]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def get_months_start(now: datetime, months: int):
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+    return start
+
+
+def split(total: int, weights: List[float]):
+    # `total` spread over `weights`, largest remainders get the leftovers
+    weight_sum = sum(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(weights)), key=lambda index: counts[index] - shares[index])
+    for index in by_remainder[:total - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+class WalletSeeder:
+    """
+    Generates users, ledgers and months of transactions for performance work. A few hot
+    ledgers take `hot_share` of the transactions and the rest follow a long Pareto tail.
+    Days are written oldest first, each with ids reserved from TransactionSequence in
+    time order, so the id order of every ledger is its posting order and its
+    balance_before/balance_after chain ends at the stored balance. Rows are written with
+    bulk_create in chunks, or with COPY on PostgreSQL.
+    """
+    def __init__(
+        self,
+        users: int,
+        ledgers: int,
+        transactions: int,
+        months: int = 3,
+        hot_ledgers: float = 0.01,
+        hot_share: float = 0.5,
+        tail: float = 1.2,
+        chunk_size: int = 10000,
+        copy: bool = None,
+        seed: int = None,
+        log=None,
+    ):
+        self.users = users
+        self.ledgers = ledgers
+        self.transactions = transactions
+        self.months = months
+        self.hot_ledgers = hot_ledgers
+        self.hot_share = hot_share
+        self.tail = tail
+        self.chunk_size = chunk_size
+        self.copy = connection.vendor == 'postgresql' if copy is None else copy
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        # keeps emails, references and accounts of separate runs apart, also with the same seed
+        self.run = uuid.uuid4().hex[:8]
+        self.balances: Dict[int, int] = {}
+
+    def seed_users(self, started_at: datetime):
+        password = make_password(None)
+        emails = []
+        for start in range(0, self.users, self.chunk_size):
+            users = []
+            for number in range(start, min(start + self.chunk_size, self.users)):
+                email = f'seed-{self.run}-{number}@example.com'
+                users.append(User(
+                    email=email,
+                    username=email,
+                    first_name=self.random.choice(FIRST_NAMES),
+                    last_name=self.random.choice(LAST_NAMES),
+                    password=password,
+                    date_joined=started_at,
+                ))
+                emails.append(email)
+            User.objects.bulk_create(users, batch_size=Transaction.BULK_CREATE_BATCH_SIZE)
+        return self.get_ids(User, 'email', emails)
+
+    def seed_ledgers(self, user_ids: List[int], started_at: datetime):
+        references = []
+        with historic_timestamps(Ledger):
+            for start in range(0, self.ledgers, self.chunk_size):
+                ledgers = []
+                for number in range(start, min(start + self.chunk_size, self.ledgers)):
+                    reference = f'seed-{self.run}-{number}'
+                    ledgers.append(Ledger(
+                        user_id=user_ids[number % len(user_ids)],
+                        name=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                        virtual_account=f'{self.run}{number:010d}',
+                        balance=0,
+                        reference=reference,
+                        bank_code=self.random.choice(BANK_CODES),
+                        status=Ledger.ACTIVE,
+                        created_at=started_at,
+                        updated_at=started_at,
+                    ))
+                    references.append(reference)
+                Ledger.objects.bulk_create(ledgers, batch_size=Transaction.BULK_CREATE_BATCH_SIZE)
+        return self.get_ids(Ledger, 'reference', references)
+
+    def get_ids(self, model, field: str, values: List[str]):
+        # in the order of `values`, bulk_create only returns ids on some databases
+        ids = {}
+        for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+            batch = values[start:start + LOOKUP_BATCH_SIZE]
+            ids.update(model.objects.filter(**{f'{field}__in': batch}).values_list(field, 'id'))
+        return [ids[value] for value in values]
+
+    def get_ledger_weights(self, count: int):
+        hot_count = min(count, max(1, round(count * self.hot_ledgers))) if self.hot_share else 0
+        tail = [self.random.paretovariate(self.tail) for _ in range(count - hot_count)]
+        tail_share = 1 - self.hot_share if hot_count else 1
+        hot_weight = self.hot_share / hot_count if hot_count else 0
+        tail_sum = sum(tail) or 1
+        return [hot_weight] * hot_count + [tail_share * weight / tail_sum for weight in tail], hot_count
+
+    def get_days(self, now: datetime):
+        day = get_months_start(now, self.months)
+        days = []
+        while day < now:
+            days.append(day)
+            day += timedelta(days=1)
+        weights = [WEEKEND_WEIGHT if day.weekday() >= 5 else 1 for day in days]
+        # today is only partly over
+        weights[-1] *= (now - days[-1]) / timedelta(days=1)
+        return list(zip(days, split(self.transactions, weights)))
+
+    def build_transaction(self, id: str, ledger_id: int, hot: bool, created_at: datetime):
+        balance = self.balances[ledger_id]
+        amount = min(int(round(self.random.lognormvariate(11, 1.2), -2)) or 100, MAX_AMOUNT)
+        # merchants mostly receive, people spend about as much as they top up
+        is_credit = self.random.random() < (0.8 if hot else 0.55)
+        if is_credit and balance + amount > MAX_BALANCE:
+            is_credit = False
+        if not is_credit and balance < amount:
+            if balance >= 100 and self.random.random() < 0.5:
+                amount = balance
+            else:
+                is_credit = True
+        balance_after = balance + amount if is_credit else balance - amount
+        self.balances[ledger_id] = balance_after
+
+        has_account = self.random.random() < 0.7
+        values = {
+            'id': id,
+            'ledger_id': ledger_id,
+            'type': Transaction.CREDIT if is_credit else Transaction.DEBIT,
+            'reference': uuid.UUID(int=self.random.getrandbits(128)).hex,
+            'balance_before': balance,
+            'amount': amount,
+            'balance_after': balance_after,
+            'bank_account_name': self.random.choice(BANK_CODES) if has_account else None,
+            'account_name': f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}' if has_account else None,
+            'account_number': f'{self.random.getrandbits(40):013d}' if has_account else None,
+            'notes': self.random.choice(CREDIT_NOTES if is_credit else DEBIT_NOTES),
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+        values['search_text'] = Transaction.get_search_text(values)
+        return values
+
+    def write(self, rows: List[dict]):
+        if not self.copy:
+            with historic_timestamps(Transaction):
+                Transaction.objects.bulk_create(
+                    [Transaction(**row) for row in rows],
+                    batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
+                )
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+                for column in TRANSACTION_COLUMNS
+            ])
+        buffer.seek(0)
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({', '.join(TRANSACTION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def seed_day(self, day: datetime, count: int, end: datetime, ledger_ids: List[int], cum_weights: List[float], hot_ids: set):
+        seconds = (min(day + timedelta(days=1), end) - day).total_seconds()
+        offsets = sorted(self.random.random() * seconds for _ in range(count))
+        chosen_ids = self.random.choices(ledger_ids, cum_weights=cum_weights, k=count)
+        prefix = day.strftime('%Y%m%d')
+        with db_transaction.atomic():
+            first = TransactionSequence.reserve(day.date(), count)
+            for start in range(0, count, self.chunk_size):
+                rows = [
+                    self.build_transaction(
+                        prefix + f'{first + index:07d}',
+                        chosen_ids[index],
+                        chosen_ids[index] in hot_ids,
+                        day + timedelta(seconds=offsets[index]),
+                    )
+                    for index in range(start, min(start + self.chunk_size, count))
+                ]
+                self.write(rows)
+
+    def update_balances(self, now: datetime):
+        ids = list(self.balances)
+        with historic_timestamps(Ledger):
+            for start in range(0, len(ids), self.chunk_size):
+                Ledger.objects.bulk_update(
+                    [Ledger(id=id, balance=self.balances[id], updated_at=now) for id in ids[start:start + self.chunk_size]],
+                    fields=['balance', 'updated_at'],
+                    batch_size=Transaction.BULK_CREATE_BATCH_SIZE,
+                )
+
+    def execute(self, snapshots: bool = False):
+        now = timezone.now()
+        days = self.get_days(now)
+        started_at = days[0][0]
+
+        user_ids = self.seed_users(started_at)
+        ledger_ids = self.seed_ledgers(user_ids, started_at)
+        self.log(f"created {len(user_ids)} users and {len(ledger_ids)} ledgers")
+        self.balances = dict.fromkeys(ledger_ids, 0)
+
+        weights, hot_count = self.get_ledger_weights(len(ledger_ids))
+        cum_weights = []
+        total = 0
+        for weight in weights:
+            total += weight
+            cum_weights.append(total)
+        hot_ids = set(ledger_ids[:hot_count])
+
+        created = 0
+        for day, count in days:
+            if count:
+                self.seed_day(day, count, now, ledger_ids, cum_weights, hot_ids)
+                created += count
+            if day.day == 1 or day is days[-1][0]:
+                self.log(f"{day:%Y-%m-%d}: {created} transactions")
+        self.update_balances(now)
+
+        if snapshots:
+            self.log(f"created {LedgerBalanceSnapshot.build_all()} balance snapshots")
+        return {'users': len(user_ids), 'ledgers': len(ledger_ids), 'transactions': created}
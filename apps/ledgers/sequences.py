@@ -0,0 +1,40 @@
+from datetime import datetime
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from typing import List, Union
+
+
+class TransactionIdAllocator:
+    """
+    Hands out transaction ids reserved on the TRANSACTION_ID_DATABASE connection, where each
+    reservation commits on its own, so the sequence row is only locked while it is bumped.
+    Every call reserves just the numbers it needs, ids are therefore handed out in the order
+    postings ask for them across all workers, which the listings and balance snapshots rely
+    on. Numbers of rolled back transactions are skipped.
+    """
+    def __init__(self, using: Union[str, None] = None):
+        self.using = using
+
+    def get_using(self):
+        using = self.using if self.using is not None else settings.TRANSACTION_ID_DATABASE
+        # SQLite has a single writer, a second connection would wait on the lock the
+        # request's own transaction holds once it has written anything
+        if connections[using].vendor == 'sqlite':
+            return DEFAULT_DB_ALIAS
+        return using
+
+    def allocate(self, now: Union[datetime, None] = None) -> str:
+        return self.allocate_many(1, now)[0]
+
+    def allocate_many(self, count: int, now: Union[datetime, None] = None) -> List[str]:
+        from apps.ledgers.models import TransactionSequence
+
+        if now is None:
+            now = timezone.now()
+        prefix = now.strftime("%Y%m%d")
+        first = TransactionSequence.reserve(now.date(), count, self.get_using())
+        return [prefix + f"{number:07d}" for number in range(first, first + count)]
+
+
+transaction_id_allocator = TransactionIdAllocator()
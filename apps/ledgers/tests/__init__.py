@@ -1,2 +1,15 @@
+from .async_view import *
+from .callback import *
+from .export import *
+from .idempotency import *
 from .ledger import *
+from .pagination import *
+from .partition import *
+from .provisioning import *
+from .query_count import *
+from .query_plan import *
+from .sequence import *
+from .seeding import *
+from .serializer import *
+from .snapshot import *
 from .transaction import *
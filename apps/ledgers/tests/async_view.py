@@ -0,0 +1,59 @@
+import time
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.ledgers.models import Ledger
+from apps.ledgers.tests.factories import create_ledger
+from apps.modules.instamoney import BankCatalogue, bank_catalogue
+from apps.users.tests.factories import create_user
+
+
+class LedgerAsyncViewTestCase(TestCase):
+    BANKS = [{'code': 'BNI', 'name': 'Bank Negara Indonesia'}]
+
+    def setUp(self):
+        cache.set(BankCatalogue.CACHE_KEY, {'banks': self.BANKS, 'fetched_at': time.time()})
+        bank_catalogue.reset()
+        self.user = create_user()
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def tearDown(self):
+        cache.delete(BankCatalogue.CACHE_KEY)
+        bank_catalogue.reset()
+
+    def test_banks_endpoint(self):
+        response = self.client.get('/api/v1/ledgers/banks/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.BANKS)
+
+    def test_create_endpoint(self):
+        data = {'user': self.user.id, 'name': self.user.name, 'bank_code': 'BNI'}
+        response = self.client.post('/api/v1/ledgers/', data, content_type='application/json', **self.headers)
+
+        self.assertEqual(response.status_code, 201)
+        ledger = Ledger.get_ledger(response.json()['id'])
+        self.assertEqual(ledger.status, Ledger.PENDING)
+        self.assertEqual(ledger.ledger_histories.count(), 1)
+
+    def test_create_endpoint_with_invalid_bank_code(self):
+        data = {'user': self.user.id, 'name': self.user.name, 'bank_code': 'XYZ'}
+        response = self.client.post('/api/v1/ledgers/', data, content_type='application/json', **self.headers)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bank_code', response.json())
+
+    def test_create_endpoint_without_authentication(self):
+        data = {'user': self.user.id, 'name': self.user.name, 'bank_code': 'BNI'}
+        response = self.client.post('/api/v1/ledgers/', data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response.headers)
+
+    def test_list_endpoint(self):
+        ledgers = [create_ledger() for _ in range(3)]
+        response = self.client.get('/api/v1/ledgers/', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ledger['id'] for ledger in response.json()['results']], [ledger.id for ledger in ledgers[::-1]])
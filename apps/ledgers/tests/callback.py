@@ -0,0 +1,181 @@
+import io
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from apps.ledgers.models import CallbackEvent, Ledger, Transaction
+from apps.ledgers.tests.factories import create_ledger
+
+
+class CallbackEventTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+
+    def get_payment(self, payment_id, amount=10000, ledger=None):
+        ledger = ledger or self.ledger
+        return {
+            'payment_id': payment_id,
+            'callback_virtual_account_id': ledger.reference,
+            'amount': amount,
+            'bank_code': 'BNI',
+            'sender_name': 'Someone',
+            'account_number': ledger.virtual_account,
+        }
+
+    def test_receive_method(self):
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-1'))
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-1'))
+
+        self.assertEqual(CallbackEvent.objects.count(), 1)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 0)
+
+    def test_receive_method_without_payment_id(self):
+        payment = self.get_payment(None)
+
+        with self.assertRaises(ValidationError):
+            CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, payment)
+        self.assertEqual(CallbackEvent.objects.count(), 0)
+
+    def test_payment_callback_endpoint_without_payment_id(self):
+        payment = self.get_payment('payment-1')
+        del payment['payment_id']
+        response = APIClient().post(
+            '/api/v1/ledgers/callbacks/fixed-virtual-account-payment/',
+            payment,
+            format='json',
+            headers={'x-callback-token': ''},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('payment_id', response.json())
+        self.assertEqual(CallbackEvent.objects.count(), 0)
+
+    def test_payment_callback_endpoint(self):
+        response = APIClient().post(
+            '/api/v1/ledgers/callbacks/fixed-virtual-account-payment/',
+            self.get_payment('payment-1'),
+            format='json',
+            headers={'x-callback-token': ''},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CallbackEvent.objects.filter(status=CallbackEvent.PENDING).count(), 1)
+
+    def test_process_pending_method(self):
+        other_ledger = create_ledger()
+        for number in range(3):
+            CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment(f'payment-{number}'))
+        CallbackEvent.receive(
+            CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT,
+            self.get_payment('payment-other', ledger=other_ledger),
+        )
+        events = CallbackEvent.process_pending()
+
+        self.assertEqual(len(events), 4)
+        self.assertEqual(CallbackEvent.objects.filter(status=CallbackEvent.PROCESSED).count(), 4)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 30000)
+        self.assertEqual(Ledger.get_ledger(other_ledger.id).balance, 10000)
+        self.assertEqual(
+            list(Transaction.get_transactions(self.ledger).values_list('balance_after', flat=True)),
+            [30000, 20000, 10000],
+        )
+        self.assertIsNotNone(events[0].lag)
+
+    def test_process_pending_method_skip_posted_payment(self):
+        self.ledger.create_credit_transaction(amount=10000, reference='payment-1')
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-1'))
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-2'))
+        CallbackEvent.process_pending()
+
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 20000)
+
+    def test_process_pending_method_with_unknown_ledger(self):
+        payment = dict(self.get_payment('payment-1'), callback_virtual_account_id='unknown')
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, payment)
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-2'))
+        CallbackEvent.process_pending()
+
+        failed_event = CallbackEvent.objects.get(key__endswith='payment-1')
+        self.assertEqual(failed_event.status, CallbackEvent.PENDING)
+        self.assertEqual(failed_event.attempts, 1)
+        self.assertIsNotNone(failed_event.error)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 10000)
+
+    @override_settings(CALLBACK_EVENT_RETRY_BACKOFF=60)
+    def test_process_pending_method_backs_off_failed_events(self):
+        payment = dict(self.get_payment('payment-1'), callback_virtual_account_id='unknown')
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, payment)
+        CallbackEvent.process_pending()
+        event = CallbackEvent.objects.get()
+        self.assertAlmostEqual((event.next_attempt_at - event.updated_at).total_seconds(), 60)
+
+        self.assertEqual(CallbackEvent.process_pending(), [])
+
+        CallbackEvent.objects.update(next_attempt_at=timezone.now())
+        CallbackEvent.process_pending()
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertAlmostEqual((event.next_attempt_at - event.updated_at).total_seconds(), 120)
+
+    def test_process_pending_method_with_invalid_payment(self):
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-1'))
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, self.get_payment('payment-2', amount=None))
+        CallbackEvent.process_pending()
+
+        self.assertEqual(CallbackEvent.objects.filter(status=CallbackEvent.PROCESSED).count(), 1)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 10000)
+
+    def test_process_pending_method_with_created_callback(self):
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_CREATED, {
+            'id': self.ledger.reference,
+            'bank_code': 'BNI',
+            'account_number': self.ledger.virtual_account,
+            'status': 'ACTIVE',
+        })
+        CallbackEvent.process_pending()
+
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).status, Ledger.ACTIVE)
+
+    def test_process_pending_method_with_created_callback_before_provisioning(self):
+        ledger = Ledger.create(self.ledger.user, self.ledger.name, 'BNI')
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_CREATED, {
+            'id': 'virtual-account-id',
+            'external_id': ledger.external_id,
+            'bank_code': 'BNI',
+            'account_number': '1234567890',
+            'status': 'ACTIVE',
+        })
+        CallbackEvent.process_pending()
+
+        ledger = Ledger.get_ledger(ledger.id)
+        self.assertEqual(ledger.status, Ledger.ACTIVE)
+        self.assertEqual(ledger.reference, 'virtual-account-id')
+        self.assertEqual(ledger.virtual_account, '1234567890')
+
+
+class ProcessCallbacksCommandTestCase(TransactionTestCase):
+    def test_worker_keeps_going_after_error(self):
+        ledger = create_ledger()
+        CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, {
+            'payment_id': 'payment-1',
+            'callback_virtual_account_id': ledger.reference,
+            'amount': 10000,
+        })
+        original_process_pending = CallbackEvent.process_pending
+        calls = []
+
+        def process_pending(batch_size):
+            calls.append(batch_size)
+            if len(calls) == 1:
+                raise Exception("connection lost")
+            return original_process_pending(batch_size)
+
+        with mock.patch.object(CallbackEvent, 'process_pending', process_pending), \
+                self.assertLogs('apps.ledgers.management.commands.process_callbacks', 'ERROR'):
+            call_command('process_callbacks', workers=1, interval=0, once=True, stdout=io.StringIO())
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 10000)
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.ledgers.exports import EXPORT_FIELDS
+from apps.ledgers.models import Transaction
+from apps.ledgers.tests.factories import create_ledger
+
+
+class TransactionExportTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.ledger.create_transactions([
+            {'type': Transaction.CREDIT, 'amount': 10000, 'notes': 'Top up, "first"'},
+            {'type': Transaction.DEBIT, 'amount': 2500},
+            {'type': Transaction.CREDIT, 'amount': 500},
+        ])
+        old_transaction = Transaction.get_statement(self.ledger).first()
+        Transaction.objects.filter(id=old_transaction.id).update(created_at=timezone.now() - timedelta(days=10))
+        self.client = APIClient()
+        self.client.force_authenticate(self.ledger.user)
+        self.url = f'/api/v1/ledgers/{self.ledger.id}/transactions/export/'
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.get_content(response))))
+        self.assertEqual(tuple(rows[0]), EXPORT_FIELDS)
+        self.assertEqual([row['balance_after'] for row in rows], ['10000', '7500', '8000'])
+        self.assertEqual(rows[0]['notes'], 'Top up, "first"')
+        self.assertEqual(rows[1]['type'], 'Debit')
+
+    def test_export_ndjson(self):
+        response = self.client.get(self.url, {'file_format': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual([row['amount'] for row in rows], [10000, 2500, 500])
+        self.assertIsNone(rows[1]['notes'])
+
+    def test_export_with_date_range(self):
+        today = timezone.localdate()
+        response = self.client.get(self.url, {'start_date': today.isoformat(), 'file_format': 'ndjson'})
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual([row['amount'] for row in rows], [2500, 500])
+
+        response = self.client.get(self.url, {'end_date': (today - timedelta(days=1)).isoformat()})
+        rows = list(csv.DictReader(io.StringIO(self.get_content(response))))
+        self.assertEqual([row['amount'] for row in rows], ['10000'])
+
+        response = self.client.get(self.url, {'start_date': today.isoformat(), 'end_date': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_export_streams_under_asgi(self):
+        token = AccessToken.for_user(self.ledger.user)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        # an async iterator is sent as it is read, a sync one would be read into a list first
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['balance_after'] for row in rows], ['10000', '7500', '8000'])
@@ -14,4 +14,5 @@ def create_ledger(user=None, bank_code=None):
         name=user.name,
         bank_code=bank_code,
     )
+    ledger.virtual_account_request.provision()
     return ledger
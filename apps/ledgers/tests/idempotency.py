@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.ledgers.models import Ledger, Transaction
+from apps.ledgers.tests.factories import create_ledger
+from apps.utils.idempotency import IDEMPOTENCY_KEY_HEADER, IDEMPOTENT_REPLAYED_HEADER
+from apps.utils.models import IdempotencyKey
+
+
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ledger = create_ledger()
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(self.ledger.user)
+        self.url = f'/api/v1/ledgers/{self.ledger.id}/transactions/'
+        self.data = {
+            'type': Transaction.CREDIT,
+            'amount': 10000,
+            'bank_account_name': None,
+            'account_name': None,
+            'account_number': None,
+            'notes': 'Top up',
+        }
+
+    def post(self, data, key):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, data, format='json', headers={IDEMPOTENCY_KEY_HEADER: key})
+
+    def test_replay_response(self):
+        response = self.post(self.data, 'top-up-1')
+        replayed_response = self.post(self.data, 'top-up-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replayed_response.status_code, 201)
+        self.assertEqual(replayed_response.headers[IDEMPOTENT_REPLAYED_HEADER], 'true')
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 10000)
+
+    def test_different_keys(self):
+        self.post(self.data, 'top-up-1')
+        self.post(self.data, 'top-up-2')
+
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 20000)
+
+    def test_reused_key_with_different_payload(self):
+        self.post(self.data, 'top-up-1')
+        response = self.post(dict(self.data, amount=50000), 'top-up-1')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 10000)
+
+    def test_claims_are_shared_across_cache_instances(self):
+        self.post(self.data, 'top-up-1')
+        other_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other'}}
+        with override_settings(CACHES=other_cache):
+            response = self.post(self.data, 'top-up-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response[IDEMPOTENT_REPLAYED_HEADER], 'true')
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 10000)
+
+    def test_expired_key_is_claimed_again(self):
+        self.post(self.data, 'top-up-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.post(dict(self.data, amount=50000), 'top-up-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 60000)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_failed_request_is_not_stored(self):
+        response = self.post(dict(self.data, type=Transaction.DEBIT), 'withdraw-1')
+        self.post(self.data, 'top-up-1')
+        retried_response = self.post(dict(self.data, type=Transaction.DEBIT), 'withdraw-1')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(retried_response.status_code, 201)
+        self.assertEqual(Ledger.get_ledger(self.ledger.id).balance, 0)
+
+    def test_delete_expired_method(self):
+        self.post(self.data, 'top-up-1')
+        self.post(self.data, 'top-up-2')
+        IdempotencyKey.objects.filter(pk=IdempotencyKey.objects.first().pk).update(expires_at=timezone.now())
+
+        self.assertEqual(IdempotencyKey.delete_expired(), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
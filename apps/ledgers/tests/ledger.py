@@ -1,8 +1,9 @@
 from django.test import TestCase
 from faker import Faker
 from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
 
-from apps.ledgers.models import Ledger
+from apps.ledgers.models import Ledger, Transaction, VirtualAccountRequest
 from apps.ledgers.tests.factories import create_ledger
 from apps.users.tests.factories import create_user
 from apps.utils import messages
@@ -22,7 +23,16 @@ class LedgerTestCase(TestCase):
             bank_code='BNI',
         )
 
-        self.assertIsNotNone(ledger.virtual_account)
+        self.assertEqual(ledger.status, Ledger.PENDING)
+        self.assertIsNone(ledger.virtual_account)
+        self.assertEqual(ledger.virtual_account_request.status, VirtualAccountRequest.PENDING)
+
+    def test_create_many_method(self):
+        ledgers = Ledger.create_many([(self.user, self.user.name, 'BNI') for _ in range(3)])
+
+        self.assertEqual(len({ledger.id for ledger in ledgers}), 3)
+        self.assertEqual(VirtualAccountRequest.objects.filter(ledger__in=ledgers).count(), 3)
+        self.assertEqual(Ledger.get_ledger(ledgers[0].id), ledgers[0])
 
     def test_get_ledgers_method(self):
         [create_ledger() for _ in range(10)]
@@ -56,6 +66,20 @@ class LedgerTestCase(TestCase):
 
         self.assertEqual(result, ledger)
     
+    def test_get_ledger_method_is_cached(self):
+        ledger = create_ledger()
+        Ledger.get_ledger(ledger.id)
+
+        with self.assertNumQueries(0):
+            result = Ledger.get_ledger(str(ledger.id))
+        self.assertEqual(result, ledger)
+
+        ledger.create_credit_transaction(amount=20000)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 20000)
+
+        ledger.send_to(create_ledger(), 5000)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 15000)
+
     def test_get_ledger_method_return_none(self):
         result = Ledger.get_ledger(0)
 
@@ -65,9 +89,69 @@ class LedgerTestCase(TestCase):
     def test_get_ledger_raise_error(self):
         Ledger.get_ledger(0, raise_exception=True)
 
+    def test_get_ledger_from_reference_method_is_cached(self):
+        ledger = create_ledger()
+        Ledger.get_ledger_from_reference(ledger.reference)
+
+        with self.assertNumQueries(0):
+            result = Ledger.get_ledger_from_reference(ledger.reference)
+        self.assertEqual(result, ledger)
+
+        ledger.create_credit_transaction(amount=20000)
+        self.assertEqual(Ledger.get_ledger_from_reference(ledger.reference).balance, 20000)
+
+    def test_get_ledger_from_reference_method_before_provisioning(self):
+        ledger = Ledger.create(create_user(), 'Wallet', 'BNI')
+        self.assertIsNone(Ledger.get_ledger_from_reference('reference-1'))
+
+        ledger.set_virtual_account({'account_number': '123456', 'id': 'reference-1'})
+
+        self.assertEqual(Ledger.get_ledger_from_reference('reference-1'), ledger)
+
+    def test_is_stale_method(self):
+        ledger = create_ledger()
+        cached_ledger = Ledger.get_ledger(ledger.id)
+        self.assertFalse(cached_ledger.is_stale())
+
+        ledger.create_credit_transaction(amount=20000)
+        self.assertTrue(cached_ledger.is_stale())
+        self.assertFalse(ledger.is_stale())
+
+        ledger.send_to(create_ledger(), 5000)
+        self.assertFalse(ledger.is_stale())
+
+    def test_detail_endpoint_read_balance_from_database(self):
+        ledger = create_ledger()
+        Ledger.get_ledger(ledger.id)
+        # a posting of another process, which can't invalidate the copy cached here
+        Ledger.objects.filter(id=ledger.id).update(balance=20000)
+        client = APIClient()
+        client.force_authenticate(ledger.user)
+
+        response = client.get(f'/api/v1/ledgers/{ledger.id}/')
+
+        self.assertEqual(response.json()['balance'], 20000)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 0)
+
+    def test_update_from_callback_method_with_stale_ledger(self):
+        ledger = create_ledger()
+        ledger.set_status(Ledger.ACTIVE)
+        stale_ledger = Ledger.get_ledger(ledger.id)
+        ledger.set_status(Ledger.INACTIVE)
+
+        stale_ledger.update_from_callback({
+            'bank_code': ledger.bank_code,
+            'account_number': ledger.virtual_account,
+            'id': ledger.reference,
+            'status': 'ACTIVE',
+        })
+
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.status, Ledger.ACTIVE)
+
     def test_create_debit_transaction_method(self):
         ledger = create_ledger()
-        ledger.balance = 20000
+        ledger.create_credit_transaction(amount=20000)
         transaction = ledger.create_debit_transaction(
             amount=10000,
             notes='Buy food',
@@ -79,7 +163,7 @@ class LedgerTestCase(TestCase):
     @assert_raise_error(Exception(messages.LEDGER_INSUFFICIENT_BALANCE))
     def test_create_debit_transaction_method_raise_error(self):
         ledger = create_ledger()
-        ledger.balance = 20000
+        ledger.create_credit_transaction(amount=20000)
         ledger.create_debit_transaction(
             amount=50000,
             notes='Buy food',
@@ -95,6 +179,106 @@ class LedgerTestCase(TestCase):
         self.assertIsNotNone(transaction)
         self.assertEqual(ledger.balance, 50000)
 
+    def test_create_debit_transaction_method_with_stale_ledger(self):
+        ledger = create_ledger()
+        ledger.create_credit_transaction(amount=20000)
+        stale_ledger = Ledger.get_ledger(ledger.id)
+        ledger.create_debit_transaction(amount=15000)
+
+        with self.assertRaisesMessage(Exception, str(messages.LEDGER_INSUFFICIENT_BALANCE)):
+            stale_ledger.create_debit_transaction(amount=10000)
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.balance, 5000)
+
+    def test_create_credit_transaction_method_with_stale_ledger(self):
+        ledger = create_ledger()
+        stale_ledger = Ledger.get_ledger(ledger.id)
+        ledger.create_credit_transaction(amount=10000)
+        transaction = stale_ledger.create_credit_transaction(amount=5000)
+
+        self.assertEqual(transaction.balance_before, 10000)
+        self.assertEqual(transaction.balance_after, 15000)
+        self.assertEqual(stale_ledger.balance, 15000)
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.balance, 15000)
+
+    def test_create_credit_transaction_method_queries(self):
+        ledger = create_ledger()
+        ledger.create_credit_transaction(amount=10000)
+
+        # the balance update and the insert, after the 4 statements reserving the id
+        with self.assertNumQueries(6):
+            ledger.create_credit_transaction(amount=10000)
+
+    def test_create_transactions_method(self):
+        ledger = create_ledger()
+        transactions = ledger.create_transactions([
+            {'type': Transaction.CREDIT, 'amount': 50000, 'notes': 'Settlement'},
+            {'type': Transaction.DEBIT, 'amount': 20000, 'notes': 'Fee'},
+            {'type': Transaction.CREDIT, 'amount': 5000, 'reference': 'cashback-1'},
+        ])
+
+        self.assertEqual(len(transactions), 3)
+        self.assertEqual([item.balance_before for item in transactions], [0, 50000, 30000])
+        self.assertEqual([item.balance_after for item in transactions], [50000, 30000, 35000])
+        self.assertEqual(transactions[2].reference, 'cashback-1')
+        self.assertEqual(ledger.balance, 35000)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 35000)
+        self.assertEqual(Transaction.get_transactions(ledger).count(), 3)
+
+    def test_create_transactions_method_raise_error(self):
+        ledger = create_ledger()
+
+        with self.assertRaisesMessage(Exception, str(messages.LEDGER_INSUFFICIENT_BALANCE)):
+            ledger.create_transactions([
+                {'type': Transaction.DEBIT, 'amount': 20000},
+                {'type': Transaction.CREDIT, 'amount': 50000},
+            ])
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 0)
+        self.assertEqual(Transaction.get_transactions(ledger).count(), 0)
+
+    def test_send_to_method(self):
+        ledger = create_ledger()
+        other_ledger = create_ledger()
+        ledger.create_credit_transaction(amount=50000)
+        debit, credit = ledger.send_to(other_ledger, 20000)
+
+        self.assertEqual(debit.ledger, ledger)
+        self.assertEqual(debit.balance_after, 30000)
+        self.assertEqual(debit.account_number, other_ledger.virtual_account)
+        self.assertEqual(credit.ledger, other_ledger)
+        self.assertEqual(credit.balance_after, 20000)
+        self.assertEqual(credit.account_number, ledger.virtual_account)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 30000)
+        self.assertEqual(Ledger.get_ledger(other_ledger.id).balance, 20000)
+
+    @assert_raise_error(Exception(messages.LEDGER_INSUFFICIENT_BALANCE))
+    def test_send_to_method_raise_error(self):
+        ledger = create_ledger()
+        other_ledger = create_ledger()
+        ledger.send_to(other_ledger, 20000)
+
+    def test_send_to_many_method(self):
+        ledger = create_ledger()
+        other_ledgers = [create_ledger() for _ in range(3)]
+        ledger.create_credit_transaction(amount=50000)
+        transactions = ledger.send_to_many([(other_ledger, 10000) for other_ledger in other_ledgers])
+
+        self.assertEqual(len(transactions), 4)
+        self.assertEqual(transactions[0].amount, 30000)
+        self.assertEqual(Ledger.get_ledger(ledger.id).balance, 20000)
+        for other_ledger in other_ledgers:
+            self.assertEqual(Ledger.get_ledger(other_ledger.id).balance, 10000)
+
+    def test_send_to_many_method_queries(self):
+        ledger = create_ledger()
+        other_ledgers = [create_ledger() for _ in range(3)]
+        ledger.create_credit_transaction(amount=50000)
+
+        # the lock, the insert and the balances update, after the 4 statements reserving the ids
+        with self.assertNumQueries(7):
+            ledger.send_to_many([(other_ledger, 10000) for other_ledger in other_ledgers])
+
     def test_is_balance_sufficient_method(self):
         ledger = Ledger(balance=10000)
 
@@ -0,0 +1,47 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.ledgers.models import Transaction
+from apps.ledgers.tests.factories import create_ledger
+
+
+class TransactionPaginationTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.ledger.create_transactions([{'type': Transaction.CREDIT, 'amount': 10000} for _ in range(5)])
+        self.client = APIClient()
+        self.client.force_authenticate(self.ledger.user)
+        self.url = f'/api/v1/ledgers/{self.ledger.id}/transactions/'
+
+    def test_list_pages(self):
+        ids = []
+        response = self.client.get(self.url, {'page_size': 2})
+        while True:
+            data = response.json()
+            ids += [transaction['id'] for transaction in data['results']]
+            if data['next'] is None:
+                break
+            response = self.client.get(data['next'])
+
+        expected_ids = list(Transaction.get_transactions(self.ledger).values_list('id', flat=True))
+        self.assertEqual(ids, expected_ids)
+        self.assertNotIn('count', data)
+
+    def test_list_with_count(self):
+        response = self.client.get(self.url, {'page_size': 2, 'count': 'true'})
+
+        self.assertEqual(response.json()['count'], 5)
+
+    def test_list_with_max_page_size(self):
+        self.ledger.create_transactions([{'type': Transaction.CREDIT, 'amount': 10000} for _ in range(200)])
+        response = self.client.get(self.url, {'page_size': 1000})
+
+        self.assertEqual(len(response.json()['results']), 100)
+
+    def test_list_without_count_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, {'page_size': 2})
+
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
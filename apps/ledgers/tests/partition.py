@@ -0,0 +1,148 @@
+from datetime import date
+from io import StringIO
+from unittest import skipIf, skipUnless
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.ledgers.models import Transaction
+from apps.ledgers.partitions import (
+    DEFAULT_PARTITION, PRIMARY_KEY, REFERENCE_INDEX, REFERENCE_TABLE, TABLE, add_months, create_partition, get_month,
+    get_partition_bounds, get_partition_name, get_partitions, is_partitioned,
+)
+from apps.ledgers.tests.factories import create_ledger
+
+# no partition is created this far ahead, its rows go to the default partition
+UNPARTITIONED_MONTH = date(2099, 1, 1)
+
+
+def create_transaction(ledger, id, reference):
+    return Transaction.objects.create(
+        id=id,
+        ledger=ledger,
+        type=Transaction.CREDIT,
+        reference=reference,
+        balance_before=0,
+        amount=10000,
+        balance_after=10000,
+    )
+
+
+def get_partition_of(id):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT tableoid::regclass::text FROM {TABLE} WHERE id = %s", [id])
+        return cursor.fetchone()[0]
+
+
+def get_this_month():
+    # the month the migration and the command count partitions from
+    return get_month(timezone.now().date())
+
+
+def get_references():
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT reference, transaction_id FROM {REFERENCE_TABLE} ORDER BY reference")
+        return cursor.fetchall()
+
+
+class PartitionTestCase(TestCase):
+    def test_add_months(self):
+        self.assertEqual(add_months(date(2026, 10, 1), 3), date(2027, 1, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(get_month(date(2026, 2, 28)), date(2026, 2, 1))
+
+    def test_get_partition_bounds(self):
+        self.assertEqual(get_partition_bounds(date(2026, 12, 1)), ('202612', '202701'))
+        self.assertEqual(get_partition_name(date(2026, 2, 1)), 'ledgers_transaction_y2026m02')
+
+    def test_transaction_ids_fall_in_their_month(self):
+        ledger = create_ledger()
+        transaction = ledger.create_credit_transaction(amount=10000)
+        start, end = get_partition_bounds(get_month(transaction.created_at.date()))
+
+        self.assertTrue(start <= transaction.id < end)
+
+    @skipIf(connection.vendor == 'postgresql', "PostgreSQL partitions the table in its migration")
+    def test_command_without_partitioning(self):
+        output = StringIO()
+        call_command('create_transaction_partitions', stdout=output)
+
+        self.assertFalse(is_partitioned(connection))
+        self.assertIn('nothing to do', output.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', "only PostgreSQL partitions the transaction table")
+class PostgreSQLPartitionTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+
+    def test_table_is_partitioned(self):
+        partitions = get_partitions(connection)
+
+        self.assertTrue(is_partitioned(connection))
+        self.assertIn(DEFAULT_PARTITION, partitions)
+        self.assertIn(get_partition_name(get_this_month()), partitions)
+
+    def test_duplicate_references_are_rejected(self):
+        this_month = get_this_month()
+        create_transaction(self.ledger, this_month.strftime('%Y%m%d') + '9000001', 'duplicate')
+
+        # the other row lands in another partition, only the reference table sees both
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            create_transaction(self.ledger, UNPARTITIONED_MONTH.strftime('%Y%m%d') + '0000001', 'duplicate')
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            create_transaction(self.ledger, this_month.strftime('%Y%m%d') + '9000002', 'duplicate')
+
+    def test_references_follow_updates_and_deletes(self):
+        transaction = create_transaction(self.ledger, get_this_month().strftime('%Y%m%d') + '9000001', 'old')
+
+        Transaction.objects.filter(id=transaction.id).update(reference='new')
+        self.assertEqual(get_references(), [('new', transaction.id)])
+        create_transaction(self.ledger, get_this_month().strftime('%Y%m%d') + '9000002', 'old')
+        Transaction.objects.filter(id=transaction.id).delete()
+        self.assertEqual([reference for reference, _ in get_references()], ['old'])
+
+    def test_create_partition_moves_default_rows(self):
+        ids = [UNPARTITIONED_MONTH.strftime('%Y%m%d') + f'{number:07d}' for number in (1, 2)]
+        later_id = add_months(UNPARTITIONED_MONTH, 1).strftime('%Y%m%d') + '0000001'
+        for number, id in enumerate(ids + [later_id]):
+            create_transaction(self.ledger, id, f'moved-{number}')
+        self.assertEqual(get_partition_of(ids[0]), DEFAULT_PARTITION)
+
+        name = create_partition(connection, UNPARTITIONED_MONTH)
+
+        self.assertEqual(name, get_partition_name(UNPARTITIONED_MONTH))
+        self.assertIn(name, get_partitions(connection))
+        self.assertEqual([get_partition_of(id) for id in ids], [name, name])
+        self.assertEqual(get_partition_of(later_id), DEFAULT_PARTITION)
+        self.assertEqual(get_references(), [('moved-0', ids[0]), ('moved-1', ids[1]), ('moved-2', later_id)])
+        with self.assertRaises(IntegrityError), db_transaction.atomic():
+            create_transaction(self.ledger, ids[0][:8] + '0000003', 'moved-0')
+
+    def test_indexes_and_foreign_keys_are_copied(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, TABLE)
+            partition_constraints = connection.introspection.get_constraints(
+                cursor, get_partition_name(get_this_month()),
+            )
+
+        self.assertEqual(constraints[PRIMARY_KEY]['columns'], ['id'])
+        self.assertTrue(constraints[PRIMARY_KEY]['primary_key'])
+        self.assertEqual(constraints[REFERENCE_INDEX]['columns'], ['reference'])
+        for index in Transaction._meta.indexes:
+            columns = [Transaction._meta.get_field(field).column for field in index.fields]
+            self.assertEqual(constraints[index.name]['columns'], columns)
+        foreign_keys = [constraint['foreign_key'] for constraint in constraints.values() if constraint['foreign_key']]
+        self.assertEqual(foreign_keys, [('ledgers_ledger', 'id')])
+        # the partitions get the indexes of the partitioned table
+        partition_columns = [constraint['columns'] for constraint in partition_constraints.values()]
+        for columns in (['id'], ['reference'], ['ledger_id', 'id'], ['ledger_id', 'type', 'id'], ['ledger_id', 'created_at']):
+            self.assertIn(columns, partition_columns)
+
+    def test_command_creates_partitions(self):
+        output = StringIO()
+        call_command('create_transaction_partitions', months=6, stdout=output)
+
+        self.assertIn(get_partition_name(add_months(get_this_month(), 6)), get_partitions(connection))
+        self.assertIn('created', output.getvalue())
@@ -0,0 +1,112 @@
+import io
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.ledgers.models import Ledger, VirtualAccountRequest
+from apps.modules.instamoney import BankCatalogue, Instamoney, bank_catalogue
+from apps.modules.stub import StubServer
+from apps.users.tests.factories import create_user
+
+
+class VirtualAccountRequestTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.ledgers = Ledger.create_many([(self.user, self.user.name, 'BNI') for _ in range(5)])
+
+    def test_provision_pending_method(self):
+        requests = VirtualAccountRequest.provision_pending(batch_size=3)
+
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(VirtualAccountRequest.objects.filter(status=VirtualAccountRequest.PROVISIONED).count(), 3)
+        ledger = Ledger.get_ledger(self.ledgers[0].id)
+        self.assertIsNotNone(ledger.virtual_account)
+        self.assertIsNotNone(ledger.reference)
+
+        VirtualAccountRequest.provision_pending()
+        self.assertEqual(VirtualAccountRequest.objects.filter(status=VirtualAccountRequest.PENDING).count(), 0)
+
+    def test_claim_method_skips_claimed_requests(self):
+        claimed = VirtualAccountRequest.claim(batch_size=3)
+        other_claimed = VirtualAccountRequest.claim(batch_size=3)
+
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(len(other_claimed), 2)
+        self.assertEqual(VirtualAccountRequest.claim(), [])
+
+    @override_settings(TESTING=False, INSTAMONEY_MAX_RETRIES=0, VIRTUAL_ACCOUNT_MAX_ATTEMPTS=2)
+    def test_provision_pending_method_with_failures(self):
+        server = StubServer(lambda method, path: (500, {'error_code': 'SERVER_ERROR'}, 0)).start()
+        base_url = Instamoney.BASE_URL
+        Instamoney.BASE_URL = server.url
+        try:
+            VirtualAccountRequest.provision_pending()
+            request = VirtualAccountRequest.objects.get(ledger=self.ledgers[0])
+            self.assertEqual((request.status, request.attempts), (VirtualAccountRequest.PENDING, 1))
+            self.assertIsNone(request.claimed_at)
+
+            server.responses = [(500, {}, 0)] + [(200, {'id': str(number), 'account_number': str(number)}, 0) for number in range(4)]
+            VirtualAccountRequest.provision_pending()
+        finally:
+            Instamoney.BASE_URL = base_url
+            server.stop()
+
+        statuses = list(VirtualAccountRequest.objects.order_by('id').values_list('status', flat=True))
+        self.assertEqual(statuses, [VirtualAccountRequest.FAILED] + [VirtualAccountRequest.PROVISIONED] * 4)
+
+
+class BulkLedgerTestCase(TestCase):
+    def setUp(self):
+        cache.set(BankCatalogue.CACHE_KEY, {'banks': [{'code': 'BNI'}], 'fetched_at': time.time()})
+        bank_catalogue.reset()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        cache.delete(BankCatalogue.CACHE_KEY)
+        bank_catalogue.reset()
+
+    def test_bulk_create_endpoint(self):
+        items = [
+            {'user': self.user.id, 'name': 'Merchant 1', 'bank_code': 'BNI'},
+            {'user': self.user.id, 'name': 'Merchant 2', 'bank_code': 'XYZ'},
+            {'user': 0, 'name': 'Merchant 3', 'bank_code': 'BNI'},
+            {'user': self.user.id, 'name': 'Merchant 4', 'bank_code': 'BNI'},
+        ]
+        response = self.client.post('/api/v1/ledgers/bulk/', {'ledgers': items}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()
+        self.assertEqual([result['status'] for result in results], ['pending', 'invalid', 'invalid', 'pending'])
+        self.assertIn('bank_code', results[1]['errors'])
+        self.assertIn('detail', results[2]['errors'])
+        self.assertEqual(Ledger.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ledger.get_ledger(results[3]['id']).name, 'Merchant 4')
+
+
+class ProvisionVirtualAccountsCommandTestCase(TransactionTestCase):
+    def test_worker_keeps_going_after_error(self):
+        user = create_user()
+        ledgers = Ledger.create_many([(user, user.name, 'BNI') for _ in range(2)])
+        original_provision_pending = VirtualAccountRequest.provision_pending
+        calls = []
+
+        def provision_pending(batch_size, concurrency):
+            calls.append(batch_size)
+            if len(calls) == 1:
+                raise Exception("connection lost")
+            return original_provision_pending(batch_size, concurrency)
+
+        with mock.patch.object(VirtualAccountRequest, 'provision_pending', provision_pending), \
+                self.assertLogs('apps.ledgers.management.commands.provision_virtual_accounts', 'ERROR'):
+            call_command('provision_virtual_accounts', interval=0, once=True, stdout=io.StringIO())
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(
+            VirtualAccountRequest.objects.filter(ledger__in=ledgers, status=VirtualAccountRequest.PROVISIONED).count(),
+            2,
+        )
@@ -0,0 +1,135 @@
+import re
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.ledgers.models import CallbackEvent, Ledger, Transaction
+from apps.ledgers.tests.factories import create_ledger
+from apps.modules.instamoney import InstamoneyError
+from apps.users.models import User
+from apps.users.tests.factories import create_user
+
+UPDATE_PATTERN = re.compile(r'^UPDATE "(\w+)" SET (.+?) WHERE ', re.DOTALL)
+COLUMN_PATTERN = re.compile(r'(?:^|, )"?(\w+)"? = ')
+# inside the test case transaction every posting reserves its transaction ids on the default
+# connection, with a savepoint, the sequence update and read, and the release. they run on the
+# transaction_ids connection otherwise.
+RESERVATION = 4
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Statements per write operation, and the columns every UPDATE writes.
+    Counts include the savepoints of nested atomic blocks.
+    """
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.ledger.create_credit_transaction(amount=50000)
+
+    def capture(self, count, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        self.assertEqual(
+            len(queries),
+            count,
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+        return [query['sql'] for query in queries.captured_queries]
+
+    def get_updated_columns(self, statements):
+        updates = {}
+        for statement in statements:
+            match = UPDATE_PATTERN.match(statement)
+            if match and match.group(1) != 'ledgers_transactionsequence':
+                table, assignments = match.groups()
+                updates.setdefault(table, set()).update(COLUMN_PATTERN.findall(assignments))
+        return updates
+
+    def test_create_ledger(self):
+        # ledger, status history and virtual account request inserts
+        self.capture(3, lambda: Ledger.create(self.ledger.user, 'Wallet', 'BNI'))
+
+    def test_set_status(self):
+        statements = self.capture(2, lambda: self.ledger.set_status(Ledger.ACTIVE))
+
+        self.assertEqual(self.get_updated_columns(statements), {'ledgers_ledger': {'status', 'updated_at'}})
+
+    def test_update_from_callback(self):
+        data = {
+            'bank_code': self.ledger.bank_code,
+            'account_number': self.ledger.virtual_account,
+            'id': self.ledger.reference,
+            'status': 'ACTIVE',
+        }
+        # stamp check, a single ledger update and the status history
+        statements = self.capture(3, lambda: self.ledger.update_from_callback(data))
+        self.assertEqual(self.get_updated_columns(statements), {'ledgers_ledger': {'status', 'updated_at'}})
+
+        # nothing changed, nothing written
+        self.capture(1, lambda: self.ledger.update_from_callback(data))
+
+    def test_credit_posting(self):
+        statements = self.capture(2 + RESERVATION, lambda: self.ledger.create_credit_transaction(amount=10000))
+
+        self.assertEqual(self.get_updated_columns(statements), {'ledgers_ledger': {'balance', 'updated_at'}})
+
+    def test_debit_posting(self):
+        statements = self.capture(2 + RESERVATION, lambda: self.ledger.create_debit_transaction(amount=10000))
+
+        self.assertEqual(self.get_updated_columns(statements), {'ledgers_ledger': {'balance', 'updated_at'}})
+
+    def test_create_transactions(self):
+        items = [{'type': Transaction.CREDIT, 'amount': 1000} for _ in range(10)]
+
+        self.capture(2 + RESERVATION, lambda: self.ledger.create_transactions(items))
+
+    def test_send_to(self):
+        other_ledger = create_ledger()
+        # lock, transactions insert and balances update
+        statements = self.capture(3 + RESERVATION, lambda: self.ledger.send_to(other_ledger, 10000))
+
+        self.assertEqual(self.get_updated_columns(statements), {'ledgers_ledger': {'balance', 'updated_at'}})
+
+    def test_set_provisioned(self):
+        request = Ledger.create(self.ledger.user, 'Wallet', 'BNI').virtual_account_request
+        virtual_account = {'account_number': '123456', 'id': 'reference-1'}
+        statements = self.capture(2, lambda: request.set_provisioned(virtual_account))
+
+        self.assertEqual(self.get_updated_columns(statements), {
+            'ledgers_ledger': {'virtual_account', 'reference', 'updated_at'},
+            'ledgers_virtualaccountrequest': {'attempts', 'status', 'error', 'claimed_at', 'provisioned_at', 'updated_at'},
+        })
+
+    def test_set_failed(self):
+        request = Ledger.create(self.ledger.user, 'Wallet', 'BNI').virtual_account_request
+        statements = self.capture(1, lambda: request.set_failed(InstamoneyError()))
+
+        self.assertEqual(self.get_updated_columns(statements), {
+            'ledgers_virtualaccountrequest': {'attempts', 'status', 'error', 'claimed_at', 'updated_at'},
+        })
+
+    def test_process_payments(self):
+        for number in range(3):
+            CallbackEvent.receive(CallbackEvent.FIXED_VIRTUAL_ACCOUNT_PAYMENT, {
+                'payment_id': f'payment-{number}',
+                'callback_virtual_account_id': self.ledger.reference,
+                'amount': 10000,
+            })
+        Ledger.get_ledger_from_reference(self.ledger.reference)
+
+        # claim, posted references, balance update, transactions insert and events update,
+        # within the savepoints of the batch and of the ledger group
+        statements = self.capture(9 + RESERVATION, CallbackEvent.process_pending)
+        self.assertEqual(self.get_updated_columns(statements), {
+            'ledgers_ledger': {'balance', 'updated_at'},
+            'ledgers_callbackevent': {'status', 'attempts', 'error', 'processed_at', 'next_attempt_at', 'updated_at'},
+        })
+
+    def test_update_last_login(self):
+        user = create_user()
+        statements = self.capture(1, user.update_last_login)
+
+        self.assertEqual(self.get_updated_columns(statements), {'users_user': {'last_login'}})
+
+    def test_create_user_logged_in(self):
+        self.capture(1, lambda: User.create('Someone', 'someone@example.com', 'password', logged_in=True))
@@ -0,0 +1,26 @@
+from django.test import TestCase
+
+from apps.ledgers.models import Transaction
+from apps.ledgers.query_plans import SCAN_PATTERNS, check_hot_queries
+from apps.ledgers.tests.factories import create_ledger
+
+
+class QueryPlanTestCase(TestCase):
+    def test_hot_queries_use_indexes(self):
+        ledger = create_ledger()
+        ledger.create_transactions([
+            {'type': Transaction.CREDIT, 'amount': 10000, 'notes': 'Top up'} for _ in range(20)
+        ])
+
+        for name, (plan, problems) in check_hot_queries(ledger).items():
+            with self.subTest(name):
+                self.assertEqual(problems, [], plan)
+
+    def test_partition_scans_are_found(self):
+        pattern = SCAN_PATTERNS['postgresql']
+
+        self.assertTrue(pattern.search('Seq Scan on ledgers_transaction_y2026m10 ledgers_transaction_1'))
+        self.assertTrue(pattern.search('Seq Scan on ledgers_transaction_default ledgers_transaction_2'))
+        self.assertTrue(pattern.search('Seq Scan on ledgers_transaction'))
+        self.assertFalse(pattern.search('Seq Scan on ledgers_transactionsequence'))
+        self.assertFalse(pattern.search('Index Scan using transaction_ledger_id_idx on ledgers_transaction_y2026m10'))
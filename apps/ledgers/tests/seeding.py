@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.ledgers.models import Ledger, Transaction
+from apps.ledgers.search import search_transactions
+from apps.ledgers.seeding import WalletSeeder, split
+
+
+class WalletSeederTestCase(TestCase):
+    def seed(self, **kwargs):
+        options = {'users': 5, 'ledgers': 20, 'transactions': 2000, 'months': 2, 'chunk_size': 300, 'seed': 1}
+        return WalletSeeder(**dict(options, **kwargs)).execute()
+
+    def test_execute_method(self):
+        created = self.seed()
+
+        self.assertEqual(created, {'users': 5, 'ledgers': 20, 'transactions': 2000})
+        self.assertEqual(Ledger.objects.count(), 20)
+        self.assertEqual(Transaction.objects.count(), 2000)
+        self.assertEqual(Ledger.objects.values('user').distinct().count(), 5)
+
+    def test_balance_chains(self):
+        self.seed()
+
+        for ledger in Ledger.objects.all():
+            balance = 0
+            for balance_before, amount, balance_after, type in (
+                Transaction.objects.filter(ledger=ledger)
+                .order_by('id')
+                .values_list('balance_before', 'amount', 'balance_after', 'type')
+            ):
+                self.assertEqual(balance_before, balance)
+                self.assertEqual(balance_after, balance + amount if type == Transaction.CREDIT else balance - amount)
+                self.assertGreaterEqual(balance_after, 0)
+                balance = balance_after
+            self.assertEqual(ledger.balance, balance)
+
+    def test_transactions_span_months(self):
+        self.seed()
+
+        first = Transaction.objects.order_by('id').first()
+        last = Transaction.objects.order_by('-id').first()
+        self.assertNotEqual(first.created_at.month, last.created_at.month)
+        self.assertLessEqual(last.created_at, timezone.now())
+        self.assertEqual(first.id[:8], first.created_at.strftime('%Y%m%d'))
+
+    def test_hot_ledgers(self):
+        self.seed(hot_ledgers=0.1, hot_share=0.5)
+
+        counts = sorted(
+            (Transaction.objects.filter(ledger=ledger).count() for ledger in Ledger.objects.all()),
+            reverse=True,
+        )
+        self.assertGreater(sum(counts[:2]), 800)
+
+    def test_transactions_are_searchable(self):
+        self.seed(transactions=200)
+        transaction = Transaction.objects.exclude(account_name=None).first()
+
+        transactions = search_transactions(Transaction.objects.all(), transaction.account_name.split()[1])
+        self.assertIn(transaction, transactions)
+
+    def test_split(self):
+        self.assertEqual(split(10, [1, 1, 1]), [4, 3, 3])
+        self.assertEqual(sum(split(1000, [0.6, 1, 1, 0.25])), 1000)
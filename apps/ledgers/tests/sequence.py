@@ -0,0 +1,114 @@
+from unittest import skipIf
+from django.db import connection, transaction as db_transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.ledgers.models import Transaction, TransactionSequence
+from apps.ledgers.sequences import TransactionIdAllocator
+from apps.ledgers.tests.factories import create_ledger
+from apps.utils import messages
+from apps.utils.decorators import assert_raise_error
+
+
+class TransactionSequenceTestCase(TestCase):
+    def test_reserve_method(self):
+        today = timezone.now().date()
+        first_block = TransactionSequence.reserve(today, 10)
+        second_block = TransactionSequence.reserve(today, 10)
+
+        self.assertEqual(first_block, 1)
+        self.assertEqual(second_block, 11)
+
+    def test_reserve_method_continue_from_existing_transaction(self):
+        ledger = create_ledger()
+        now = timezone.now()
+        Transaction.objects.create(
+            id=now.strftime("%Y%m%d0000041"),
+            ledger=ledger,
+            type=Transaction.CREDIT,
+            reference='existing',
+            balance_before=0,
+            amount=10000,
+            balance_after=10000,
+        )
+        result = TransactionSequence.reserve(now.date(), 10)
+
+        self.assertEqual(result, 42)
+
+    @assert_raise_error(Exception(messages.LEDGER_TRANSACTION_ID_EXHAUSTED))
+    def test_reserve_method_raise_error(self):
+        TransactionSequence.reserve(timezone.now().date(), TransactionSequence.MAX_NUMBER + 1)
+
+
+class TransactionIdAllocatorTestCase(TransactionTestCase):
+    databases = {'default', 'transaction_ids'}
+
+    def setUp(self):
+        self.allocator = TransactionIdAllocator()
+
+    def test_allocate_method(self):
+        ids = [self.allocator.allocate() for _ in range(7)]
+
+        now = timezone.now()
+        self.assertEqual(ids, [now.strftime("%Y%m%d") + f"{number:07d}" for number in range(1, 8)])
+        self.assertEqual(TransactionSequence.objects.get(date=now.date()).last_number, 7)
+
+    def test_allocate_many_method(self):
+        self.allocator.allocate()
+        ids = self.allocator.allocate_many(12)
+
+        now = timezone.now()
+        self.assertEqual(ids, [now.strftime("%Y%m%d") + f"{number:07d}" for number in range(2, 14)])
+        self.assertEqual(TransactionSequence.objects.get(date=now.date()).last_number, 13)
+
+    def test_allocators_share_the_sequence(self):
+        # ids follow the order they are asked for in, also across allocators of other workers
+        other_allocator = TransactionIdAllocator()
+        ids = [allocator.allocate() for allocator in (self.allocator, other_allocator, self.allocator)]
+
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_allocate_method_inside_transaction(self):
+        try:
+            with db_transaction.atomic():
+                ids = [self.allocator.allocate() for _ in range(2)]
+                last_number = TransactionSequence.objects.get(date=timezone.now().date()).last_number
+                raise ValueError()
+        except ValueError:
+            pass
+        result = self.allocator.allocate()
+
+        prefix = timezone.now().strftime("%Y%m%d")
+        self.assertEqual(ids, [prefix + '0000001', prefix + '0000002'])
+        self.assertEqual(last_number, 2)
+        self.assertEqual(result, prefix + '0000001')
+
+    @skipIf(connection.vendor == 'sqlite', "SQLite reserves on the default connection")
+    def test_allocate_method_on_own_connection(self):
+        allocator = TransactionIdAllocator(using='transaction_ids')
+        try:
+            with db_transaction.atomic():
+                allocator.allocate()
+                raise ValueError()
+        except ValueError:
+            pass
+        result = allocator.allocate()
+
+        now = timezone.now()
+        self.assertEqual(result, now.strftime("%Y%m%d0000002"))
+        self.assertEqual(TransactionSequence.objects.get(date=now.date()).last_number, 2)
+    @override_settings(TRANSACTION_ID_DATABASE='transaction_ids')
+    def test_postings_inside_transaction_through_own_alias(self):
+        ledger = create_ledger()
+        with db_transaction.atomic():
+            # the balance update of the first posting writes before any id is reserved
+            transactions = [ledger.create_credit_transaction(amount=10000) for _ in range(3)]
+
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.balance, 30000)
+        self.assertEqual(len({transaction.id for transaction in transactions}), 3)
+        self.assertEqual(
+            TransactionIdAllocator().get_using(),
+            'default' if connection.vendor == 'sqlite' else 'transaction_ids',
+        )
@@ -0,0 +1,90 @@
+import json
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from apps.ledgers.api.v1.serializers import FastListTransactionSerializer, ListTransactionSerializer
+from apps.ledgers.models import Transaction
+from apps.ledgers.tests.factories import create_ledger
+from apps.utils import messages
+
+
+class FastListTransactionSerializerTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.ledger.create_transactions([
+            {'type': Transaction.CREDIT, 'amount': 50000, 'bank_account_name': 'BNI', 'account_name': 'Top up'},
+            {'type': Transaction.DEBIT, 'amount': 10000, 'account_number': '123456', 'notes': 'Buy food'},
+            {'type': Transaction.CREDIT, 'amount': 5000},
+            {'type': Transaction.DEBIT, 'amount': 0, 'notes': ''},
+        ])
+        self.transactions = Transaction.get_transactions(self.ledger)
+
+    def render(self, serializer_class, transactions):
+        return JSONRenderer().render(serializer_class(transactions, many=True).data)
+
+    def test_renders_same_json_as_list_serializer(self):
+        expected = self.render(ListTransactionSerializer, list(self.transactions))
+        result = self.render(
+            FastListTransactionSerializer,
+            list(self.transactions.values(*FastListTransactionSerializer.FIELDS)),
+        )
+
+        self.assertEqual(result, expected)
+
+    def test_renders_same_json_in_other_timezone(self):
+        with timezone.override('Asia/Jakarta'):
+            expected = self.render(ListTransactionSerializer, list(self.transactions))
+            result = self.render(
+                FastListTransactionSerializer,
+                list(self.transactions.values(*FastListTransactionSerializer.FIELDS)),
+            )
+
+        self.assertEqual(result, expected)
+        self.assertIn(b'+07:00', result)
+
+    def test_list_response(self):
+        client = APIClient()
+        client.force_authenticate(self.ledger.user)
+        response = client.get(f'/api/v1/ledgers/{self.ledger.id}/transactions/')
+
+        expected = ListTransactionSerializer(list(self.transactions), many=True).data
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+
+class CreateBulkTransactionSerializerTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.ledger.create_transactions([{'type': Transaction.CREDIT, 'amount': 50000, 'reference': 'top-up-1'}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.ledger.user)
+        self.url = f'/api/v1/ledgers/{self.ledger.id}/transactions/bulk/'
+
+    def test_bulk_create(self):
+        response = self.client.post(self.url, {'transactions': [
+            {'type': Transaction.CREDIT, 'amount': 10000, 'reference': 'top-up-2'},
+            {'type': Transaction.DEBIT, 'amount': 5000},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.get_transactions(self.ledger).count(), 3)
+
+    def test_bulk_create_reject_existing_and_duplicate_references(self):
+        response = self.client.post(self.url, {'transactions': [
+            {'type': Transaction.CREDIT, 'amount': 10000, 'reference': 'top-up-2'},
+            {'type': Transaction.CREDIT, 'amount': 10000, 'reference': 'top-up-1'},
+            {'type': Transaction.DEBIT, 'amount': 5000},
+            {'type': Transaction.CREDIT, 'amount': 10000, 'reference': 'top-up-3'},
+            {'type': Transaction.CREDIT, 'amount': 10000, 'reference': 'top-up-3'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'transactions': [
+            {},
+            {'reference': [messages.LEDGER_TRANSACTION_REFERENCE_EXISTS]},
+            {},
+            {'reference': [messages.LEDGER_TRANSACTION_DUPLICATE_REFERENCE]},
+            {'reference': [messages.LEDGER_TRANSACTION_DUPLICATE_REFERENCE]},
+        ]})
+        self.assertEqual(Transaction.get_transactions(self.ledger).count(), 1)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.ledgers.models import LedgerBalanceSnapshot, Transaction
+from apps.ledgers.tests.factories import create_ledger
+
+
+class LedgerBalanceSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.ledger = create_ledger()
+        self.now = timezone.now()
+        # 3 days ago: 10000, 2 days ago: 25000, today: 20000
+        self.post(Transaction.CREDIT, 10000, days=3)
+        self.post(Transaction.CREDIT, 20000, days=2)
+        self.post(Transaction.DEBIT, 5000, days=2, hours=-1)
+        self.post(Transaction.DEBIT, 5000, days=0)
+
+    def post(self, type, amount, days, hours=0):
+        if type == Transaction.CREDIT:
+            transaction = self.ledger.create_credit_transaction(amount=amount)
+        else:
+            transaction = self.ledger.create_debit_transaction(amount=amount)
+        created_at = self.now - timedelta(days=days, hours=hours)
+        Transaction.objects.filter(id=transaction.id).update(created_at=created_at)
+
+    def test_build_method(self):
+        snapshots = LedgerBalanceSnapshot.build(self.ledger)
+
+        self.assertEqual([snapshot.balance for snapshot in snapshots], [10000, 25000])
+        self.assertEqual(LedgerBalanceSnapshot.build(self.ledger), [])
+
+    def test_build_all_method(self):
+        other_ledgers = [create_ledger() for _ in range(3)]
+        for ledger in other_ledgers:
+            transaction = ledger.create_credit_transaction(amount=7000)
+            Transaction.objects.filter(id=transaction.id).update(created_at=self.now - timedelta(days=2))
+
+        # oldest latest snapshot and first transaction, then a select for each of the 3 days and an
+        # insert for the 2 of them with transactions, whatever the number of ledgers
+        with self.assertNumQueries(7):
+            created = LedgerBalanceSnapshot.build_all()
+
+        self.assertEqual(created, 5)
+        self.assertEqual(
+            list(LedgerBalanceSnapshot.objects.filter(ledger=self.ledger).order_by('date').values_list('balance', flat=True)),
+            [10000, 25000],
+        )
+        self.assertEqual(
+            set(LedgerBalanceSnapshot.objects.filter(ledger__in=other_ledgers).values_list('balance', flat=True)),
+            {7000},
+        )
+        self.assertEqual(LedgerBalanceSnapshot.build_all(), 0)
+
+    def test_build_all_method_after_build_ran_ahead(self):
+        other_ledger = create_ledger()
+        transaction = other_ledger.create_credit_transaction(amount=7000)
+        Transaction.objects.filter(id=transaction.id).update(created_at=self.now - timedelta(days=3))
+        LedgerBalanceSnapshot.build(self.ledger)
+
+        self.assertEqual(LedgerBalanceSnapshot.build_all(), 1)
+        self.assertEqual(LedgerBalanceSnapshot.objects.get(ledger=other_ledger).balance, 7000)
+
+    def test_build_day_method_take_last_transaction_by_created_at(self):
+        # the higher id was posted earlier in the day
+        day_start = LedgerBalanceSnapshot.get_day_start(timezone.localtime(self.now - timedelta(days=5)).date())
+        ledger = create_ledger()
+        first = ledger.create_credit_transaction(amount=1000)
+        second = ledger.create_credit_transaction(amount=2000)
+        Transaction.objects.filter(id=first.id).update(created_at=day_start + timedelta(hours=2))
+        Transaction.objects.filter(id=second.id).update(created_at=day_start + timedelta(hours=1))
+
+        LedgerBalanceSnapshot.build_day(day_start.date())
+
+        snapshot = LedgerBalanceSnapshot.objects.get(ledger=ledger)
+        self.assertEqual(snapshot.last_transaction_id, first.id)
+        self.assertEqual(snapshot.balance, 1000)
+
+    def test_build_day_method_skip_existing_snapshots(self):
+        LedgerBalanceSnapshot.build(self.ledger)
+        day = timezone.localtime(self.now - timedelta(days=2)).date()
+
+        self.assertEqual(LedgerBalanceSnapshot.build_day(day), 0)
+        self.assertEqual(LedgerBalanceSnapshot.objects.count(), 2)
+
+    def test_get_balance_at_method(self):
+        LedgerBalanceSnapshot.build(self.ledger)
+
+        self.assertEqual(self.ledger.get_balance_at(self.now - timedelta(days=4)), 0)
+        self.assertEqual(self.ledger.get_balance_at(self.now - timedelta(days=3)), 10000)
+        self.assertEqual(self.ledger.get_balance_at(self.now - timedelta(days=2)), 30000)
+        self.assertEqual(self.ledger.get_balance_at(self.now - timedelta(days=1)), 25000)
+        self.assertEqual(self.ledger.get_balance_at(self.now), 20000)
+
+    def test_get_balance_at_method_without_snapshot(self):
+        self.assertEqual(self.ledger.get_balance_at(self.now - timedelta(days=1)), 25000)
+        self.assertEqual(self.ledger.get_balance_at(self.now), 20000)
+
+    def test_balance_endpoint(self):
+        LedgerBalanceSnapshot.build(self.ledger)
+        client = APIClient()
+        client.force_authenticate(self.ledger.user)
+        url = f'/api/v1/ledgers/{self.ledger.id}/balance/'
+
+        response = client.get(url, {'at': (self.now - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.json()['balance'], 25000)
+
+        response = client.get(url)
+        self.assertEqual(response.json()['balance'], 20000)
+
+        response = client.get(url, {'at': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
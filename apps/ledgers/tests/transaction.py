@@ -63,6 +63,44 @@ class TransactionTestCase(TestCase):
 
         self.assertEqual(len(result), 5)
     
+    def test_get_transactions_method_with_search_keyword_in_other_fields(self):
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000, account_name='Budi Santoso')
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000, account_number='0012345678')
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000, reference='cashback_100%')
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+
+        self.assertEqual(len(Transaction.get_transactions(self.ledger, search_keyword='santos')), 1)
+        self.assertEqual(len(Transaction.get_transactions(self.ledger, search_keyword='2345')), 1)
+        self.assertEqual(len(Transaction.get_transactions(self.ledger, search_keyword='_100%')), 1)
+        self.assertEqual(len(Transaction.get_transactions(self.ledger, search_keyword='k_1')), 1)
+        self.assertEqual(len(Transaction.get_transactions(self.ledger, search_keyword='a_b')), 0)
+
+    def test_get_transactions_method_with_transaction_id(self):
+        transaction = Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+        other_transaction = Transaction.create_credit_transaction(
+            ledger=self.ledger, amount=10000, account_number=transaction.id,
+        )
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+        result = Transaction.get_transactions(self.ledger, search_keyword=transaction.id)
+
+        self.assertEqual(list(result), [transaction, other_transaction])
+
+    def test_get_transactions_method_with_exact_reference(self):
+        transaction = Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+        other_transaction = Transaction.create_credit_transaction(
+            ledger=self.ledger, amount=10000, notes=f'Refund {transaction.reference}',
+        )
+        result = Transaction.get_transactions(self.ledger, search_keyword=transaction.reference)
+
+        self.assertEqual(list(result), [transaction, other_transaction])
+
+    def test_get_transactions_method_with_reference(self):
+        transaction = Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+        Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
+        result = Transaction.get_transactions(self.ledger, search_keyword=transaction.reference[:8])
+
+        self.assertEqual(list(result), [transaction])
+
     def test_get_transaction_method(self):
         transaction = Transaction.create_credit_transaction(ledger=self.ledger, amount=10000)
         result = Transaction.get_transaction(transaction.id)
@@ -143,16 +181,6 @@ class TransactionTestCase(TestCase):
 
         self.assertEqual(1, transaction.get_transaction_number())
     
-    def test_get_last_transaction_method(self):
-        transaction = Transaction.create_credit_transaction(
-            ledger=self.ledger,
-            amount=10000,
-        )
-        ledger_transaction = Transaction(ledger=self.ledger)
-        result = ledger_transaction.get_last_transaction(timezone.now())
-
-        self.assertEqual(result, transaction)
-    
     def test_is_debit_property(self):
         transaction = Transaction(type=Transaction.DEBIT)
 
@@ -1,37 +1,102 @@
+import asyncio
+import httpx
+import logging
 import string
 import random
 import requests
+import threading
+import time
 import uuid
+import weakref
+from asgiref.sync import sync_to_async
+from typing import Union
 from django.conf import settings
 from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from apps.utils.decorators import cache_result
+from apps.utils.instrumentation import record_http
+from apps.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
 
 
 class InstamoneyError(Exception):
     pass
 
 def handle_error(default=None):
+    def check(response):
+        if hasattr(response, 'status_code') and not str(response.status_code).startswith('2'):
+            json_response = response.json()
+            raise InstamoneyError(json_response.get("error_code"))
+        return response
+
+    def fail(error):
+        print("error instamoney: ", error)
+        if default is not None:
+            return default
+        raise InstamoneyError("Service unavailable.")
+
     def wrapper(func):
+        if asyncio.iscoroutinefunction(func):
+            async def async_inner(*args, **kwargs):
+                try:
+                    return check(await func(*args, **kwargs))
+                except Exception as error:
+                    return fail(error)
+            return async_inner
+
         def inner(*args, **kwargs):
             try:
-                response = func(*args, **kwargs)
-                if hasattr(response, 'status_code') and not str(response.status_code).startswith('2'):
-                    json_response = response.json()
-                    raise InstamoneyError(json_response.get("error_code"))
-                return response
-
+                return check(func(*args, **kwargs))
             except Exception as error:
-                print("error instamoney: ", error)
-                if default is not None:
-                    return default
-                raise InstamoneyError("Service unavailable.")
+                return fail(error)
         return inner
     return wrapper
 
+
+request_seconds = registry.histogram('instamoney_request_seconds', 'Instamoney request latency by call', ('call',))
+request_errors = registry.counter('instamoney_request_errors_total', 'Failed or non-2xx Instamoney requests by call', ('call',))
+
+
+class LatencyMetrics:
+    # per call count, errors and latency of the requests made in this process, also kept in the metrics registry
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, name: str, elapsed: float, error: bool = False):
+        request_seconds.observe(elapsed, call=name)
+        if error:
+            request_errors.inc(call=name)
+        with self.lock:
+            call = self.calls.setdefault(name, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+            call['count'] += 1
+            call['errors'] += int(error)
+            call['total'] += elapsed
+            call['max'] = max(call['max'], elapsed)
+
+    def get(self, name: str):
+        with self.lock:
+            return dict(self.calls.get(name, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0}))
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+
+
+latency_metrics = LatencyMetrics()
+
+
 class Instamoney:
     SECRET_KEY = settings.INSTAMONEY_SECRET_KEY
-    BASE_URL = 'https://api.instamoney.co'
+    BASE_URL = settings.INSTAMONEY_BASE_URL
+    # only these are retried, posting twice could create two virtual accounts
+    RETRY_METHODS = frozenset(['GET', 'HEAD'])
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    session = None
+    session_lock = threading.Lock()
 
     def get_auth(self):
         return (self.SECRET_KEY, '')
@@ -41,13 +106,65 @@ class Instamoney:
         if str(token) != str(settings.INSTAMONEY_WEBHOOK_VERIFICATION_TOKEN):
             raise InstamoneyError('Invalid callback token')
 
+    @classmethod
+    def get_session(cls):
+        # one keep-alive connection pool per process, shared by every client instance
+        if Instamoney.session is None:
+            with Instamoney.session_lock:
+                if Instamoney.session is None:
+                    Instamoney.session = cls.build_session()
+        return Instamoney.session
+
+    @classmethod
+    def build_session(cls):
+        retry = Retry(
+            total=settings.INSTAMONEY_MAX_RETRIES,
+            backoff_factor=settings.INSTAMONEY_RETRY_BACKOFF,
+            allowed_methods=cls.RETRY_METHODS,
+            status_forcelist=cls.RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings.INSTAMONEY_POOL_SIZE,
+            pool_maxsize=settings.INSTAMONEY_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @classmethod
+    def close_session(cls):
+        with Instamoney.session_lock:
+            if Instamoney.session is not None:
+                Instamoney.session.close()
+                Instamoney.session = None
+
+    def request(self, name: str, method: str, path: str, **kwargs):
+        kwargs.setdefault('auth', self.get_auth())
+        kwargs.setdefault('timeout', (settings.INSTAMONEY_CONNECT_TIMEOUT, settings.INSTAMONEY_READ_TIMEOUT))
+        started_at = time.perf_counter()
+        error = True
+        try:
+            response = self.get_session().request(method, f"{self.BASE_URL}{path}", **kwargs)
+            error = not str(response.status_code).startswith('2')
+            return response
+        finally:
+            elapsed = time.perf_counter() - started_at
+            latency_metrics.record(name, elapsed, error)
+            record_http(elapsed)
+            logger.info("instamoney %s took %.3fs%s", name, elapsed, " (failed)" if error else "")
+
+
 class RNE(Instamoney):
 
-    @cache_result('instamoney-banks')
-    @handle_error(default=[])
     def list_banks(self):
-        url = f"{self.BASE_URL}/available_virtual_account_banks"
-        response = requests.get(url, auth=self.get_auth())
+        return bank_catalogue.get_banks()
+
+    @handle_error()
+    def fetch_banks(self):
+        response = self.request('list_banks', 'GET', '/available_virtual_account_banks')
         if str(response.status_code).startswith('2'):
             return response.json()
         return response
@@ -61,22 +178,258 @@ class RNE(Instamoney):
                 "id": str(uuid.uuid4()),
             }
         
-        url = f"{self.BASE_URL}/callback_virtual_accounts"
         payload = {
             "name": name,
             "bank_code": bank_code,
             "external_id": external_id,
         }
-        response = requests.post(url, auth=self.get_auth(), json=payload)
+        response = self.request('create_virtual_account', 'POST', '/callback_virtual_accounts', json=payload)
         if str(response.status_code).startswith('2'):
             return response.json()
         return response
 
     def is_valid_bank_code(self, value):
-        found = False
-        banks = self.list_banks()
-        for bank in banks:
-            if bank.get('code') == value:
-                found = True
-                break
-        return found
+        return bank_catalogue.is_valid_code(value)
+
+
+class AsyncInstamoney(Instamoney):
+    """
+    Instamoney client for async views. Calls share one httpx connection pool per event
+    loop, so a single ASGI process keeps up to INSTAMONEY_ASYNC_POOL_SIZE calls in flight.
+    The pool is closed with its loop. Timeouts, retries and latency metrics follow the
+    synchronous client.
+    """
+    # event loop: (client, generator closing it)
+    clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    async def get_client(cls):
+        loop = asyncio.get_running_loop()
+        if loop not in AsyncInstamoney.clients:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.INSTAMONEY_READ_TIMEOUT, connect=settings.INSTAMONEY_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.INSTAMONEY_ASYNC_POOL_SIZE,
+                    max_keepalive_connections=settings.INSTAMONEY_ASYNC_POOL_SIZE,
+                ),
+            )
+            closer = cls.close_with_loop(client)
+            await closer.asend(None)
+            AsyncInstamoney.clients[loop] = (client, closer)
+        return AsyncInstamoney.clients[loop][0]
+
+    @staticmethod
+    async def close_with_loop(client: httpx.AsyncClient):
+        # asyncio.run, asgiref and uvicorn finish the async generators of a loop before
+        # closing it, which closes the client on that loop while it can still run
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    @classmethod
+    async def close_client(cls):
+        entry = AsyncInstamoney.clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    async def request(self, name: str, method: str, path: str, **kwargs):
+        kwargs.setdefault('auth', self.get_auth())
+        retries = settings.INSTAMONEY_MAX_RETRIES if method in self.RETRY_METHODS else 0
+        started_at = time.perf_counter()
+        error = True
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    await asyncio.sleep(settings.INSTAMONEY_RETRY_BACKOFF * 2 ** (attempt - 1))
+                try:
+                    response = await (await self.get_client()).request(method, f"{self.BASE_URL}{path}", **kwargs)
+                except httpx.TransportError:
+                    if attempt == retries:
+                        raise
+                    continue
+                if response.status_code not in self.RETRY_STATUSES or attempt == retries:
+                    break
+            error = not str(response.status_code).startswith('2')
+            return response
+        finally:
+            elapsed = time.perf_counter() - started_at
+            latency_metrics.record(name, elapsed, error)
+            record_http(elapsed)
+            logger.info("instamoney %s took %.3fs%s", name, elapsed, " (failed)" if error else "")
+
+
+class AsyncRNE(AsyncInstamoney):
+
+    async def list_banks(self):
+        return await bank_catalogue.aget_banks()
+
+    @handle_error()
+    async def fetch_banks(self):
+        response = await self.request('list_banks', 'GET', '/available_virtual_account_banks')
+        if str(response.status_code).startswith('2'):
+            return response.json()
+        return response
+
+    @handle_error()
+    async def create_virtual_account(self, name: str, bank_code: str, external_id: str):
+        if settings.TESTING:
+            return {
+                "account_number": "".join(random.choice(string.digits) for _ in range(10)),
+                "external_id": external_id,
+                "id": str(uuid.uuid4()),
+            }
+
+        payload = {
+            "name": name,
+            "bank_code": bank_code,
+            "external_id": external_id,
+        }
+        response = await self.request('create_virtual_account', 'POST', '/callback_virtual_accounts', json=payload)
+        if str(response.status_code).startswith('2'):
+            return response.json()
+        return response
+
+    async def is_valid_bank_code(self, value):
+        return await bank_catalogue.ais_valid_code(value)
+
+
+class BankCatalogue:
+    """
+    Banks of Instamoney indexed by code, kept in process memory and in the shared cache.
+    A list older than INSTAMONEY_BANKS_REFRESH_INTERVAL is still served while a single
+    worker refetches it in the background, and is kept for as long as Instamoney is down.
+    """
+    CACHE_KEY = 'instamoney-banks'
+    LOCK_KEY = 'instamoney-banks:lock'
+    # a failed fetch keeps the lock until it expires, so a down Instamoney is asked once per LOCK_TIMEOUT
+    LOCK_TIMEOUT = 30
+    FAILED = 'failed'
+    # seconds between reads of the shared cache, to pick up lists fetched by other workers
+    CHECK_INTERVAL = 60
+    # how long a worker without any list waits for another worker fetching it
+    COLD_WAIT = 5
+
+    def __init__(self, client: Union[RNE, None] = None, async_client: Union[AsyncRNE, None] = None):
+        self.client = client
+        self.async_client = async_client
+        self.lock = threading.Lock()
+        # (banks, index by code, fetched at) replaced in one assignment
+        self.state = None
+        self.checked_at = None
+        self.refresh_thread = None
+
+    def get_client(self):
+        return self.client or RNE()
+
+    def get_async_client(self):
+        return self.async_client or AsyncRNE()
+
+    def get_banks(self):
+        state = self.load()
+        return state[0] if state else []
+
+    def get_bank(self, code: str):
+        state = self.load()
+        return state[1].get(code) if state else None
+
+    def is_valid_code(self, code: str):
+        return self.get_bank(code) is not None
+
+    async def aget_banks(self):
+        state = await self.aload()
+        return state[0] if state else []
+
+    async def ais_valid_code(self, code: str):
+        state = await self.aload()
+        return state is not None and code in state[1]
+
+    def load(self, fetch: bool = True):
+        now = time.time()
+        if self.state is None or self.checked_at is None or now - self.checked_at >= self.CHECK_INTERVAL:
+            entry = cache.get(self.CACHE_KEY)
+            if entry is None and self.state is None and fetch:
+                entry = self.fetch_first()
+            if entry is not None:
+                self.set(entry)
+            if self.state is not None:
+                self.checked_at = now
+
+        state = self.state
+        if state is not None and now - state[2] >= settings.INSTAMONEY_BANKS_REFRESH_INTERVAL:
+            self.refresh_in_background()
+        return state
+
+    async def aload(self):
+        # like load, but a worker without any list fetches it on the event loop instead of
+        # holding the sync thread that every sync_to_async call of the process shares
+        state = await sync_to_async(self.load)(fetch=False)
+        if state is None:
+            entry = await self.afetch_first()
+            if entry is not None:
+                self.set(entry)
+                self.checked_at = time.time()
+            state = self.state
+        return state
+
+    def set(self, entry: dict):
+        if self.state is None or self.state[2] != entry['fetched_at']:
+            index = {bank.get('code'): bank for bank in entry['banks']}
+            self.state = (entry['banks'], index, entry['fetched_at'])
+
+    def fetch_first(self):
+        if cache.add(self.LOCK_KEY, True, self.LOCK_TIMEOUT):
+            return self.refresh()
+
+        deadline = time.time() + self.COLD_WAIT
+        while time.time() < deadline and cache.get(self.LOCK_KEY) not in (None, self.FAILED):
+            time.sleep(0.05)
+        return cache.get(self.CACHE_KEY)
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refresh_thread is not None and self.refresh_thread.is_alive():
+                return
+            if not cache.add(self.LOCK_KEY, True, self.LOCK_TIMEOUT):
+                return
+            self.refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+            self.refresh_thread.start()
+
+    async def afetch_first(self):
+        if await cache.aadd(self.LOCK_KEY, True, self.LOCK_TIMEOUT):
+            try:
+                banks = await self.get_async_client().fetch_banks()
+            except InstamoneyError:
+                await cache.aset(self.LOCK_KEY, self.FAILED, self.LOCK_TIMEOUT)
+                return None
+            return await sync_to_async(self.store)(banks)
+
+        deadline = time.time() + self.COLD_WAIT
+        while time.time() < deadline and await cache.aget(self.LOCK_KEY) not in (None, self.FAILED):
+            await asyncio.sleep(0.05)
+        return await cache.aget(self.CACHE_KEY)
+
+    def refresh(self):
+        # the caller holds LOCK_KEY
+        try:
+            banks = self.get_client().fetch_banks()
+        except InstamoneyError:
+            cache.set(self.LOCK_KEY, self.FAILED, self.LOCK_TIMEOUT)
+            return None
+        return self.store(banks)
+
+    def store(self, banks: list):
+        # the caller holds LOCK_KEY, released once the list is shared
+        entry = {'banks': banks, 'fetched_at': time.time()}
+        cache.set(self.CACHE_KEY, entry, settings.INSTAMONEY_BANKS_TIMEOUT)
+        cache.delete(self.LOCK_KEY)
+        self.set(entry)
+        self.checked_at = time.time()
+        return entry
+
+    def reset(self):
+        self.state = None
+        self.checked_at = None
+
+
+bank_catalogue = BankCatalogue()
@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive, so reused connections show up as the same client port
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        server: StubServer = self.server.stub
+        server.requests.append((self.command, self.path, self.client_address[1]))
+        if server.responses:
+            status, body, delay = server.responses.pop(0)
+        elif server.handler is not None:
+            status, body, delay = server.handler(self.command, self.path)
+        else:
+            status, body, delay = 200, [], 0
+        if delay:
+            time.sleep(delay)
+
+        content = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, a timeout test
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # hundreds of concurrent connections from load tests
+    request_queue_size = 256
+
+
+class StubServer:
+    """
+    Local http server standing in for Instamoney. Queue `(status, body, delay)` in
+    `responses`, or set `handler(method, path)` returning one for every request.
+    Every request received is kept in `requests` as (method, path, client port).
+    """
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.responses = []
+        self.requests = []
+        self.server = StubHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1 @@
+from .instamoney import *
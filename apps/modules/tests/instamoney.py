@@ -0,0 +1,212 @@
+import asyncio
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from apps.modules.instamoney import RNE, AsyncInstamoney, AsyncRNE, BankCatalogue, Instamoney, InstamoneyError, latency_metrics
+from apps.modules.stub import StubServer
+from apps.utils.decorators import assert_raise_error
+
+
+@override_settings(INSTAMONEY_READ_TIMEOUT=0.5, INSTAMONEY_RETRY_BACKOFF=0, TESTING=False)
+class RNETestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.rne = RNE()
+        self.rne.BASE_URL = self.server.url
+        Instamoney.close_session()
+        latency_metrics.reset()
+
+    def tearDown(self):
+        Instamoney.close_session()
+        self.server.stop()
+
+    def test_fetch_banks_method(self):
+        banks = [{'code': 'BCA', 'name': 'Bank Central Asia'}]
+        self.server.responses = [(200, banks, 0)]
+
+        self.assertEqual(self.rne.fetch_banks(), banks)
+        self.assertEqual(self.server.requests[0][:2], ('GET', '/available_virtual_account_banks'))
+
+    def test_session_reuses_connection(self):
+        self.rne.fetch_banks()
+        self.rne.request('list_banks', 'GET', '/available_virtual_account_banks')
+
+        ports = {port for _, _, port in self.server.requests}
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(ports), 1)
+
+    def test_get_is_retried(self):
+        banks = [{'code': 'BCA'}]
+        self.server.responses = [(503, {}, 0), (502, {}, 0), (200, banks, 0)]
+
+        self.assertEqual(self.rne.fetch_banks(), banks)
+        self.assertEqual(len(self.server.requests), 3)
+
+    @assert_raise_error(InstamoneyError("Service unavailable."))
+    def test_post_is_not_retried(self):
+        self.server.responses = [(503, {'error_code': 'INTERNAL_ERROR'}, 0), (200, {}, 0)]
+        try:
+            self.rne.create_virtual_account('Budi', 'BCA', 'external-id')
+        finally:
+            self.assertEqual(len(self.server.requests), 1)
+
+    @assert_raise_error(InstamoneyError("Service unavailable."))
+    def test_read_timeout(self):
+        self.server.responses = [(200, {}, 2)]
+        self.rne.create_virtual_account('Budi', 'BCA', 'external-id')
+
+    def test_latency_metrics(self):
+        self.server.responses = [(200, [], 0), (500, {}, 0), (500, {}, 0), (500, {}, 0)]
+        self.rne.request('list_banks', 'GET', '/available_virtual_account_banks')
+        self.rne.request('list_banks', 'GET', '/available_virtual_account_banks')
+
+        metrics = latency_metrics.get('list_banks')
+        self.assertEqual(metrics['count'], 2)
+        self.assertEqual(metrics['errors'], 1)
+        self.assertGreater(metrics['max'], 0)
+
+
+@override_settings(INSTAMONEY_READ_TIMEOUT=0.5, INSTAMONEY_RETRY_BACKOFF=0, TESTING=False)
+class AsyncRNETestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.rne = AsyncRNE()
+        self.rne.BASE_URL = self.server.url
+        latency_metrics.reset()
+
+    def tearDown(self):
+        self.server.stop()
+
+    async def test_fetch_banks_method(self):
+        banks = [{'code': 'BCA'}]
+        self.server.responses = [(503, {}, 0), (200, banks, 0)]
+
+        self.assertEqual(await self.rne.fetch_banks(), banks)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(latency_metrics.get('list_banks')['count'], 1)
+        await AsyncInstamoney.close_client()
+
+    async def test_post_is_not_retried(self):
+        self.server.responses = [(503, {'error_code': 'INTERNAL_ERROR'}, 0), (200, {}, 0)]
+
+        with self.assertRaisesMessage(InstamoneyError, "Service unavailable."):
+            await self.rne.create_virtual_account('Budi', 'BCA', 'external-id')
+        self.assertEqual(len(self.server.requests), 1)
+        await AsyncInstamoney.close_client()
+
+    async def test_read_timeout(self):
+        self.server.responses = [(200, {}, 2)]
+
+        with self.assertRaisesMessage(InstamoneyError, "Service unavailable."):
+            await self.rne.create_virtual_account('Budi', 'BCA', 'external-id')
+        await AsyncInstamoney.close_client()
+
+    async def test_concurrent_calls(self):
+        self.server.handler = lambda method, path: (200, {'id': path}, 0.2)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(self.rne.create_virtual_account('Budi', 'BCA', str(number)) for number in range(50)))
+        elapsed = time.perf_counter() - started_at
+
+        self.assertEqual(len(self.server.requests), 50)
+        self.assertLess(elapsed, 2)
+        await AsyncInstamoney.close_client()
+
+    def test_client_is_closed_with_its_loop(self):
+        clients = []
+
+        async def use_client():
+            clients.append(await AsyncInstamoney.get_client())
+            clients.append(await AsyncInstamoney.get_client())
+
+        asyncio.run(use_client())
+
+        self.assertIs(clients[0], clients[1])
+        self.assertTrue(clients[0].is_closed)
+
+
+@override_settings(INSTAMONEY_MAX_RETRIES=0, TESTING=False)
+class BankCatalogueTestCase(SimpleTestCase):
+    BANKS = [{'code': 'BCA', 'name': 'Bank Central Asia'}, {'code': 'BNI', 'name': 'Bank Negara Indonesia'}]
+
+    def setUp(self):
+        self.server = StubServer().start()
+        rne = RNE()
+        rne.BASE_URL = self.server.url
+        self.catalogue = BankCatalogue(rne)
+        self.other_catalogue = BankCatalogue(rne)
+        Instamoney.close_session()
+        cache.delete_many([BankCatalogue.CACHE_KEY, BankCatalogue.LOCK_KEY])
+
+    def tearDown(self):
+        Instamoney.close_session()
+        cache.delete_many([BankCatalogue.CACHE_KEY, BankCatalogue.LOCK_KEY])
+        self.server.stop()
+
+    def wait_for_refresh(self, *catalogues):
+        for catalogue in catalogues:
+            if catalogue.refresh_thread is not None:
+                catalogue.refresh_thread.join()
+
+    def test_is_valid_code_method(self):
+        self.server.responses = [(200, self.BANKS, 0)]
+
+        self.assertTrue(self.catalogue.is_valid_code('BNI'))
+        self.assertFalse(self.catalogue.is_valid_code('XYZ'))
+        self.assertTrue(self.other_catalogue.is_valid_code('BCA'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_failed_fetch_is_not_cached(self):
+        self.server.responses = [(500, {}, 0)]
+
+        self.assertEqual(self.catalogue.get_banks(), [])
+        self.assertEqual(self.other_catalogue.get_banks(), [])
+        self.assertIsNone(cache.get(BankCatalogue.CACHE_KEY))
+        self.assertEqual(len(self.server.requests), 1)
+
+        cache.delete(BankCatalogue.LOCK_KEY)
+        self.server.responses = [(200, self.BANKS, 0)]
+        self.assertEqual(self.catalogue.get_banks(), self.BANKS)
+
+    def test_refresh_in_background(self):
+        self.server.responses = [(200, self.BANKS, 0)]
+        self.catalogue.get_banks()
+        self.other_catalogue.get_banks()
+
+        banks = self.BANKS + [{'code': 'BRI', 'name': 'Bank Rakyat Indonesia'}]
+        self.server.responses = [(200, banks, 0)]
+        with override_settings(INSTAMONEY_BANKS_REFRESH_INTERVAL=0):
+            self.assertEqual(self.catalogue.get_banks(), self.BANKS)
+            self.assertEqual(self.other_catalogue.get_banks(), self.BANKS)
+        self.wait_for_refresh(self.catalogue, self.other_catalogue)
+
+        self.assertTrue(self.catalogue.is_valid_code('BRI'))
+        self.assertEqual(len(self.server.requests), 2)
+
+    async def test_aget_banks_method_fetches_on_the_event_loop(self):
+        self.server.responses = [(200, self.BANKS, 0)]
+        async_rne = AsyncRNE()
+        async_rne.BASE_URL = self.server.url
+        catalogue = BankCatalogue(mock.Mock(fetch_banks=mock.Mock(side_effect=AssertionError)), async_rne)
+        other_catalogue = BankCatalogue(async_client=async_rne)
+
+        self.assertEqual(await catalogue.aget_banks(), self.BANKS)
+        self.assertTrue(await other_catalogue.ais_valid_code('BNI'))
+        self.assertFalse(await other_catalogue.ais_valid_code('XYZ'))
+        self.assertEqual(len(self.server.requests), 1)
+        await AsyncInstamoney.close_client()
+
+    def test_serves_stale_banks_when_unavailable(self):
+        self.server.responses = [(200, self.BANKS, 0)]
+        self.catalogue.get_banks()
+
+        self.server.responses = [(503, {}, 0)]
+        with override_settings(INSTAMONEY_BANKS_REFRESH_INTERVAL=0):
+            self.catalogue.get_banks()
+            self.wait_for_refresh(self.catalogue)
+            self.assertEqual(self.catalogue.get_banks(), self.BANKS)
+
+        self.assertEqual(cache.get(BankCatalogue.CACHE_KEY)['banks'], self.BANKS)
+        self.assertEqual(len(self.server.requests), 2)
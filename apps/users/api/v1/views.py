@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from rest_framework import status
+from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
@@ -9,7 +9,7 @@ from apps.users.api.v1.serializers import (
     CreateUserSerializer,
     LoginSerializer,
 )
-from apps.users.models import User as UserModel
+from apps.users.models import RevokedToken, User as UserModel
 
 User: UserModel = get_user_model()
 
@@ -28,8 +28,8 @@ class AuthView(GenericViewSet):
             name=validated_data['name'],
             email=validated_data['email'],
             password=validated_data['password'],
+            logged_in=True,
         )
-        user.update_last_login()
 
         response_serializer = self.serializer_class(user, context=self.get_serializer_context())
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -46,5 +46,10 @@ class AuthView(GenericViewSet):
         response_serializer = self.serializer_class(user, context=self.get_serializer_context())
         return Response(response_serializer.data)
 
+    @action(methods=['post'], detail=False, permission_classes=(permissions.IsAuthenticated,))
+    def logout(self, request):
+        RevokedToken.revoke(request.auth)
+        return Response(None)
+
 
 auth_view = AuthView
@@ -0,0 +1,42 @@
+import hashlib
+import time
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.users.models import User
+from apps.utils import messages
+from apps.utils.caching import MISSING, LocalCache
+
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication with revocable tokens. Verified tokens are kept by their hash until
+    they expire, so the signature is checked once per token and process, which is all the
+    cache saves. Every request still runs one query, as many as loading the user would:
+    whether the user is still active and the token not revoked is read from the database,
+    on indexed columns, so a logout or a disabled user applies to every process at once.
+    `request.user` is a TokenUser built from the claims.
+    """
+    tokens = LocalCache(settings.AUTH_TOKEN_CACHE_SIZE, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+    def get_validated_token(self, raw_token: bytes):
+        key = hashlib.sha256(raw_token).hexdigest()
+        validated_token = self.tokens.get(key)
+        if validated_token is MISSING:
+            validated_token = super().get_validated_token(raw_token)
+            self.tokens.set(key, validated_token, timeout=validated_token['exp'] - time.time())
+        return validated_token
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        state = User.get_token_state(user.id, validated_token.get(api_settings.JTI_CLAIM))
+        if state is None:
+            raise AuthenticationFailed(messages.USER_NOT_FOUND, code='user_not_found')
+        is_active, is_revoked = state
+        if not is_active:
+            raise AuthenticationFailed(messages.USER_INACTIVE, code='user_inactive')
+        if is_revoked:
+            raise AuthenticationFailed(messages.USER_TOKEN_REVOKED, code='token_revoked')
+        return user
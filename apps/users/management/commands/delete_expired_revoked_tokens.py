@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.users.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Delete revoked tokens that have expired and are rejected anyway"
+
+    def handle(self, *args, **options):
+        deleted = RevokedToken.delete_expired()
+        self.stdout.write(f"deleted {deleted} revoked tokens")
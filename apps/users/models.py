@@ -1,9 +1,14 @@
 from django.db import models
+from django.db.models import Exists
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from rest_framework.exceptions import NotFound
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
 
 from apps.utils import messages
+from apps.utils.caching import memoize
+from apps.utils.models import BaseModel
 
 class User(AbstractUser):
     email = models.EmailField(unique=True, db_index=True)
@@ -29,11 +34,14 @@ class User(AbstractUser):
         return f'{self.first_name} {self.last_name}'.strip()
 
     @classmethod
-    def create(cls, name: str, email: str, password: str):
+    def create(cls, name: str, email: str, password: str, logged_in: bool = False):
         user = cls(is_active=True)
         user.set_name(name)
         user.set_email(email)
         user.set_password(password)
+        if logged_in:
+            # set with the insert instead of update_last_login right after it
+            user.last_login = timezone.now()
         user.save()
         return user
 
@@ -46,14 +54,38 @@ class User(AbstractUser):
     
     @classmethod
     def get_by_id(cls, value: id, raise_exception: bool = False):
-        user = cls.objects.filter(id=value).first()
+        user = cls.get_cached_user(value)
         if not user and raise_exception:
             raise NotFound(messages.USER_NOT_FOUND)
         return user
 
+    @staticmethod
+    @memoize('users', key=str)
+    def get_cached_user(id):
+        return User.objects.filter(id=id).first()
+
+    @classmethod
+    def get_token_state(cls, id, jti: str):
+        # whether the user is active and whether the token is revoked, checked on every
+        # authenticated request instead of loading the user. one query on the primary key and
+        # the unique jti, None when the user is gone
+        return cls.objects.filter(id=id).annotate(
+            is_revoked=Exists(RevokedToken.objects.filter(jti=jti)),
+        ).values_list('is_active', 'is_revoked').first()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        User.get_cached_user.invalidate(self.id)
+
+    def delete(self, *args, **kwargs):
+        id = self.id
+        result = super().delete(*args, **kwargs)
+        User.get_cached_user.invalidate(id)
+        return result
+
     def update_last_login(self):
         self.last_login = timezone.now()
-        self.save()
+        self.save(update_fields=['last_login'])
 
     @classmethod
     def authenticate(cls, email: str, password: str):
@@ -61,3 +93,25 @@ class User(AbstractUser):
         if user is None or not user.check_password(password):
             raise NotFound(messages.USER_AUTHENTICATION_FAILED)
         return user
+
+
+class RevokedToken(BaseModel):
+    # access tokens rejected before they expire, by their jti claim
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='revoked_tokens')
+    expires_at = models.DateTimeField(db_index=True)
+
+    @classmethod
+    def revoke(cls, token):
+        revoked_token = cls(
+            jti=token[api_settings.JTI_CLAIM],
+            user_id=token[api_settings.USER_ID_CLAIM],
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+        cls.objects.bulk_create([revoked_token], ignore_conflicts=True)
+        return revoked_token
+
+    @classmethod
+    def delete_expired(cls):
+        # an expired token fails verification before its jti is looked up
+        return cls.objects.filter(expires_at__lte=timezone.now()).delete()[0]
\ No newline at end of file
@@ -1 +1,2 @@
+from .authentication import *
 from .user import *
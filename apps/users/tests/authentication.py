@@ -0,0 +1,109 @@
+import io
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.ledgers.models import Ledger
+from apps.users.authentication import CachedJWTAuthentication
+from apps.users.models import RevokedToken, User
+from apps.users.tests.factories import create_user
+from apps.utils import messages
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.token = AccessToken.for_user(self.user)
+        self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.authentication = CachedJWTAuthentication()
+
+    def test_authenticate_method(self):
+        user, token = self.authentication.authenticate(self.request)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token['jti'], self.token['jti'])
+
+    def test_authenticate_method_with_one_query(self):
+        self.authentication.authenticate(self.request)
+
+        with self.assertNumQueries(1):
+            user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_authenticate_method_verifies_token_once(self):
+        self.authentication.authenticate(self.request)
+
+        with mock.patch.object(JWTAuthentication, 'get_validated_token') as get_validated_token:
+            self.authentication.authenticate(self.request)
+        get_validated_token.assert_not_called()
+
+    def test_authenticate_method_with_inactive_user(self):
+        self.authentication.authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_authenticate_method_with_revoked_token(self):
+        self.authentication.authenticate(self.request)
+        RevokedToken.revoke(self.token)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_authenticate_method_with_changes_of_other_processes(self):
+        self.authentication.authenticate(self.request)
+        # written without going through the models, like another process would
+        RevokedToken.objects.create(jti=self.token['jti'], user=self.user, expires_at=self.user.date_joined)
+
+        with self.assertRaisesMessage(AuthenticationFailed, str(messages.USER_TOKEN_REVOKED)):
+            self.authentication.authenticate(self.request)
+
+        RevokedToken.objects.all().delete()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        with self.assertRaisesMessage(AuthenticationFailed, str(messages.USER_INACTIVE)):
+            self.authentication.authenticate(self.request)
+
+    def test_authenticate_method_with_deleted_user(self):
+        self.authentication.authenticate(self.request)
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_ledger_request_without_user_query(self):
+        ledger = Ledger.create(self.user, self.user.name, 'BNI')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        client.get(f'/api/v1/ledgers/{ledger.id}/')
+
+        # the token state and the ledger row, within the savepoint and release of the request
+        # transaction
+        with self.assertNumQueries(4):
+            response = client.get(f'/api/v1/ledgers/{ledger.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.post('/api/v1/users/auth/logout/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.post('/api/v1/users/auth/logout/').status_code, 401)
+
+    def test_delete_expired_revoked_tokens_command(self):
+        RevokedToken.revoke(self.token)
+        RevokedToken.objects.create(jti='expired', user=self.user, expires_at=timezone.now() - timedelta(minutes=1))
+        output = io.StringIO()
+
+        call_command('delete_expired_revoked_tokens', stdout=output)
+
+        self.assertEqual(output.getvalue(), 'deleted 1 revoked tokens\n')
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), [self.token['jti']])
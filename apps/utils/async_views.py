@@ -0,0 +1,74 @@
+import json
+from asgiref.sync import sync_to_async
+from functools import wraps
+from django.db import transaction as db_transaction
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, MethodNotAllowed, NotAuthenticated, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+
+def async_api_view(methods: list, authenticated: bool = True):
+    """
+    Async view for I/O-bound endpoints, answering like the DRF views around it:
+    authenticated by the DRF authentication classes, with DRF exceptions rendered the
+    same way. The view is left out of ATOMIC_REQUESTS, so database work goes through
+    `sync_to_async` in its own transaction instead of staying open while awaiting.
+    """
+    def wrapper(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                if authenticated:
+                    request.user = await authenticate(request)
+                if request.method not in ('GET', 'HEAD'):
+                    request.data = get_data(request)
+                return await func(request, *args, **kwargs)
+            except Exception as error:
+                return handle_exception(request, error)
+
+        inner.csrf_exempt = True
+        return db_transaction.non_atomic_requests(inner)
+    return wrapper
+
+
+async def authenticate(request):
+    authentications = [authentication_class() for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    for authentication in authentications:
+        result = await sync_to_async(authentication.authenticate)(request)
+        if result is not None:
+            return result[0]
+    raise NotAuthenticated()
+
+
+def get_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as error:
+            raise ParseError(f'JSON parse error - {error}')
+    return request.POST.dict()
+
+
+def render(data, status: int = status.HTTP_200_OK, headers: dict = None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+        headers=headers,
+    )
+
+
+def handle_exception(request, error: Exception):
+    if isinstance(error, (NotAuthenticated, AuthenticationFailed)):
+        authentication_class = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]
+        error.auth_header = authentication_class().authenticate_header(request)
+    response = exception_handler(error, {'request': request})
+    if response is None:
+        raise error
+    headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+    return render(response.data, status=response.status_code, headers=headers)
@@ -0,0 +1,206 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+
+from apps.utils.instrumentation import record_cache
+from apps.utils.metrics import registry
+
+MISSING = object()
+# stored in place of None, the shared cache cannot tell a cached None from a miss
+NONE = '__none__'
+
+cache_lookups = registry.counter('cache_lookups_total', 'Memoized lookups by cache and outcome', ('cache', 'outcome'))
+
+
+def get_hit_ratios(values: dict):
+    # hits over lookups of every cache, local and shared hits alike
+    lookups = {}
+    hits = {}
+    for (name, labels), count in values.items():
+        if name != cache_lookups.name:
+            continue
+        cache_name, outcome = labels
+        lookups[cache_name] = lookups.get(cache_name, 0) + count
+        if outcome != 'misses':
+            hits[cache_name] = hits.get(cache_name, 0) + count
+    return {(cache_name,): hits.get(cache_name, 0) / count for cache_name, count in lookups.items() if count}
+
+
+registry.derive('cache_hit_ratio', 'Memoized lookups answered from a cache', ('cache',), get_hit_ratios)
+
+
+class LocalCache:
+    """
+    Least recently used values of one process, at most `size` of them, each expiring
+    `timeout` seconds after it was set unless set with its own timeout. Values are kept
+    pickled, so callers changing a returned object never change the cached one.
+    """
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+
+    def get(self, key: str):
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                return MISSING
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self.values[key]
+                return MISSING
+            self.values.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key: str, value, timeout: float = None):
+        if timeout is None:
+            timeout = self.timeout
+        value = pickle.dumps(value)
+        with self.lock:
+            self.values[key] = (time.monotonic() + timeout, value)
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class CacheStats:
+    OUTCOMES = ('local_hits', 'shared_hits', 'misses')
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, outcome: str, elapsed: float):
+        with self.lock:
+            self.counts[outcome] += 1
+            self.times[outcome] += elapsed
+        if self.name is not None:
+            cache_lookups.inc(cache=self.name, outcome=outcome)
+
+    def get(self):
+        with self.lock:
+            stats = dict(self.counts)
+            for outcome in self.OUTCOMES:
+                count = self.counts[outcome]
+                stats[f'{outcome}_time'] = self.times[outcome] / count if count else 0
+            return stats
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(self.OUTCOMES, 0)
+            self.times = dict.fromkeys(self.OUTCOMES, 0.0)
+
+
+def make_key(*args, **kwargs):
+    key = ':'.join([str(arg) for arg in args] + [f'{name}={kwargs[name]}' for name in sorted(kwargs)])
+    if len(key) > 200 or any(character.isspace() for character in key):
+        key = hashlib.md5(key.encode()).hexdigest()
+    return key
+
+
+def memoize(
+    prefix: str,
+    timeout: int = None,
+    local_timeout: float = None,
+    local_size: int = None,
+    key=make_key,
+    versioned: bool = False,
+):
+    """
+    Cache the result of `func` by its arguments in process memory, in front of the shared cache.
+    `key` builds the part of the cache key from the arguments. None results are cached too.
+    `func.invalidate(*args)` drops the result of one call, again once the transaction commits.
+    `func.invalidate_all()` drops every result held by this process. With `versioned`, every
+    call reads the version of `prefix` from the shared cache and `invalidate_all` bumps it,
+    so the shared results and those held by other processes are dropped as well.
+    """
+    if timeout is None:
+        timeout = settings.MEMOIZE_TIMEOUT
+    if local_timeout is None:
+        local_timeout = settings.MEMOIZE_LOCAL_TIMEOUT
+    if local_size is None:
+        local_size = settings.MEMOIZE_LOCAL_SIZE
+    version_key = f'{prefix}:version'
+
+    def get_version():
+        if not versioned:
+            return 0
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, 1, None)
+            version = cache.get(version_key, 1)
+        return version
+
+    def get_cache_key(*args, **kwargs):
+        return f'{prefix}:{get_version()}:{key(*args, **kwargs)}'
+
+    def wrapper(func):
+        local = LocalCache(local_size, local_timeout)
+        stats = CacheStats(prefix)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            started_at = time.perf_counter()
+            cache_key = get_cache_key(*args, **kwargs)
+            value = local.get(cache_key)
+            if value is not MISSING:
+                stats.record('local_hits', time.perf_counter() - started_at)
+                record_cache(hit=True)
+                return value
+
+            value = cache.get(cache_key, MISSING)
+            if value is not MISSING:
+                value = None if value == NONE else value
+                local.set(cache_key, value)
+                stats.record('shared_hits', time.perf_counter() - started_at)
+                record_cache(hit=True)
+                return value
+
+            value = func(*args, **kwargs)
+            cache.set(cache_key, NONE if value is None else value, timeout)
+            local.set(cache_key, value)
+            stats.record('misses', time.perf_counter() - started_at)
+            record_cache(hit=False)
+            return value
+
+        def delete(cache_key):
+            local.delete(cache_key)
+            cache.delete(cache_key)
+
+        def invalidate(*args, **kwargs):
+            cache_key = get_cache_key(*args, **kwargs)
+            delete(cache_key)
+            # a read inside the transaction may have cached what it wrote before commit
+            if db_transaction.get_connection().in_atomic_block:
+                db_transaction.on_commit(lambda: delete(cache_key))
+
+        def invalidate_all():
+            if versioned:
+                try:
+                    cache.incr(version_key)
+                except ValueError:
+                    cache.add(version_key, 1, None)
+            local.clear()
+
+        inner.invalidate = invalidate
+        inner.invalidate_all = invalidate_all
+        inner.local = local
+        inner.stats = stats
+        return inner
+    return wrapper
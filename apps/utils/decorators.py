@@ -1,5 +1,4 @@
 from django.test import TestCase
-from django.core.cache import cache
 
 def assert_raise_error(expected_error):
     def wrapper(func):
@@ -14,16 +13,3 @@ def assert_raise_error(expected_error):
         return inner
     return wrapper
 
-
-def cache_result(key: str, timeout=None):
-    def wrapper(func):
-        def inner(*args, **kwargs):
-            cached_result = cache.get(key)
-            if cached_result:
-                return cached_result
-            
-            result = func(*args, **kwargs)
-            cache.set(key, result, timeout)
-            return result
-        return inner
-    return wrapper
@@ -0,0 +1,65 @@
+import hashlib
+import json
+from functools import wraps
+from django.db import transaction as db_transaction
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from apps.utils import messages
+from apps.utils.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENT_REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def get_idempotency_key(request):
+    return request.headers.get(IDEMPOTENCY_KEY_HEADER)
+
+
+def get_fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.path}:{payload}".encode()).hexdigest()
+
+
+def idempotent(scope: str, get_key=get_idempotency_key):
+    """
+    Replay the stored response of a request that was already handled with the same key.
+    The first request claims the key with a row inserted in its own transaction, so a
+    duplicate arriving while it runs waits on the unique constraint and replays what the
+    first one stored, or takes over the key if it rolled back. Only successful responses
+    are kept.
+    """
+    def wrapper(func):
+        @wraps(func)
+        def inner(view, request, *args, **kwargs):
+            key = get_key(request)
+            if not key:
+                return func(view, request, *args, **kwargs)
+
+            user_id = request.user.pk if request.user and request.user.is_authenticated else ''
+            key = hashlib.sha256(f"{user_id}:{key}".encode()).hexdigest()
+            fingerprint = get_fingerprint(request)
+            with db_transaction.atomic(savepoint=False):
+                idempotency_key, claimed = IdempotencyKey.claim(scope, key, fingerprint)
+                if not claimed:
+                    return replay(idempotency_key, fingerprint)
+
+                response = func(view, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    idempotency_key.store(response.status_code, response.data)
+                else:
+                    idempotency_key.delete()
+                return response
+        return inner
+    return wrapper
+
+
+def replay(idempotency_key: IdempotencyKey, fingerprint: str):
+    if idempotency_key.fingerprint != fingerprint:
+        raise ValidationError(messages.IDEMPOTENCY_KEY_REUSED)
+    return Response(
+        idempotency_key.data,
+        status=idempotency_key.status,
+        headers={IDEMPOTENT_REPLAYED_HEADER: 'true'},
+    )
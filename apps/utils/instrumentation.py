@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# metrics of the request being handled, copied into threads by sync_to_async
+current_metrics = ContextVar('current_metrics', default=None)
+
+SLOWEST_SQL_LENGTH = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    """
+    Counters of one request. sync_to_async threads and concurrent tasks of the request
+    record into the same instance, so every update holds the lock.
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_sql = None
+        self.slowest_sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.http_calls = 0
+        self.http_time = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def record_query(self, sql: str, elapsed: float):
+        with self.lock:
+            self.queries += 1
+            self.sql_time += elapsed
+            if elapsed >= self.slowest_sql_time:
+                self.slowest_sql = sql[:SLOWEST_SQL_LENGTH]
+                self.slowest_sql_time = elapsed
+
+    def record_cache(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def record_http(self, elapsed: float):
+        with self.lock:
+            self.http_calls += 1
+            self.http_time += elapsed
+
+    def get(self):
+        return {
+            'duration_ms': round(self.elapsed * 1000, 2),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'slowest_sql_ms': round(self.slowest_sql_time * 1000, 2),
+            'slowest_sql': self.slowest_sql,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'http_calls': self.http_calls,
+            'http_ms': round(self.http_time * 1000, 2),
+        }
+
+    def get_server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.2f};desc="{self.queries} queries"',
+            f'http;dur={self.http_time * 1000:.2f};desc="{self.http_calls} calls"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'total;dur={self.elapsed * 1000:.2f}',
+        ])
+
+
+@contextmanager
+def instrument():
+    """
+    Count the queries, cache lookups and Instamoney calls made within the block,
+    in this thread and in the ones it hands work to with sync_to_async.
+    """
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+    metrics = RequestMetrics()
+    token = current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current_metrics.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started_at)
+
+
+def record_cache(hit: bool):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.record_cache(hit)
+
+
+def record_http(elapsed: float):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.record_http(elapsed)
+
+
+def stream(content, metrics: RequestMetrics):
+    # the server reads a streamed body after the middleware returned, each chunk is
+    # produced with the metrics of the request current again
+    iterator = iter(content)
+    while True:
+        token = current_metrics.set(metrics)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            current_metrics.reset(token)
+        yield chunk
+
+
+async def astream(content, metrics: RequestMetrics):
+    iterator = content.__aiter__()
+    while True:
+        token = current_metrics.set(metrics)
+        try:
+            chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            current_metrics.reset(token)
+        yield chunk
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install)
+
+
+class InstrumentationMiddleware:
+    """
+    Adds the metrics of every request as a Server-Timing header and a JSON log line.
+    Requests over the QUERY_BUDGETS of their view are logged, and raise with
+    QUERY_BUDGETS_STRICT, which is on in tests. Streamed responses are logged and checked
+    when the server closes them, with the queries made while their body was read. Their
+    Server-Timing header only covers the work done before the body.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with instrument() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with instrument() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics: RequestMetrics):
+        response['Server-Timing'] = metrics.get_server_timing()
+        if not response.streaming:
+            self.report(request, response, metrics)
+            return response
+
+        if response.is_async:
+            response.streaming_content = astream(response.streaming_content, metrics)
+        else:
+            response.streaming_content = stream(response.streaming_content, metrics)
+        close = response.close
+
+        def close_and_report():
+            try:
+                close()
+            finally:
+                self.report(request, response, metrics)
+
+        response.close = close_and_report
+        return response
+
+    def report(self, request, response, metrics: RequestMetrics):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            **metrics.get(),
+        }))
+
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and metrics.queries > budget:
+            message = f"{view_name} made {metrics.queries} queries, over its budget of {budget}"
+            if settings.QUERY_BUDGETS_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.utils.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete stored idempotency keys older than IDEMPOTENCY_KEY_TIMEOUT"
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.delete_expired()
+        self.stdout.write(f"deleted {deleted} idempotency keys")
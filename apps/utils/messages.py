@@ -4,11 +4,20 @@ from django.utils.translation import gettext_lazy as _
 USER_NOT_FOUND = _("User not found.")
 USER_ALREADY_EXIST = _("User already exist.")
 USER_AUTHENTICATION_FAILED = _("Invalid email or password.")
+USER_INACTIVE = _("User is inactive.")
+USER_TOKEN_REVOKED = _("Token has been revoked.")
 
 LEDGER_NOT_FOUND = _("Ledger not found.")
 LEDGER_TRANSACTION_ID_CANNOT_BE_CHANGED = _("Id of transaction cannot be changed.")
 LEDGER_TRANSACTION_REFERENCE_CANNOT_BE_CHANGED = _("Refrence id of transaction cannot be changed.")
 LEDGER_TRANSACTION_AMOUNT_CANNOT_BE_CHANGED = _("Amount of transaction cannot be changed.")
+LEDGER_TRANSACTION_DUPLICATE_REFERENCE = _("Reference of transaction must be unique.")
+LEDGER_TRANSACTION_REFERENCE_EXISTS = _("Transaction with this reference already exists.")
+LEDGER_TRANSACTION_ID_EXHAUSTED = _("Transaction id sequence of the day is exhausted.")
 LEDGER_INSUFFICIENT_BALANCE = _("Insufficient balance.")
 LEDGER_TRANSACTION_NOT_FOUND = _("Transaction not found.")
 LEDGER_INVALID_BANK_CODE = _("Invalid bank code.")
+LEDGER_EXPORT_INVALID_DATE_RANGE = _("End date must not be before start date.")
+LEDGER_CALLBACK_PAYMENT_ID_REQUIRED = _("Payment callback must have a payment id.")
+
+IDEMPOTENCY_KEY_REUSED = _("Idempotency key was already used for a different request.")
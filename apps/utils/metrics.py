@@ -0,0 +1,363 @@
+import atexit
+import fcntl
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# counters and histograms of exited processes, folded into one file
+ARCHIVE_NAME = 'metrics-archive.json'
+ARCHIVE_LOCK_NAME = 'metrics-archive.lock'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry: 'Registry', name: str, help: str, labels: tuple = (), buckets: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+
+    def get_key(self, labels: dict):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}, got {tuple(labels)}")
+        return (self.name, tuple(str(labels[name]) for name in self.labels))
+
+    def get_definition(self):
+        return {'type': self.type, 'help': self.help, 'labels': self.labels, 'buckets': self.buckets}
+
+
+class Counter(Metric):
+    type = COUNTER
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry.add(self.get_key(labels), amount)
+
+
+class Gauge(Metric):
+    # summed across the processes that are still alive
+    type = GAUGE
+
+    def set(self, value: float, **labels):
+        self.registry.set(self.get_key(labels), value)
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry.add(self.get_key(labels), amount)
+
+
+class Histogram(Metric):
+    type = HISTOGRAM
+
+    def observe(self, value: float, **labels):
+        self.registry.observe(self.get_key(labels), self.buckets, value)
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+
+class Registry:
+    """
+    Counters, gauges and fixed-bucket histograms of this process. With METRICS_DIR set,
+    every process writes its values to its own file in it at most every
+    METRICS_FLUSH_INTERVAL seconds and on exit, and `render` adds up the files of all
+    of them, so any worker can answer a scrape for the whole server. Files of exited
+    processes are folded into an archive file and deleted, keeping the totals.
+    Recording never raises because of the files, failed writes are logged.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.metrics = {}
+        self.derived = {}
+        self.values = {}
+        self.flushed_at = 0.0
+        self.path = None
+        self.path_owner = None
+
+    def register(self, metric: Metric):
+        with self.lock:
+            registered = self.metrics.setdefault(metric.name, metric)
+        if registered.get_definition() != metric.get_definition():
+            raise ValueError(f"{metric.name} is already registered as another metric")
+        return registered
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(self, name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self.register(Gauge(self, name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(self, name, help, labels, buckets))
+
+    def derive(self, name: str, help: str, labels: tuple, func):
+        # gauge computed at scrape time from the values of every process,
+        # `func(values)` returns its samples as {label values: value}
+        self.derived[name] = (help, tuple(labels), func)
+
+    def add(self, key: tuple, amount: float):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.maybe_flush()
+
+    def set(self, key: tuple, value: float):
+        with self.lock:
+            self.values[key] = value
+        self.maybe_flush()
+
+    def observe(self, key: tuple, buckets: tuple, value: float):
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = {'buckets': [0] * len(buckets), 'count': 0, 'sum': 0.0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['count'] += 1
+            histogram['sum'] += value
+        self.maybe_flush()
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    def get_path(self):
+        if not settings.METRICS_DIR:
+            return None
+        owner = (os.getpid(), settings.METRICS_DIR)
+        if self.path_owner != owner:
+            # a forked worker starts its own file
+            self.path_owner = owner
+            self.path = Path(settings.METRICS_DIR) / f"metrics-{os.getpid()}-{time.time_ns()}.json"
+        return self.path
+
+    def dump(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'metrics': {name: metric.get_definition() for name, metric in self.metrics.items()},
+                'values': [[name, labels, value] for (name, labels), value in self.values.items()],
+            }
+
+    def maybe_flush(self):
+        if not settings.METRICS_DIR or time.monotonic() - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        # a thread finding another one flushing leaves it to that one
+        if self.flush_lock.acquire(blocking=False):
+            try:
+                self.write()
+            finally:
+                self.flush_lock.release()
+
+    def flush(self):
+        with self.flush_lock:
+            self.write()
+
+    def write(self):
+        try:
+            path = self.get_path()
+            if path is None:
+                return
+            self.flushed_at = time.monotonic()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_json(path, self.dump())
+        except Exception:
+            logger.exception("writing metrics failed")
+
+    def load(self):
+        # this process from memory, every other one from its last flush
+        dumps = [self.dump()]
+        path = self.get_path()
+        if path is None:
+            return dumps
+        try:
+            self.archive(path.parent)
+        except Exception:
+            logger.exception("archiving metrics failed")
+        for other_path in path.parent.glob('metrics-*.json'):
+            if other_path == path:
+                continue
+            dump = read_json(other_path)
+            if dump is not None:
+                dumps.append(dump)
+        return dumps
+
+    def archive(self, directory: Path):
+        """
+        Fold the counters and histograms of exited processes into the archive and delete
+        their files. Folded file names are kept in the archive until the files are gone,
+        so a file left behind by a failed delete is not added twice.
+        """
+        archive_path = directory / ARCHIVE_NAME
+        with open(directory / ARCHIVE_LOCK_NAME, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive = read_json(archive_path) or {'pid': None, 'metrics': {}, 'values': [], 'folded': []}
+            folded = set(archive['folded'])
+            dead_paths = []
+            values = {(name, tuple(labels)): value for name, labels, value in archive['values']}
+            for other_path in directory.glob('metrics-*-*.json'):
+                dump = read_json(other_path)
+                if dump is None or is_alive(dump['pid']):
+                    continue
+                dead_paths.append(other_path)
+                if other_path.name in folded:
+                    continue
+                archive['metrics'].update(dump['metrics'])
+                for name, labels, value in dump['values']:
+                    if dump['metrics'].get(name, {}).get('type') != GAUGE:
+                        key = (name, tuple(labels))
+                        values[key] = merge(values.get(key), value)
+            if not dead_paths and not folded:
+                return
+            archive['values'] = [[name, labels, value] for (name, labels), value in values.items()]
+            archive['folded'] = [dead_path.name for dead_path in dead_paths]
+            write_json(archive_path, archive)
+            for dead_path in dead_paths:
+                dead_path.unlink(missing_ok=True)
+
+    def collect(self):
+        definitions = {}
+        values = {}
+        for dump in self.load():
+            # the archive has no pid, and no gauges either
+            alive = dump['pid'] in (None, os.getpid()) or is_alive(dump['pid'])
+            for name, definition in dump['metrics'].items():
+                definitions.setdefault(name, definition)
+            for name, labels, value in dump['values']:
+                if definitions.get(name, {}).get('type') == GAUGE and not alive:
+                    continue
+                key = (name, tuple(labels))
+                values[key] = merge(values.get(key), value)
+        return definitions, values
+
+    def render(self):
+        definitions, values = self.collect()
+        lines = []
+        for name in sorted(definitions):
+            definition = definitions[name]
+            lines += [f"# HELP {name} {definition['help']}", f"# TYPE {name} {definition['type']}"]
+            for (sample_name, labels), value in sorted(values.items()):
+                if sample_name != name:
+                    continue
+                labels = dict(zip(definition['labels'], labels))
+                if definition['type'] == HISTOGRAM:
+                    lines += render_histogram(name, labels, definition['buckets'], value)
+                else:
+                    lines.append(render_sample(name, labels, value))
+        for name in sorted(self.derived):
+            help, label_names, func = self.derived[name]
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {GAUGE}"]
+            for labels, value in sorted(func(values).items()):
+                lines.append(render_sample(name, dict(zip(label_names, labels)), value))
+        return '\n'.join(lines) + '\n'
+
+
+def read_json(path: Path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: Path, data: dict):
+    # written next to `path` under a name of its own, then moved over it in one step
+    descriptor, temporary_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.stem}-', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(data, file)
+        os.replace(temporary_name, path)
+    except BaseException:
+        Path(temporary_name).unlink(missing_ok=True)
+        raise
+
+
+def is_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(current, value):
+    if current is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            'buckets': [a + b for a, b in zip(current['buckets'], value['buckets'])],
+            'count': current['count'] + value['count'],
+            'sum': current['sum'] + value['sum'],
+        }
+    return current + value
+
+
+def render_labels(labels: dict):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render_sample(name: str, labels: dict, value: float):
+    return f"{name}{render_labels(labels)} {float(value)}"
+
+
+def render_histogram(name: str, labels: dict, buckets: list, value: dict):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, value['buckets']):
+        cumulative += count
+        lines.append(render_sample(f'{name}_bucket', {**labels, 'le': float(bound)}, cumulative))
+    lines.append(render_sample(f'{name}_bucket', {**labels, 'le': '+Inf'}, value['count']))
+    lines.append(render_sample(f'{name}_sum', labels, value['sum']))
+    lines.append(render_sample(f'{name}_count', labels, value['count']))
+    return lines
+
+
+def metrics_view(request):
+    """
+    The metrics tell a lot about the traffic, only hosts of METRICS_ALLOWED_IPS get them,
+    with `Authorization: Bearer <METRICS_TOKEN>` once a token is set. Behind a reverse
+    proxy on the same host every request comes from 127.0.0.1, so there the address
+    check lets everyone through and only the token keeps /metrics private.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    if settings.METRICS_TOKEN:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()):
+            return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+registry = Registry()
+atexit.register(registry.flush)
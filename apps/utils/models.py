@@ -1,4 +1,7 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction as db_transaction
 from django.utils import timezone
 
 
@@ -8,3 +11,59 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+    def update(self, **values):
+        # set and write only the columns whose value changed, returns their names
+        update_fields = [field for field, value in values.items() if getattr(self, field) != value]
+        for field in update_fields:
+            setattr(self, field, values[field])
+        if update_fields:
+            self.save(update_fields=update_fields + ['updated_at'])
+        return update_fields
+
+
+class IdempotencyKey(BaseModel):
+    # responses of requests made with an idempotency key. the unique (scope, key) row is
+    # inserted in the request transaction, so a duplicate waits for it on the database
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    status = models.IntegerField(null=True)
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_key_unique'),
+        ]
+
+    @classmethod
+    def get_expires_at(cls):
+        return timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TIMEOUT)
+
+    @classmethod
+    def claim(cls, scope: str, key: str, fingerprint: str):
+        # returns the key and whether it was claimed, an expired key is claimed again
+        try:
+            with db_transaction.atomic():
+                return cls.objects.create(
+                    scope=scope,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=cls.get_expires_at(),
+                ), True
+        except IntegrityError:
+            pass
+
+        idempotency_key = cls.objects.select_for_update().get(scope=scope, key=key)
+        if idempotency_key.expires_at > timezone.now():
+            return idempotency_key, False
+        idempotency_key.update(fingerprint=fingerprint, status=None, data=None, expires_at=cls.get_expires_at())
+        return idempotency_key, True
+
+    def store(self, status: int, data):
+        self.update(status=status, data=data)
+
+    @classmethod
+    def delete_expired(cls):
+        return cls.objects.filter(expires_at__lte=timezone.now()).delete()[0]
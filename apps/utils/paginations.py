@@ -1,7 +1,39 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+from rest_framework.pagination import CursorPagination as BaseCursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class Pagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     page_query_param = 'page'
+    max_page_size = 100
+
+
+class CursorPagination(BaseCursorPagination):
+    """
+    Seek pagination on `id`, every page costs the same index range scan.
+    The total count is only computed when asked for with `?count=true`.
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
@@ -0,0 +1,3 @@
+from .caching import *
+from .instrumentation import *
+from .metrics import *
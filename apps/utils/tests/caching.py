@@ -0,0 +1,90 @@
+import time
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from apps.utils.caching import LocalCache, MISSING, memoize
+
+
+class LocalCacheTestCase(SimpleTestCase):
+    def test_size_bound(self):
+        local = LocalCache(size=2, timeout=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+
+        self.assertEqual(local.get('a'), 1)
+        self.assertIs(local.get('b'), MISSING)
+        self.assertEqual(local.get('c'), 3)
+
+    def test_timeout(self):
+        local = LocalCache(size=2, timeout=0.01)
+        local.set('a', 1)
+        time.sleep(0.02)
+
+        self.assertIs(local.get('a'), MISSING)
+
+    def test_values_are_copies(self):
+        local = LocalCache(size=2, timeout=60)
+        local.set('a', {'balance': 1})
+        local.get('a')['balance'] = 2
+
+        self.assertEqual(local.get('a'), {'balance': 1})
+
+
+class MemoizeTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+        @memoize('test-memoize', versioned=True)
+        def lookup(id, default=None):
+            self.calls.append(id)
+            return default if id == 0 else {'id': id}
+        self.lookup = lookup
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_keys_by_arguments(self):
+        self.assertEqual(self.lookup(1), {'id': 1})
+        self.assertEqual(self.lookup(2), {'id': 2})
+        self.assertEqual(self.lookup(1), {'id': 1})
+
+        self.assertEqual(self.calls, [1, 2])
+        stats = self.lookup.stats.get()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['local_hits'], 1)
+
+    def test_shared_tier(self):
+        self.lookup(1)
+        self.lookup.local.clear()
+
+        self.assertEqual(self.lookup(1), {'id': 1})
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.lookup.stats.get()['shared_hits'], 1)
+
+    def test_none_is_cached(self):
+        self.assertIsNone(self.lookup(0))
+        self.lookup.local.clear()
+        self.assertIsNone(self.lookup(0))
+
+        self.assertEqual(self.calls, [0])
+
+    def test_invalidate(self):
+        self.lookup(1)
+        self.lookup(2)
+        self.lookup.invalidate(1)
+        self.lookup(1)
+        self.lookup(2)
+
+        self.assertEqual(self.calls, [1, 2, 1])
+
+    def test_invalidate_all(self):
+        self.lookup(1)
+        self.lookup(2)
+        self.lookup.invalidate_all()
+        self.lookup(1)
+        self.lookup(2)
+
+        self.assertEqual(self.calls, [1, 2, 1, 2])
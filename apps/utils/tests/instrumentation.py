@@ -0,0 +1,126 @@
+import json
+import threading
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.ledgers.models import Ledger
+from apps.ledgers.tests.factories import create_ledger
+from apps.modules.instamoney import RNE, Instamoney
+from apps.modules.stub import StubServer
+from apps.utils.caching import memoize
+from apps.utils.instrumentation import QueryBudgetExceeded, RequestMetrics, instrument
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ledger = create_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.ledger.user)
+        self.url = f'/api/v1/ledgers/{self.ledger.id}/'
+
+    def test_instrument_queries(self):
+        with instrument() as metrics:
+            list(Ledger.objects.all())
+            list(Ledger.objects.filter(id=self.ledger.id))
+
+        self.assertEqual(metrics.queries, 2)
+        self.assertGreater(metrics.sql_time, 0)
+        self.assertTrue(metrics.slowest_sql.startswith('SELECT'))
+
+    def test_instrument_cache(self):
+        @memoize('instrumented', key=str)
+        def get_value(value):
+            return value
+
+        with instrument() as metrics:
+            get_value(1)
+            get_value(1)
+
+        self.assertEqual(metrics.cache_misses, 1)
+        self.assertEqual(metrics.cache_hits, 1)
+
+    @override_settings(TESTING=False)
+    def test_instrument_http(self):
+        server = StubServer().start()
+        rne = RNE()
+        rne.BASE_URL = server.url
+        try:
+            with instrument() as metrics:
+                rne.request('list_banks', 'GET', '/available_virtual_account_banks')
+        finally:
+            Instamoney.close_session()
+            server.stop()
+
+        self.assertEqual(metrics.http_calls, 1)
+        self.assertGreater(metrics.http_time, 0)
+
+    def test_server_timing_header(self):
+        with self.assertLogs('apps.utils.instrumentation', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'apps.ledgers.api.v1:ledger-detail')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertIn(f'desc="{line["queries"]} queries"', response.headers['Server-Timing'])
+
+    async def test_server_timing_header_of_async_view(self):
+        token = AccessToken.for_user(self.ledger.user)
+        response = await self.async_client.get('/api/v1/ledgers/', headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.headers['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_streamed_queries_are_counted(self):
+        self.ledger.create_credit_transaction(amount=10000)
+        url = f'/api/v1/ledgers/{self.ledger.id}/transactions/export/'
+
+        with self.assertLogs('apps.utils.instrumentation', 'INFO') as logs:
+            response = self.client.get(url)
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'apps.ledgers.api.v1:transaction-export')
+        header_queries = int(response.headers['Server-Timing'].split('desc="')[1].split(' ')[0])
+        self.assertGreater(line['queries'], header_queries)
+
+    @override_settings(QUERY_BUDGETS={'apps.ledgers.api.v1:transaction-export': 3})
+    def test_query_budget_of_streamed_response(self):
+        response = self.client.get(f'/api/v1/ledgers/{self.ledger.id}/transactions/export/')
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'over its budget of 3'):
+            b''.join(response.streaming_content)
+
+    def test_metrics_from_threads(self):
+        metrics = RequestMetrics()
+
+        def record():
+            for _ in range(10000):
+                metrics.record_query('SELECT 1', 0.001)
+                metrics.record_cache(hit=True)
+                metrics.record_http(0.001)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((metrics.queries, metrics.cache_hits, metrics.http_calls), (80000, 80000, 80000))
+
+    @override_settings(QUERY_BUDGETS={'apps.ledgers.api.v1:ledger-detail': 0})
+    def test_query_budget(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'over its budget of 0'):
+            self.client.get(self.url)
+
+    @override_settings(QUERY_BUDGETS={'apps.ledgers.api.v1:ledger-detail': 0}, QUERY_BUDGETS_STRICT=False)
+    def test_query_budget_logged(self):
+        with self.assertLogs('apps.utils.instrumentation', 'WARNING'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,184 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.ledgers.tests.factories import create_ledger
+from apps.utils.caching import memoize
+from apps.utils.metrics import CONTENT_TYPE, Registry, registry
+
+# no process has this id
+DEAD_PID = 2 ** 30
+
+
+class RegistryTestCase(TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render_method(self):
+        counter = self.registry.counter('requests_total', 'Requests', ('method',))
+        gauge = self.registry.gauge('workers', 'Workers')
+        counter.inc(method='GET')
+        counter.inc(2, method='POST')
+        gauge.set(4)
+
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{method="GET"} 1.0',
+            'requests_total{method="POST"} 2.0',
+            '# HELP workers Workers',
+            '# TYPE workers gauge',
+            'workers 4.0',
+        ]) + '\n')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+
+        lines = self.registry.render().splitlines()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1.0', lines)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3.0', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4.0', lines)
+        self.assertIn('latency_seconds_sum 6.05', lines)
+        self.assertIn('latency_seconds_count 4.0', lines)
+
+    def test_labels_are_checked(self):
+        counter = self.registry.counter('requests_total', 'Requests', ('method',))
+
+        with self.assertRaises(ValueError):
+            counter.inc(status='200')
+        with self.assertRaises(ValueError):
+            self.registry.gauge('requests_total', 'Requests', ('method',))
+        self.assertIs(self.registry.counter('requests_total', 'Requests', ('method',)), counter)
+
+    def test_derive_method(self):
+        counter = self.registry.counter('lookups_total', 'Lookups', ('outcome',))
+        counter.inc(3, outcome='hit')
+        counter.inc(outcome='miss')
+        self.registry.derive('hit_ratio', 'Hit ratio', (), lambda values: {
+            (): values[('lookups_total', ('hit',))] / 4,
+        })
+
+        self.assertIn('hit_ratio 0.75', self.registry.render().splitlines())
+
+    def test_processes_are_added_up(self):
+        counter = self.registry.counter('requests_total', 'Requests', ('method',))
+        gauge = self.registry.gauge('workers', 'Workers')
+        histogram = self.registry.histogram('latency_seconds', 'Latency', buckets=(1,))
+        counter.inc(method='GET')
+        gauge.set(1)
+        histogram.observe(0.5)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.registry.flush()
+            dump = self.registry.dump()
+            for pid in (os.getppid(), DEAD_PID):
+                other_dump = json.loads(json.dumps(dict(dump, pid=pid)))
+                Path(directory, f'metrics-{pid}-0.json').write_text(json.dumps(other_dump))
+
+            lines = self.registry.render().splitlines()
+            files = sorted(path.name for path in Path(directory).glob('metrics-*.json'))
+            rendered_again = self.registry.render().splitlines()
+
+        # counters and histograms of exited processes still count, their gauges don't
+        self.assertIn('requests_total{method="GET"} 3.0', lines)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3.0', lines)
+        self.assertIn('latency_seconds_count 3.0', lines)
+        self.assertIn('workers 2.0', lines)
+        # the file of the exited process is folded into the archive, once
+        self.assertNotIn(f'metrics-{DEAD_PID}-0.json', files)
+        self.assertIn('metrics-archive.json', files)
+        self.assertEqual(rendered_again, lines)
+
+    def test_concurrent_flushes(self):
+        counter = self.registry.counter('requests_total', 'Requests')
+        errors = []
+
+        def flush():
+            try:
+                for _ in range(50):
+                    counter.inc()
+                    self.registry.flush()
+            except Exception as error:
+                errors.append(error)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            threads = [threading.Thread(target=flush) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            files = [path.name for path in Path(directory).iterdir()]
+            path = self.registry.get_path()
+            dump = json.loads(path.read_text())
+
+        self.assertEqual(errors, [])
+        self.assertEqual(files, [path.name])
+        self.assertEqual(dump['values'], [['requests_total', [], 400]])
+
+    def test_failed_flush_is_logged(self):
+        counter = self.registry.counter('requests_total', 'Requests')
+
+        with tempfile.NamedTemporaryFile() as file, override_settings(METRICS_DIR=file.name, METRICS_FLUSH_INTERVAL=0):
+            with self.assertLogs('apps.utils.metrics', 'ERROR'):
+                counter.inc()
+
+        self.assertIn('requests_total 1.0', self.registry.render().splitlines())
+
+
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_metrics_endpoint(self):
+        ledger = create_ledger()
+        ledger.create_credit_transaction(amount=20000)
+        with self.assertRaises(Exception):
+            ledger.create_debit_transaction(amount=50000)
+        ledger.send_to(create_ledger(), 5000)
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        self.assertIn('ledger_postings_total{type="credit",result="posted"} 1.0', lines)
+        self.assertIn('ledger_postings_total{type="debit",result="insufficient_balance"} 1.0', lines)
+        self.assertIn('ledger_posting_seconds_count{type="credit"} 1.0', lines)
+        self.assertIn('ledger_transfers_total{result="posted"} 1.0', lines)
+        self.assertIn('ledger_transfer_seconds_count 1.0', lines)
+
+    def test_metrics_endpoint_only_answers_allowed_addresses(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_the_token_once_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_hit_ratio(self):
+        @memoize('metered', key=str)
+        def get_value(value):
+            return value
+
+        get_value(1)
+        get_value(1)
+        get_value(1)
+        get_value(2)
+
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('cache_lookups_total{cache="metered",outcome="local_hits"} 2.0', lines)
+        self.assertIn('cache_lookups_total{cache="metered",outcome="misses"} 2.0', lines)
+        self.assertIn('cache_hit_ratio{cache="metered"} 0.5', lines)
@@ -49,9 +49,11 @@ INSTALLED_APPS = [
 
     'apps.users',
     'apps.ledgers',
+    'apps.utils',
 ]
 
 MIDDLEWARE = [
+    'apps.utils.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +98,13 @@ DATABASES = {
         'ATOMIC_REQUESTS': True,
     }
 }
+# transaction ids are reserved on a connection of their own, outside of the request transaction.
+# SQLite allows a single writer, the allocator keeps to the default connection there
+DATABASES['transaction_ids'] = {
+    **DATABASES['default'],
+    'ATOMIC_REQUESTS': False,
+    'TEST': {'MIRROR': 'default'},
+}
 
 
 # Password validation
@@ -148,7 +157,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'apps.utils.paginations.Pagination',
 }
@@ -160,3 +169,55 @@ SIMPLE_JWT = {
 
 INSTAMONEY_SECRET_KEY = ENV.str('INSTAMONEY_SECRET_KEY', default='')
 INSTAMONEY_WEBHOOK_VERIFICATION_TOKEN = ENV.str('INSTAMONEY_WEBHOOK_VERIFICATION_TOKEN', default='')
+INSTAMONEY_BASE_URL = ENV.str('INSTAMONEY_BASE_URL', default='https://api.instamoney.co')
+INSTAMONEY_CONNECT_TIMEOUT = ENV.float('INSTAMONEY_CONNECT_TIMEOUT', default=3.05)
+INSTAMONEY_READ_TIMEOUT = ENV.float('INSTAMONEY_READ_TIMEOUT', default=10)
+INSTAMONEY_POOL_SIZE = ENV.int('INSTAMONEY_POOL_SIZE', default=10)
+INSTAMONEY_ASYNC_POOL_SIZE = ENV.int('INSTAMONEY_ASYNC_POOL_SIZE', default=200)
+INSTAMONEY_MAX_RETRIES = ENV.int('INSTAMONEY_MAX_RETRIES', default=2)
+INSTAMONEY_RETRY_BACKOFF = ENV.float('INSTAMONEY_RETRY_BACKOFF', default=0.5)
+INSTAMONEY_BANKS_REFRESH_INTERVAL = ENV.int('INSTAMONEY_BANKS_REFRESH_INTERVAL', default=60 * 60)
+INSTAMONEY_BANKS_TIMEOUT = ENV.int('INSTAMONEY_BANKS_TIMEOUT', default=60 * 60 * 24 * 7)
+
+# tests reserve on the default connection, the transaction of a test case hides its rows
+# from any other connection
+TRANSACTION_ID_DATABASE = ENV.str('TRANSACTION_ID_DATABASE', default='default' if TESTING else 'transaction_ids')
+LEDGER_BULK_TRANSACTION_MAX_ITEMS = ENV.int('LEDGER_BULK_TRANSACTION_MAX_ITEMS', default=5000)
+
+IDEMPOTENCY_KEY_TIMEOUT = ENV.int('IDEMPOTENCY_KEY_TIMEOUT', default=60 * 60 * 24)
+
+CALLBACK_EVENT_MAX_ATTEMPTS = ENV.int('CALLBACK_EVENT_MAX_ATTEMPTS', default=5)
+# seconds before the first retry of a failed callback, doubled on every further attempt
+CALLBACK_EVENT_RETRY_BACKOFF = ENV.int('CALLBACK_EVENT_RETRY_BACKOFF', default=30)
+
+VIRTUAL_ACCOUNT_CONCURRENCY = ENV.int('VIRTUAL_ACCOUNT_CONCURRENCY', default=20)
+VIRTUAL_ACCOUNT_MAX_ATTEMPTS = ENV.int('VIRTUAL_ACCOUNT_MAX_ATTEMPTS', default=5)
+VIRTUAL_ACCOUNT_CLAIM_TIMEOUT = ENV.int('VIRTUAL_ACCOUNT_CLAIM_TIMEOUT', default=60 * 5)
+LEDGER_BULK_CREATE_MAX_ITEMS = ENV.int('LEDGER_BULK_CREATE_MAX_ITEMS', default=5000)
+
+MEMOIZE_TIMEOUT = ENV.int('MEMOIZE_TIMEOUT', default=60 * 5)
+MEMOIZE_LOCAL_TIMEOUT = ENV.float('MEMOIZE_LOCAL_TIMEOUT', default=5)
+MEMOIZE_LOCAL_SIZE = ENV.int('MEMOIZE_LOCAL_SIZE', default=1024)
+
+AUTH_TOKEN_CACHE_SIZE = ENV.int('AUTH_TOKEN_CACHE_SIZE', default=10000)
+
+# most queries a request to each view may make, view names as in `reverse`
+QUERY_BUDGETS = {
+    'apps.ledgers.api.v1:ledger-list': 10,
+    'apps.ledgers.api.v1:ledger-detail': 4,
+    'apps.ledgers.api.v1:ledger-send-to': 14,
+    'apps.ledgers.api.v1:ledger-payouts': 14,
+    'apps.ledgers.api.v1:transaction-list': 18,
+    'apps.ledgers.api.v1:transaction-detail': 4,
+    'apps.ledgers.api.v1:callback-fixed-virtual-account-created': 4,
+    'apps.ledgers.api.v1:callback-fixed-virtual-account-payment': 4,
+}
+QUERY_BUDGETS_STRICT = ENV.bool('QUERY_BUDGETS_STRICT', default=TESTING)
+
+# with a directory, every worker process writes its metrics there so /metrics adds them up
+METRICS_DIR = ENV.str('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = ENV.float('METRICS_FLUSH_INTERVAL', default=1)
+# /metrics answers these addresses only, and with the token as a bearer token once it is set.
+# a local reverse proxy makes every request come from 127.0.0.1, set the token there
+METRICS_ALLOWED_IPS = ENV.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+METRICS_TOKEN = ENV.str('METRICS_TOKEN', default='')